@@ -0,0 +1,118 @@
+"""
+Query latency of the vector backends on a synthetic schema
+
+Loads the same columns (random embeddings, so no embedding model or translator is involved)
+into the in-process numpy store and, if a Chroma server is reachable, into a Chroma collection,
+then runs the column query of MATCH_DDL (filter on project_id and table) against both.
+
+    python benchmarks/vector_store_benchmark.py --columns 50000 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectors.embedding import HashingEmbeddingProvider
+from vectors.vector_numpy import NumpyVectorStore
+
+def build_schema(column_count: int, columns_per_table: int, dimension: int, seed: int):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((column_count, dimension), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    documents, metadatas, doc_ids = [], [], []
+    for i in range(column_count):
+        table = f"table_{i // columns_per_table}"
+        column = f"column_{i % columns_per_table}"
+        documents.append(f"Table: {table}\nColumn: {column}\nDescription: {column}")
+        metadatas.append({
+            "project_id": 1 + i % 2,
+            "table": table,
+            "column": column,
+            "data_type": "varchar",
+            "version": 1
+        })
+        doc_ids.append(str(i))
+    return embeddings, documents, metadatas, doc_ids
+
+def build_queries(args, rng):
+    table_count = args.columns // args.columns_per_table
+    queries = []
+    for _ in range(args.queries):
+        embeddings = rng.standard_normal((args.batch, args.dimension), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        tables = [f"table_{t}" for t in rng.choice(table_count, size=args.tables, replace=False)]
+        where = {"$and": [{"table": {"$in": tables}}, {"project_id": 1}]}
+        queries.append((embeddings.tolist(), where))
+    return queries
+
+def run_queries(name: str, query, queries, n_results: int):
+    latencies = []
+    for embeddings, where in queries:
+        start_time = time.perf_counter()
+        query(embeddings, n_results, where)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    latencies = np.array(latencies)
+    print(f"{name}: p50 {np.percentile(latencies, 50):.2f}ms, p95 {np.percentile(latencies, 95):.2f}ms, "
+          f"p99 {np.percentile(latencies, 99):.2f}ms, mean {latencies.mean():.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--columns', type=int, default=50000)
+    parser.add_argument('--columns-per-table', type=int, default=25)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=5, help="query embeddings per request (related columns of a task)")
+    parser.add_argument('--tables', type=int, default=5, help="tables in the $in filter (matched tables of a task)")
+    parser.add_argument('--n-results', type=int, default=5)
+    parser.add_argument('--chroma-host', default=os.getenv("CHROMA_HOST", "localhost"))
+    parser.add_argument('--chroma-port', type=int, default=int(os.getenv("CHROMA_PORT", "8000")))
+    parser.add_argument('--skip-chroma', action='store_true')
+    args = parser.parse_args()
+
+    embeddings, documents, metadatas, doc_ids = build_schema(args.columns, args.columns_per_table, args.dimension, seed=0)
+    queries = build_queries(args, np.random.default_rng(1))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        start_time = time.perf_counter()
+        numpy_store = NumpyVectorStore("benchmark_column_def", data_dir, embedding_provider=HashingEmbeddingProvider(args.dimension))
+        numpy_store.add_embeddings(embeddings, documents, metadatas, doc_ids)
+        print(f"numpy: loaded {args.columns} columns in {time.perf_counter() - start_time:.2f}s")
+        run_queries("numpy", numpy_store.query_embeddings, queries, args.n_results)
+
+    if args.skip_chroma:
+        return
+    try:
+        import chromadb
+        client = chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port)
+        client.heartbeat()
+    except Exception as e:
+        print(f"chroma: skipped, server not reachable at {args.chroma_host}:{args.chroma_port} ({e})")
+        return
+    collection_name = "benchmark_column_def"
+    try:
+        client.delete_collection(collection_name)
+    except Exception:
+        pass
+    collection = client.create_collection(collection_name)
+    try:
+        start_time = time.perf_counter()
+        batch_size = client.get_max_batch_size()
+        for start in range(0, args.columns, batch_size):
+            end = start + batch_size
+            collection.upsert(ids=doc_ids[start:end], embeddings=embeddings[start:end].tolist(),
+                              documents=documents[start:end], metadatas=metadatas[start:end])
+        print(f"chroma: loaded {args.columns} columns in {time.perf_counter() - start_time:.2f}s")
+        run_queries(
+            "chroma",
+            lambda query_embeddings, n_results, where: collection.query(
+                query_embeddings=query_embeddings, n_results=n_results, where=where),
+            queries, args.n_results)
+    finally:
+        client.delete_collection(collection_name)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 import importlib
 import pkgutil
 import os
@@ -39,6 +40,50 @@ def init_db(app):
     # Create all tables
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+
+def upgrade_schema():
+    """
+    Add the model columns and indexes missing from existing tables
+
+    create_all only creates missing tables, so columns added to a model later are added here.
+    A NOT NULL column needs a scalar default, it fills the existing rows. Safe to run at every
+    startup and from several processes at once.
+    """
+    engine = db.engine
+    dialect = engine.dialect
+    preparer = dialect.identifier_preparer
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect)}"
+            literal = column.type.literal_processor(dialect)
+            if column.default is not None and column.default.is_scalar and literal is not None:
+                ddl += f" DEFAULT {literal(column.default.arg)}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(ddl))
+                print(f"Added column {table.name}.{column.name}")
+            except Exception as e:
+                # Another process may have added it meanwhile
+                print(f"Failed to add column {table.name}.{column.name}: {str(e)}")
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                with engine.begin() as connection:
+                    index.create(connection, checkfirst=True)
+                print(f"Added index {index.name}")
+            except Exception as e:
+                print(f"Failed to add index {index.name}: {str(e)}")
 
 # def get_db():
 #     """Get database session"""
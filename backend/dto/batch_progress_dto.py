@@ -0,0 +1,16 @@
+from marshmallow_dataclass import dataclass
+
+@dataclass
+class BatchProgressDTO:
+    batch_id: str
+    task_count: int
+    # Tasks without pending or running jobs
+    finished_task_count: int
+    # Tasks with generated SQL
+    sql_task_count: int
+    
+    init_job_count: int
+    running_job_count: int
+    success_job_count: int
+    fail_job_count: int
+    canceled_job_count: int
@@ -15,4 +15,5 @@ class JobDTO:
     error_message: str
     created_at: datetime
     updated_at: datetime
-    job_cost_time: int
\ No newline at end of file
+    job_cost_time: int
+    priority: int
\ No newline at end of file
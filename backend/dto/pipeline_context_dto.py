@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+
+@dataclass
+class PipelineContextDTO:
+    """Intermediate results passed in memory between the stages of a fused pipeline"""
+    task_id: int
+    project_id: int
+    question: str
+    question_supplement: str
+    options: dict
+    # Set by MATCH_DOC: contents of the matched documents
+    doc_contents: list[str] | None = None
+    # Set by MATCH_SQL_LOG: (question, sql) of the matched SQL logs
+    sql_logs: list[tuple[str, str]] | None = None
+    # Set by GEN_RELATED_COLUMNS: AI generated related tables and columns
+    related_columns: dict | None = None
+    # Set by MATCH_DDL: table name -> matched column names
+    selected_columns: dict[str, set[str]] | None = None
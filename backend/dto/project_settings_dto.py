@@ -1,4 +1,5 @@
 from marshmallow_dataclass import dataclass
+from typing import Optional
 
 @dataclass
 class ProjectSettingsDTO:
@@ -11,6 +12,10 @@ class ProjectSettingsDTO:
     vector_waiting_column_count: int
     vector_waiting_doc_count: int
     vector_waiting_task_count: int
+    # Recent vector build rate, unit: docs/s
+    vector_build_rate: float
+    # Seconds until all waiting rows are searchable, None until the rate has been measured
+    vector_build_eta: Optional[int]
 
     definition_doc_count: int
     definition_rule_count: int
@@ -9,6 +9,12 @@ class JobType(BaseEnum):
     GENERATE_SQL = ('generate_sql', 'Generate SQL')
     LEARN_FROM_SQL = ('learn_from_sql', 'Learn')
 
+class JobPriority(BaseEnum):
+    """Job priority enumeration, higher runs first"""
+    INTERACTIVE = (2, 'Interactive')    # Started by a user waiting for the result
+    NORMAL = (1, 'Normal')
+    BULK = (0, 'Bulk')    # Batches and background learning
+
 class JobStatus(BaseEnum):
     """Job status enumeration"""
     INIT = ('init', 'Initial')    # Initial state
@@ -12,8 +12,9 @@ bind = "0.0.0.0:8000"
 # Number of worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
 
-# Worker mode
-worker_class = "sync"
+# Worker mode, set GUNICORN_WORKER_CLASS=gthread so long-lived event streams (SSE) hold a thread instead of a whole worker process
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "32" if worker_class == "gthread" else "1"))
 
 # Maximum number of concurrent clients
 worker_connections = 2000
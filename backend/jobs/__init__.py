@@ -3,7 +3,7 @@ import os
 
 scheduler = APScheduler()
 
-def init_scheduler(app):
+def init_scheduler(app, vector_jobs=True):
     # Apply scheduler configuration
     app.config['SCHEDULER_API_ENABLED'] = True
     app.config['SCHEDULER_TIMEZONE'] = "Asia/Shanghai"
@@ -12,7 +12,10 @@ def init_scheduler(app):
     
     # Import jobs module to register tasks
     from . import job_job
-    from . import job_vector_db
+    job_job.start_dispatcher()
+    # Vector index jobs only need to run in one process
+    if vector_jobs:
+        from . import job_vector_db
     
     scheduler.start()
     app.logger.info("Scheduler started successfully")
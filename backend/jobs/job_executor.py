@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from enums import JobType
+import threading
+
+# Default limits per concurrency class (the job type unless the stage declares one), can be overridden with JOB_TYPE_LIMITS
+DEFAULT_JOB_TYPE_LIMITS = {
+    JobType.MATCH_DOC.value: 32,
+    JobType.MATCH_SQL_LOG.value: 32,
+    JobType.GEN_RELATED_COLUMNS.value: 8,
+    JobType.MATCH_DDL.value: 16,
+    JobType.GENERATE_SQL.value: 8,
+    JobType.LEARN_FROM_SQL.value: 4,
+}
+
+def parse_job_type_limits(value: str | None, job_classes: set[str] = None) -> dict[str, int]:
+    """
+    Parse concurrency limits like 'generate_sql=8,match_doc=32' on top of the defaults
+
+    Args:
+        job_classes: Known concurrency classes, defaults to the job types
+    """
+    if job_classes is None:
+        job_classes = set(JobType.values())
+    limits = dict(DEFAULT_JOB_TYPE_LIMITS)
+    if not value:
+        return limits
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        job_class, _, limit = item.partition('=')
+        job_class = job_class.strip().lower()
+        if job_class not in job_classes:
+            raise ValueError(f"Unknown concurrency class in job type limits: {job_class}")
+        limits[job_class] = int(limit)
+    return limits
+
+class JobExecutor:
+    """Run jobs concurrently with a global limit and a limit per concurrency class"""
+    def __init__(self, max_workers: int, type_limits: dict[str, int]):
+        self.max_workers = max_workers
+        self.type_limits = type_limits
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        # job_id -> concurrency class of jobs accepted and not finished yet
+        self._running: dict[int, str] = {}
+        self._running_by_class: dict[str, int] = {}
+
+    def _class_limit(self, job_class: str) -> int:
+        return self.type_limits.get(job_class, self.max_workers)
+
+    def available_slots(self) -> int:
+        """Number of jobs that can still be accepted"""
+        with self._lock:
+            return self.max_workers - len(self._running)
+
+    def capacity(self, job_classes: set[str]) -> dict[str, int]:
+        """Number of jobs that can still be accepted per concurrency class"""
+        with self._lock:
+            free = self.max_workers - len(self._running)
+            if free <= 0:
+                return {}
+            capacity = {}
+            for job_class in job_classes:
+                class_free = min(free, self._class_limit(job_class) - self._running_by_class.get(job_class, 0))
+                if class_free > 0:
+                    capacity[job_class] = class_free
+            return capacity
+
+    def running_job_ids(self) -> list[int]:
+        """IDs of accepted jobs that are not finished yet"""
+        with self._lock:
+            return list(self._running.keys())
+
+    def submit(self, job_id: int, job_class: str, fn: Callable[[int], None]) -> bool:
+        """
+        Run fn(job_id) in the pool if there is capacity left
+
+        Returns:
+            bool: False if the job was not accepted (already running or no capacity)
+        """
+        with self._lock:
+            if job_id in self._running:
+                return False
+            if len(self._running) >= self.max_workers:
+                return False
+            if self._running_by_class.get(job_class, 0) >= self._class_limit(job_class):
+                return False
+            self._running[job_id] = job_class
+            self._running_by_class[job_class] = self._running_by_class.get(job_class, 0) + 1
+        self._pool.submit(self._run, job_id, fn)
+        return True
+
+    def switch_class(self, job_id: int, job_class: str) -> bool:
+        """
+        Move a running job to another concurrency class if that class has capacity left
+
+        A job that goes on with the next stage in-process (fused pipeline) takes a slot of the
+        stage's class, like a newly submitted job of that stage would.
+
+        Returns:
+            bool: False if the class has no capacity left, the job keeps its class
+        """
+        with self._lock:
+            current_class = self._running[job_id]
+            if job_class == current_class:
+                return True
+            if self._running_by_class.get(job_class, 0) >= self._class_limit(job_class):
+                return False
+            self._running_by_class[current_class] -= 1
+            self._running_by_class[job_class] = self._running_by_class.get(job_class, 0) + 1
+            self._running[job_id] = job_class
+            return True
+
+    def _run(self, job_id: int, fn: Callable[[int], None]):
+        try:
+            fn(job_id)
+        except Exception as e:
+            print(f"job {job_id} crashed: {str(e)}")
+        finally:
+            with self._lock:
+                job_class = self._running.pop(job_id)
+                self._running_by_class[job_class] -= 1
@@ -1,87 +1,218 @@
 from . import scheduler
-from services.task_service import TaskService
+from .job_executor import JobExecutor, parse_job_type_limits
+from .job_pipeline import pipeline
 from services.job_service import JobService
-from enums import JobType, JobStatus
-import asyncio
-import time
+from services.job_notify_service import job_notify_service
+from enums import JobStatus
+import os
+import socket
+import threading
+import uuid
 from models.job import Job
 from models.task import Task
-from database import db
 from app import app
-from database import session_scope
+from database import session_scope, db, DB_ENGINE_OPTIONS
+from dto.pipeline_context_dto import PipelineContextDTO
+from utils.event_loop import run_async
+from utils.memory_util import get_rss_bytes, get_peak_rss_bytes
+from vectors.embedding import get_embedding_provider
 
-# Define scheduled task
-@scheduler.task('interval', id='job', seconds=2, coalesce=True, max_instances=1)
-def job():
+# Database connections left to the dispatcher, the lease renewal and the scheduled jobs of the process
+RESERVED_DB_CONNECTIONS = 4
+# Each running job holds a connection, by default the jobs never wait for the pool
+default_max_workers = max(DB_ENGINE_OPTIONS['pool_size'] + DB_ENGINE_OPTIONS['max_overflow'] - RESERVED_DB_CONNECTIONS, 1)
+
+# Jobs run concurrently, limited globally and per concurrency class of their stage
+job_classes = pipeline.concurrency_classes()
+executor = JobExecutor(
+    max_workers=int(os.getenv('JOB_MAX_WORKERS', str(default_max_workers))),
+    type_limits=parse_job_type_limits(os.getenv('JOB_TYPE_LIMITS'), set(job_classes.values()))
+)
+
+# Identifies this worker in the claims on the job table
+worker_id = os.getenv('JOB_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+# Claimed jobs can be reclaimed by other workers once the lease expires without being renewed
+lease_seconds = int(os.getenv('JOB_LEASE_SECONDS', '60'))
+# A job whose lease expires this many times (its worker crashed or hung on it) fails instead of being reclaimed
+max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Claims of the last this many seconds count as served when sharing the workers between projects and priorities
+fair_share_window = int(os.getenv('JOB_FAIR_SHARE_WINDOW', '300'))
+# Fallback poll interval, workers are normally woken by job notifications
+poll_interval = os.getenv('JOB_POLL_INTERVAL')
+# Run the auto-chain of tasks in-process by default, tasks can override it with the fusedPipeline option
+fused_pipeline_default = os.getenv('JOB_FUSED_PIPELINE', 'false').lower() == 'true'
+# Interval of the worker memory report in seconds
+memory_report_interval = int(os.getenv('JOB_MEMORY_REPORT_INTERVAL', '60'))
+
+class WorkerStats:
+    """Counters for the worker memory gauge"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.finished_jobs = 0
+        # Largest identity map seen at the end of a job
+        self.max_identity_map_size = 0
+
+    def record_job(self, identity_map_size: int):
+        with self._lock:
+            self.finished_jobs += 1
+            self.max_identity_map_size = max(self.max_identity_map_size, identity_map_size)
+
+worker_stats = WorkerStats()
+
+def is_job_owned(job: Job) -> bool:
+    """Whether the job is still running under this worker's claim"""
+    return job.job_status == JobStatus.RUNNING.value and job.worker_id == worker_id
+
+def run_job(job_id: int):
+    """Run a single job in its own app context, so it gets its own database session"""
+    try:
+        execute_job(job_id)
+    finally:
+        # A slot is free again, pick up jobs that were waiting for capacity
+        job_notify_service.wake()
+
+def execute_job(job_id: int):
+    # Each job gets a short-lived session, nothing loaded by a job outlives it
+    with app.app_context():
+        with session_scope() as session:
+            try:
+                # Runs on the long-lived loop of the executor thread, async clients keep their connections between jobs
+                run_async(run_pipeline(session, job_id))
+            finally:
+                worker_stats.record_job(len(session.identity_map))
+                session.expunge_all()
+
+# Serializes the chaining decision of jobs finishing at the same time in this process
+chain_lock = threading.Lock()
+
+async def run_pipeline(session, job_id: int):
+    """
+    Run a claimed job and chain the next job of the task
+
+    In fused mode (task option fusedPipeline) the whole auto-chain runs in this coroutine:
+    the next job is created already claimed by this worker and run right away, passing
+    intermediate results in memory. Each stage still gets its own job row for visibility.
+    A chained stage takes a slot of its concurrency class, when the class is full the job
+    is queued instead and the stages read their inputs from the database.
+    A stage with several dependencies is chained by whichever dependency finishes last.
+    """
+    # The executor accounts the whole chain under the job it accepted
+    executor_job_id = job_id
+    context = None
+    while job_id is not None:
+        # The job has been claimed (set to RUNNING) for this worker
+        job = session.query(Job).get(job_id)
+        if not is_job_owned(job):
+            print(f"job {job_id} is not claimed by this worker, skip")
+            return
+        job_type = job.job_type
+        task_id = job.task_id
+        # Chained jobs keep the priority of the task's run
+        priority = job.priority
+        if context is None:
+            task = session.query(Task).get(task_id)
+            if task.options.get('fusedPipeline', fused_pipeline_default):
+                context = PipelineContextDTO(task_id=task.id,
+                                             project_id=task.project_id,
+                                             question=task.question,
+                                             question_supplement=task.question_supplement,
+                                             options=task.options)
+        try:
+            job_cost_time, result = await pipeline.run_stage(session, job_type, job_id, context)
+        except Exception as e:
+            # Update job status on error
+            session.rollback()
+            if not JobService.finish_job(session, job_id, worker_id, JobStatus.FAIL.value, error_message=str(e)):
+                print(f"job {job_id} is not RUNNING under this worker, skip")
+            session.commit()
+            return
+        # Update job status
+        if not JobService.finish_job(session, job_id, worker_id, JobStatus.SUCCESS.value, job_cost_time, result=result):
+            print(f"job {job_id} is not RUNNING under this worker, skip")
+            return
+        session.commit()
+
+        # Create the jobs of the stages that are ready now
+        with chain_lock:
+            # Lock the task row so workers on other hosts finishing a parallel stage chain only once
+            task = session.query(Task).filter(Task.id == task_id).with_for_update().one()
+            next_job_types = pipeline.ready_stages(session, task, job_type, job_id)
+            job_id = None
+            for next_job_type in next_job_types:
+                if context is not None and job_id is None and executor.switch_class(executor_job_id, job_classes[next_job_type]):
+                    # Continue with the first ready stage in-process, others are queued
+                    job_id = JobService.create_job(session, task_id, next_job_type, priority=priority,
+                                                   worker_id=worker_id, lease_seconds=lease_seconds).id
+                else:
+                    JobService.create_job(session, task_id, next_job_type, priority=priority)
+            session.commit()
+        if context is not None:
+            # The slot of the finished stage's class may be free now
+            job_notify_service.wake()
+        # Stages only share the in-memory context, drop the objects loaded by the finished stage
+        session.expunge_all()
+
+def dispatch_jobs():
+    """Claim jobs until there is no capacity left or no job is waiting"""
     with app.app_context():
         with session_scope() as session:
-            while True:
-                # Query all jobs with initial status
-                job_ids = JobService.get_init_job_ids()
-                if len(job_ids) == 0:
-                    break
-                print(f"jobs count: {len(job_ids)}")
-                for job_id in job_ids:
-                    try:
-                        # Update job status
-                        job = session.query(Job).get(job_id)
-                        if job.job_status != JobStatus.INIT.value:
-                            print(f"job {job_id} status is not INIT, skip")
-                            continue
-                        job_type = job.job_type
-                        job.job_status = JobStatus.RUNNING.value
-                        session.commit()
-                        
-                        # Execute task (time-consuming)
-                        start_time = time.time()
-                        if job_type == JobType.GENERATE_SQL.value:
-                            asyncio.run(TaskService.generate_sql_async(session, job_id))
-                        elif job_type == JobType.GEN_RELATED_COLUMNS.value:
-                            asyncio.run(TaskService.gen_related_columns_async(session, job_id))
-                        elif job_type == JobType.MATCH_DOC.value:
-                            asyncio.run(TaskService.match_doc_async(session, job_id))
-                        elif job_type == JobType.MATCH_SQL_LOG.value:
-                            asyncio.run(TaskService.match_sql_log_async(session, job_id))
-                        elif job_type == JobType.MATCH_DDL.value:
-                            asyncio.run(TaskService.match_ddl_async(session, job_id))
-                        elif job_type == JobType.LEARN_FROM_SQL.value:
-                            asyncio.run(TaskService.learn_from_sql_async(session, job_id))
-                        
-                        end_time = time.time()
-                        job_cost_time = int((end_time - start_time) * 1000)
-                        # Update job status
-                        job = session.query(Job).get(job_id)
-                        if job.job_status != JobStatus.RUNNING.value:
-                            print(f"job {job_id} status is not RUNNING, skip")
-                            continue
-                        job.job_status = JobStatus.SUCCESS.value
-                        job.job_cost_time = job_cost_time
-                        session.commit()
-                        
-                        # Create next job based on task options
-                        task_options = session.query(Task).get(job.task_id).options
-                        if job_type == JobType.MATCH_DOC.value:
-                            if task_options.get('autoMatchSqlLog'):
-                                JobService.create_job(session, job.task_id, JobType.MATCH_SQL_LOG.value)
-                        elif job_type == JobType.MATCH_SQL_LOG.value:
-                            if task_options.get('autoGenRelatedColumns'):
-                                JobService.create_job(session, job.task_id, JobType.GEN_RELATED_COLUMNS.value)
-                        elif job_type == JobType.GEN_RELATED_COLUMNS.value:
-                            if task_options.get('autoMatchDDL'):
-                                JobService.create_job(session, job.task_id, JobType.MATCH_DDL.value)
-                        elif job_type == JobType.MATCH_DDL.value:
-                            if task_options.get('autoGenSql'):
-                                JobService.create_job(session, job.task_id, JobType.GENERATE_SQL.value)
-                        elif job_type == JobType.GENERATE_SQL.value:
-                            pass
-                        elif job_type == JobType.LEARN_FROM_SQL.value:
-                            pass
-                    except Exception as e:
-                        # Update job status on error
-                        job = session.query(Job).get(job_id)
-                        if job.job_status != JobStatus.RUNNING.value:
-                            print(f"job {job_id} status is not RUNNING, skip")
-                            continue
-                        job.job_status = JobStatus.FAIL.value
-                        job.error_message = str(e)
-                        session.commit()
+            failed_count = JobService.fail_abandoned_jobs(session, max_attempts)
+        if failed_count > 0:
+            print(f"jobs failed after {max_attempts} attempts: {failed_count}")
+        while True:
+            # Only claim as many jobs as the executor can accept
+            capacity = executor.capacity(set(job_classes.values()))
+            if len(capacity) == 0:
+                return
+            limit = executor.available_slots()
+            with session_scope() as session:
+                claimed_jobs = JobService.claim_jobs(session, worker_id, capacity, limit, lease_seconds, job_classes,
+                                                     max_attempts, fair_share_window)
+            if len(claimed_jobs) == 0:
+                return
+            print(f"jobs count: {len(claimed_jobs)}")
+            for job_id, job_type in claimed_jobs:
+                if not executor.submit(job_id, job_classes[job_type], run_job):
+                    with session_scope() as session:
+                        JobService.release_job(session, job_id, worker_id)
+            if len(claimed_jobs) < limit:
+                return
+
+def dispatch_loop(interval: float):
+    """Dispatch jobs whenever a job is announced, polling as a fallback"""
+    while True:
+        job_notify_service.wait(interval)
+        try:
+            dispatch_jobs()
+        except Exception as e:
+            print(f"job dispatch error: {str(e)}")
+
+def start_dispatcher():
+    """Start listening for new jobs and dispatching them"""
+    with app.app_context():
+        job_notify_service.start_listener(db.engine)
+    # Without LISTEN/NOTIFY, jobs created by other processes are only found by polling
+    interval = float(poll_interval) if poll_interval else (30 if job_notify_service.listening else 2)
+    # Pick up jobs created before startup
+    job_notify_service.wake()
+    threading.Thread(target=dispatch_loop, args=(interval,), name='job-dispatcher', daemon=True).start()
+
+# Keep the claims of running jobs alive
+@scheduler.task('interval', id='renew_job_leases', seconds=max(lease_seconds // 3, 1), coalesce=True, max_instances=1)
+def renew_job_leases():
+    if len(executor.running_job_ids()) == 0:
+        return
+    with app.app_context():
+        with session_scope() as session:
+            JobService.renew_leases(session, worker_id, lease_seconds)
+
+# Worker memory gauge, steady-state RSS should stay flat under sustained load
+@scheduler.task('interval', id='report_worker_memory', seconds=memory_report_interval, coalesce=True, max_instances=1)
+def report_worker_memory():
+    from vector_stores import retrieval_cache
+    rss = get_rss_bytes() / 1024 / 1024
+    peak_rss = get_peak_rss_bytes() / 1024 / 1024
+    print(f"worker {worker_id} memory: rss={rss:.1f}MB peak_rss={peak_rss:.1f}MB "
+          f"running_jobs={len(executor.running_job_ids())} finished_jobs={worker_stats.finished_jobs} "
+          f"max_identity_map_size={worker_stats.max_identity_map_size} "
+          f"embedding={get_embedding_provider().stats.snapshot()} retrieval_cache={retrieval_cache.stats()}")
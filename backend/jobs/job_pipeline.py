@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from enums import JobType, JobStatus, JobPriority
+from models.task import Task
+from services.task_service import TaskService, GENERATE_SQL_TIMEOUT
+from services.job_service import JobService
+from dto.pipeline_context_dto import PipelineContextDTO
+import asyncio
+import threading
+import time
+
+@dataclass
+class Stage:
+    """A stage of the task pipeline, run as one job"""
+    job_type: str
+    # async handler(session, job_id, context), returns the stage result published with the job event (or None)
+    handler: Callable[..., Awaitable[None]]
+    # Stages whose output this stage needs, it is chained once all of them are finished
+    depends_on: tuple[str, ...] = ()
+    # Task option that enables running this stage automatically, None means always
+    option: str | None = None
+    # Created when the pipeline starts
+    start: bool = False
+    # Stages of the same concurrency class share its concurrency limit, defaults to the job type
+    concurrency_class: str | None = None
+    # Seconds before the stage is failed, None means no timeout (only checked at await points, see run_stage)
+    timeout: float | None = None
+
+    def __post_init__(self):
+        if self.concurrency_class is None:
+            self.concurrency_class = self.job_type
+
+    def is_enabled(self, task_options: dict) -> bool:
+        """Whether the stage runs automatically for a task"""
+        return self.option is None or bool(task_options.get(self.option))
+
+class StageStats:
+    """Latency of stage runs in this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def record(self, job_type: str, cost_time: int, success: bool):
+        with self._lock:
+            stats = self._stats.setdefault(job_type, {'count': 0, 'fail_count': 0, 'total_time': 0, 'max_time': 0})
+            stats['count'] += 1
+            if not success:
+                stats['fail_count'] += 1
+            stats['total_time'] += cost_time
+            stats['max_time'] = max(stats['max_time'], cost_time)
+
+    def snapshot(self) -> dict[str, dict]:
+        """Count, failures, average and max latency (ms) per stage"""
+        with self._lock:
+            return {
+                job_type: {**stats, 'avg_time': stats['total_time'] // stats['count']}
+                for job_type, stats in self._stats.items()
+            }
+
+class Pipeline:
+    """
+    Declarative DAG of the task stages
+
+    Stages declare their dependencies and option gates, the pipeline decides which
+    stages are ready once a stage finishes, so independent stages run in parallel.
+    """
+    def __init__(self):
+        self.stages: dict[str, Stage] = {}
+        self.stats = StageStats()
+
+    def add_stage(self, stage: Stage):
+        for job_type in stage.depends_on:
+            if job_type not in self.stages:
+                raise ValueError(f"Stage {stage.job_type} depends on unknown stage: {job_type}")
+        self.stages[stage.job_type] = stage
+
+    def get_stage(self, job_type: str) -> Stage:
+        stage = self.stages.get(job_type)
+        if stage is None:
+            raise ValueError(f"Unknown stage: {job_type}")
+        return stage
+
+    def concurrency_classes(self) -> dict[str, str]:
+        """Job type -> concurrency class"""
+        return {job_type: stage.concurrency_class for job_type, stage in self.stages.items()}
+
+    def start(self, session, task_id: int, priority: int = JobPriority.NORMAL.value):
+        """Create the jobs of the start stages of a task"""
+        task = session.query(Task).get(task_id)
+        if not task:
+            raise ValueError("Task does not exist")
+        for stage in self.stages.values():
+            if stage.start and stage.is_enabled(task.options):
+                JobService.create_job(session, task_id, stage.job_type, priority=priority)
+
+    def start_tasks(self, session, project_id: int, task_ids: list[int], task_options: dict, priority: int = JobPriority.NORMAL.value):
+        """Create the jobs of the start stages of many new tasks sharing the same options"""
+        for stage in self.stages.values():
+            if stage.start and stage.is_enabled(task_options):
+                JobService.create_jobs(session, project_id, task_ids, stage.job_type, priority)
+
+    def is_ready(self, session, task: Task, stage: Stage, job_id: int) -> bool:
+        """
+        Whether all inputs of a stage exist after job job_id finished
+
+        The latest job of every dependency must have succeeded, a dependency may only have never
+        run if it runs automatically for the task (it was not created yet). No job finishing at the
+        same time may have already chained the stage.
+        """
+        if not stage.is_enabled(task.options):
+            return False
+        for job_type in stage.depends_on:
+            latest_job = JobService.get_latest_job(session, task.id, job_type)
+            if latest_job is None:
+                # A disabled dependency produced no input, e.g. related columns are not generated without matched SQL logs
+                if not self.get_stage(job_type).is_enabled(task.options):
+                    return False
+            elif latest_job.job_status != JobStatus.SUCCESS.value:
+                return False
+        latest_job = JobService.get_latest_job(session, task.id, stage.job_type)
+        return not latest_job or latest_job.id < job_id
+
+    def ready_stages(self, session, task: Task, job_type: str, job_id: int) -> list[str]:
+        """Job types of the stages that can run now that job job_id of job_type finished"""
+        return [
+            stage.job_type for stage in self.stages.values()
+            if job_type in stage.depends_on and self.is_ready(session, task, stage, job_id)
+        ]
+
+    async def run_stage(self, session, job_type: str, job_id: int, context: PipelineContextDTO = None) -> tuple[int, dict | None]:
+        """
+        Run the handler of a stage
+
+        The timeout cancels the handler at its next await point. Blocking calls made by the
+        handler (the SQLAlchemy session, local embedding) are not interrupted: a stage stuck in one
+        fails only once the call returns, and its job keeps its slot meanwhile. They are not moved
+        to threads because the session must stay on the job's thread.
+
+        Returns:
+            tuple[int, dict | None]: Cost time in milliseconds, result of the stage
+        """
+        stage = self.get_stage(job_type)
+        start_time = time.time()
+        success = False
+        try:
+            result = await asyncio.wait_for(stage.handler(session, job_id, context), timeout=stage.timeout)
+            success = True
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Stage {job_type} timed out after {stage.timeout} seconds")
+        finally:
+            cost_time = int((time.time() - start_time) * 1000)
+            self.stats.record(job_type, cost_time, success)
+            print(f"stage {job_type} of job {job_id} {'finished' if success else 'failed'} in {cost_time}ms")
+        return cost_time, result
+
+pipeline = Pipeline()
+# Documents and SQL logs are matched in parallel, related columns are generated once both are finished
+# (not after documents alone: without autoMatchSqlLog the chain stops at MATCH_DOC)
+pipeline.add_stage(Stage(JobType.MATCH_DOC.value, TaskService.match_doc_async,
+                         start=True, timeout=120))
+pipeline.add_stage(Stage(JobType.MATCH_SQL_LOG.value, TaskService.match_sql_log_async,
+                         option='autoMatchSqlLog', start=True, timeout=120))
+pipeline.add_stage(Stage(JobType.GEN_RELATED_COLUMNS.value, TaskService.gen_related_columns_async,
+                         depends_on=(JobType.MATCH_DOC.value, JobType.MATCH_SQL_LOG.value),
+                         option='autoGenRelatedColumns', timeout=300))
+pipeline.add_stage(Stage(JobType.MATCH_DDL.value, TaskService.match_ddl_async,
+                         depends_on=(JobType.GEN_RELATED_COLUMNS.value,),
+                         option='autoMatchDDL', timeout=120))
+pipeline.add_stage(Stage(JobType.GENERATE_SQL.value, TaskService.generate_sql_async,
+                         depends_on=(JobType.MATCH_DDL.value,),
+                         option='autoGenSql', timeout=GENERATE_SQL_TIMEOUT))
+# Only created on demand
+pipeline.add_stage(Stage(JobType.LEARN_FROM_SQL.value, TaskService.learn_from_sql_async,
+                         timeout=300))
@@ -6,57 +6,82 @@ from models.definition_doc import DefinitionDoc
 from models.task import Task
 from services.def_service import DefService
 from services.task_service import TaskService
+from services.vector_build_service import AdaptiveBatchSizer, VectorBuildService
+from services.project_service import ProjectService
 from database import db
 from app import app
+import os
+import time
+
+# Batch sizes of the vector build adapt between these bounds, starting from VECTOR_BUILD_BATCH_SIZE
+vector_build_batch_size = int(os.getenv('VECTOR_BUILD_BATCH_SIZE', '500'))
+vector_build_min_batch_size = int(os.getenv('VECTOR_BUILD_MIN_BATCH_SIZE', '10'))
+vector_build_max_batch_size = int(os.getenv('VECTOR_BUILD_MAX_BATCH_SIZE', '5000'))
+# Batches taking longer than this (seconds) are shrunk, faster full batches grow
+vector_build_target_latency = float(os.getenv('VECTOR_BUILD_TARGET_LATENCY', '2'))
+# A run keeps draining batches for at most this many seconds
+vector_build_time_budget = float(os.getenv('VECTOR_BUILD_TIME_BUDGET', '30'))
+
+# (entity type, name, model with def_waiting, batch function adding the rows to the vector database)
+VECTOR_BUILD_TARGETS = [
+    ('table', 'table definitions', DefinitionTable, DefService.add_tables_vector_db),
+    ('column', 'column definitions', DefinitionColumn, DefService.add_columns_vector_db),
+    ('doc', 'document definitions', DefinitionDoc, DefService.add_docs_vector_db),
+    ('task', 'tasks', Task, TaskService.refresh_tasks_vector_db),
+]
+
+# Batch size controller per entity type, kept across runs
+batch_sizers = {
+    entity: AdaptiveBatchSizer(vector_build_batch_size,
+                               vector_build_min_batch_size,
+                               vector_build_max_batch_size,
+                               vector_build_target_latency)
+    for entity, _, _, _ in VECTOR_BUILD_TARGETS
+}
 
 # Task for adding to vector database
 @scheduler.task('interval', id='add_to_vector_db_job', seconds=1, coalesce=True, max_instances=1)
 def add_to_vector_db_job():
     with app.app_context():
         session = db.session
+        deadline = time.time() + vector_build_time_budget
         
-        table_count = 0
-        column_count = 0
-        doc_count = 0
-        task_count = 0
-        
-        # Query 10 pending table definitions
-        table_definitions = session.query(DefinitionTable).filter_by(def_waiting=True).limit(10).all()
-        for table_definition in table_definitions:
-            DefService.add_or_update_table_vector_db(table_definition)
-            table_definition.def_waiting = False
-            table_count += 1
-        if table_count > 0:
-            print(f"Number of table definitions added to vector database: {table_count}")
-        
-        # Query 10 pending column definitions
-        column_definitions = session.query(DefinitionColumn).filter_by(def_waiting=True).limit(10).all()
-        for column_definition in column_definitions:
-            DefService.add_or_update_column_vector_db(column_definition)
-            column_definition.def_waiting = False
-            column_count += 1
-        if column_count > 0:
-            print(f"Number of column definitions added to vector database: {column_count}")
-        
-        # Query 10 pending document definitions
-        doc_definitions = session.query(DefinitionDoc).filter_by(def_waiting=True).limit(10).all()
-        for doc_definition in doc_definitions:
-            DefService.refresh_doc_vector_db(doc_definition)
-            doc_definition.def_waiting = False
-            doc_count += 1
-        if doc_count > 0:
-            print(f"Number of document definitions added to vector database: {doc_count}")
-        
-        # Query 10 pending tasks
-        tasks = session.query(Task).filter_by(def_waiting=True).limit(10).all()
-        for task in tasks:
-            TaskService.refresh_task_vector_db(task)
-            task.def_waiting = False
-            task_count += 1
-        if task_count > 0:
-            print(f"Number of tasks added to vector database: {task_count}")
-        
-        session.commit()
+        for entity, name, model, add_to_vector_db in VECTOR_BUILD_TARGETS:
+            sizer = batch_sizers[entity]
+            backlog = session.query(model).filter_by(def_waiting=True).count()
+            if backlog == 0:
+                continue
+            count = 0
+            start_time = time.time()
+            # Drain pending rows in batches sized from the observed latency, one vector store upsert per batch
+            while backlog > 0 and time.time() < deadline:
+                batch_size = sizer.next_size(backlog)
+                rows = session.query(model).filter_by(def_waiting=True).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    backlog = 0
+                    break
+                batch_start_time = time.time()
+                try:
+                    add_to_vector_db(rows)
+                except Exception as e:
+                    session.rollback()
+                    sizer.record_failure()
+                    print(f"Failed to add {len(rows)} {name} to vector database: {str(e)}, batch size reduced to {sizer.batch_size}")
+                    break
+                sizer.record_success(len(rows), time.time() - batch_start_time)
+                for row in rows:
+                    row.def_waiting = False
+                ProjectService.bump_index_generation(session, {row.project_id for row in rows})
+                session.commit()
+                session.expunge_all()
+                count += len(rows)
+                backlog = max(backlog - len(rows), 0)
+            VectorBuildService.save_stat(session, entity, sizer, backlog)
+            session.commit()
+            if count > 0:
+                cost_time = max(time.time() - start_time, 0.001)
+                print(f"Number of {name} added to vector database: {count}, {count / cost_time:.1f} docs/s, "
+                      f"batch size {sizer.batch_size}, {backlog} waiting")
         
         # # Check if building is complete
         # if table_count + column_count + doc_count + task_count == 0:
@@ -65,37 +90,52 @@ def add_to_vector_db_job():
         #         index_model.status = IndexModelStatus.READY.value
         #         session.commit()
         
+# Task for switching projects to their new index version once it is built
+@scheduler.task('interval', id='cutover_index_versions_job', seconds=2, coalesce=True, max_instances=1)
+def cutover_index_versions_job():
+    with app.app_context():
+        session = db.session
+        for project in session.query(Project).filter(Project.next_version.isnot(None)).all():
+            try:
+                DefService.cutover_index_version(session, project)
+            except Exception as e:
+                session.rollback()
+                print(f"Failed to switch index version of project {project.id}: {str(e)}")
+        
 # Task for removing old version table and column definitions
 @scheduler.task('interval', id='remove_old_version_defs_job', seconds=10, coalesce=True, max_instances=1)
 def remove_old_version_defs_job():
     with app.app_context():
         session = db.session
+        # Projects with definitions older than their current version
+        stale_projects = session.query(Project.id, Project.cur_version) \
+            .join(DefinitionTable, DefinitionTable.project_id == Project.id) \
+            .filter(DefinitionTable.def_version < Project.cur_version) \
+            .union(session.query(Project.id, Project.cur_version)
+                   .join(DefinitionColumn, DefinitionColumn.project_id == Project.id)
+                   .filter(DefinitionColumn.def_version < Project.cur_version)) \
+            .all()
+        if not stale_projects:
+            return
+        
         table_count = 0
         column_count = 0
-        
-        # Query 50 old version table definitions
-        table_definitions = session.query(DefinitionTable) \
-            .join(Project, Project.id == DefinitionTable.project_id) \
-            .filter(DefinitionTable.def_version < Project.cur_version) \
-            .limit(50).all()
-        for table_definition in table_definitions:
-            DefService.remove_table_vector_db(table_definition)
-            session.delete(table_definition)
-            table_count += 1
-        if table_count > 0:
-            print(f"Number of old version table definitions deleted: {table_count}")
-            
-        # Query 50 old version column definitions
-        column_definitions = session.query(DefinitionColumn) \
-            .join(Project, Project.id == DefinitionColumn.project_id) \
-            .filter(DefinitionColumn.def_version < Project.cur_version) \
-            .limit(50).all()
-        for column_definition in column_definitions:
-            DefService.remove_column_vector_db(column_definition)
-            session.delete(column_definition)
-            column_count += 1
-        if column_count > 0:
-            print(f"Number of old version column definitions deleted: {column_count}")
-            
-        if table_count + column_count > 0:
-            session.commit()
\ No newline at end of file
+        failed_count = 0
+        start_time = time.time()
+        # One filtered vector delete per store and one SQL delete per table for each project
+        for project_id, cur_version in stale_projects:
+            project_start_time = time.time()
+            try:
+                project_table_count, project_column_count = DefService.remove_old_version_definitions(session, project_id, cur_version)
+            except Exception as e:
+                session.rollback()
+                failed_count += 1
+                print(f"Failed to delete old version definitions of project {project_id}: {str(e)}")
+                continue
+            table_count += project_table_count
+            column_count += project_column_count
+            print(f"Old version definitions of project {project_id} deleted: {project_table_count} tables, "
+                  f"{project_column_count} columns in {time.time() - project_start_time:.2f}s")
+        print(f"Number of old version definitions deleted: {table_count} tables, {column_count} columns "
+              f"of {len(stale_projects) - failed_count} projects in {time.time() - start_time:.2f}s, "
+              f"{failed_count} projects left for the next run")
@@ -1,7 +1,7 @@
 from models.base import ProjectBaseModel
 from database import db
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
-from enums import JobStatus
+from enums import JobStatus, JobPriority
 
 class Job(ProjectBaseModel):
     """Task model"""
@@ -13,6 +13,16 @@ class Job(ProjectBaseModel):
     job_status = db.Column(db.String(20), nullable=False, default=JobStatus.INIT.value, comment='Task status')
     job_cost_time = db.Column(db.Integer, nullable=False, default=0, comment='Task cost time, unit: ms')
     error_message = db.Column(db.Text, comment='Error message')
+    worker_id = db.Column(db.String(100), comment='Worker that claimed the job')
+    lease_expires_at = db.Column(db.DateTime(timezone=True), comment='Lease expiry of the claim, the job can be reclaimed after it')
+    priority = db.Column(db.Integer, nullable=False, default=JobPriority.NORMAL.value, comment='Job priority, see JobPriority')
+    attempts = db.Column(db.Integer, nullable=False, default=0, comment='Number of times the job was claimed')
+    claimed_at = db.Column(db.DateTime(timezone=True), comment='Time of the last claim, counts as served for fair queuing')
+
+    __table_args__ = (
+        db.Index('ix_job_job_status', 'job_status'),
+        db.Index('ix_job_claimed_at', 'claimed_at'),
+    )
 
 class JobSchema(SQLAlchemyAutoSchema):
     class Meta:
@@ -11,6 +11,8 @@ class Project(BaseModel):
     db_type = db.Column(db.String(20), comment='Database type')
     db_version = db.Column(db.String(255), comment='Database version information')
     cur_version = db.Column(db.Integer, default=1, comment='Current index version')
+    next_version = db.Column(db.Integer, nullable=True, comment='Index version being built, becomes current once its vectors are complete')
+    index_generation = db.Column(db.Integer, default=0, comment='Incremented when the vector index of the project changes')
 
 class ProjectSchema(SQLAlchemyAutoSchema):
     class Meta:
@@ -16,6 +16,10 @@ class Task(ProjectBaseModel):
     sql_refer = db.Column(db.Boolean, comment='Whether it can be referenced')
     learn_result = db.Column(db.Text, comment='Learning result')
     def_waiting = db.Column(db.Boolean, default=False, comment='Whether to wait for construction')
+    batch_id = db.Column(db.String(32), index=True, comment='Batch ID of tasks submitted together')
+    question_translation = db.Column(db.Text, comment='Question translated for the vector stores, cached')
+    question_embedding = db.Column(db.JSON, comment='Embedding of the translated question, cached')
+    question_embedding_model = db.Column(db.String(100), comment='Name of the embedding model of question_embedding')
     
     def __repr__(self):
         return f"<Task(id={self.id}, question={self.question[:20]}...)>"
@@ -0,0 +1,12 @@
+from models.base import BaseModel
+from database import db
+
+class VectorBuildStat(BaseModel):
+    """Throughput of the vector build per entity type, updated by the vector build job"""
+    __tablename__ = 'vector_build_stat'
+    
+    entity = db.Column(db.String(20), nullable=False, unique=True, comment='Entity type: table, column, doc, task')
+    batch_size = db.Column(db.Integer, nullable=False, comment='Current batch size')
+    rate = db.Column(db.Float, nullable=False, default=0, comment='Smoothed build rate, unit: docs/s')
+    latency = db.Column(db.Integer, nullable=False, default=0, comment='Latency of the last batch, unit: ms')
+    backlog = db.Column(db.Integer, nullable=False, default=0, comment='Rows waiting for building when last measured')
@@ -3,8 +3,11 @@ from flask_smorest import Blueprint, abort
 from marshmallow import Schema, fields
 from services.task_service import TaskService
 from services.def_service import DefService
-import asyncio
-from flask import request
+from utils.event_loop import run_async, iterate_async
+from flask import request, Response, stream_with_context
+import json
+import queue
+import time
 from services.job_service import JobService
 from dto.ai_comment_dto import UpdateAICommentDTO
 from dto.definition_rule_dto import DefinitionRuleDTO
@@ -12,6 +15,7 @@ from dto.task_dto import TaskDTO
 from utils.schemas import MessageResponseSchema, PaginationQuerySchema, ProjectIdQuerySchema, PaginationBaseSchema
 from models.definition_relation import DefinitionRelationSchema
 from dto.project_settings_dto import ProjectSettingsDTO
+from dto.batch_progress_dto import BatchProgressDTO
 from models.definition_doc import DefinitionDocSchema, definition_doc_schema
 from dto.gen_ai_comments_dto import GenAICommentsResponseDTO
 import csv
@@ -23,7 +27,9 @@ from dto.update_task_query import UpdateTaskQueryDTO
 from dto.definition_doc_query_result_dto import DefinitionDocQueryResultDTO
 from models.definition_rule import DefinitionRuleSchema
 from utils.schemas import PaginationSchema
-from database import session_scope
+from database import session_scope, db
+from services.job_event_service import job_event_service
+from enums import JobPriority
 
 # Create a blueprint
 main_bp = Blueprint('main', __name__, description='Main operations')
@@ -66,6 +72,7 @@ class JobSchema(Schema):
     created_at = fields.DateTime(description='Create time')
     updated_at = fields.DateTime(description='Update time')
     job_cost_time = fields.Int(description='Task cost time, unit: ms')
+    priority = fields.Int(description='Job priority')
 
 class JobListResponseSchema(Schema):
     jobs = fields.List(fields.Nested(JobSchema), description='Task list')
@@ -89,6 +96,19 @@ class OptimizeQuestionResponseSchema(Schema):
 class TaskResponseSchema(Schema):
     task_id = fields.Int(description='Created task ID')
 
+class AskBatchSchema(Schema):
+    project_id = fields.Int(description='Project ID', required=True)
+    questions = fields.List(fields.Str, required=True, description='User questions, one task per question')
+    question_supplement = fields.Str(required=False, description='Question supplement shared by all tasks')
+    options = fields.Dict(required=False, description='Task options', default={})
+    rules = fields.List(fields.Int, required=False, description='Rule id list', default=[])
+
+class AskBatchResponseSchema(Schema):
+    batch_id = fields.Str(description='Batch ID')
+    task_ids = fields.List(fields.Int, description='Created task IDs, in the order of the questions')
+
+BatchProgressSchema = BatchProgressDTO.Schema()
+
 # 新增 Schema 类定义
 class TaskTableSchema(Schema):
     table_name = fields.Str(description='Table name')
@@ -510,7 +530,7 @@ class GenTableAIComments(MethodView):
     def post(self, json_data):
         """Generate table AI comments"""
         with session_scope(read_only=True) as session:
-            return DefService.gen_table_ai_comments(session, json_data['project_id'], json_data['table'])
+            return run_async(DefService.gen_table_ai_comments(session, json_data['project_id'], json_data['table']))
 
 @main_bp.route('/optimize-question')
 class OptimizeQuestion(MethodView):
@@ -518,7 +538,7 @@ class OptimizeQuestion(MethodView):
     @main_bp.response(200, OptimizeQuestionResponseSchema)
     def post(self, json_data):
         """Optimize user question"""
-        question = asyncio.run(TaskService.optimize_question(json_data['question']))
+        question = run_async(TaskService.optimize_question(json_data['question']))
         return {"question": question}
 
 @main_bp.route('/ask')
@@ -528,16 +548,42 @@ class Ask(MethodView):
     def post(self, json_data):
         """Create new sql generation task"""
         with session_scope() as session:
-            task_id = asyncio.run(TaskService.create_task(
+            task_id = run_async(TaskService.create_task(
                 session,
                 json_data['project_id'],
                 json_data['question'], 
                 json_data['question_supplement'],
                 options=json_data.get('options', []),
-                rules=json_data.get('rules', [])
+                rules=json_data.get('rules', []),
+                priority=JobPriority.INTERACTIVE.value
             ))
             return {"task_id": task_id}
 
+@main_bp.route('/ask-batch')
+class AskBatch(MethodView):
+    @main_bp.arguments(AskBatchSchema)
+    @main_bp.response(200, AskBatchResponseSchema)
+    def post(self, json_data):
+        """Create many sql generation tasks in one batch"""
+        with session_scope() as session:
+            batch_id, task_ids = TaskService.create_tasks(
+                session,
+                json_data['project_id'],
+                json_data['questions'],
+                json_data.get('question_supplement'),
+                options=json_data.get('options', {}),
+                rules=json_data.get('rules', [])
+            )
+            return {"batch_id": batch_id, "task_ids": task_ids}
+
+@main_bp.route('/ask-batch/<string:batch_id>')
+class AskBatchProgress(MethodView):
+    @main_bp.response(200, BatchProgressSchema)
+    def get(self, batch_id):
+        """Get aggregate progress of a batch of tasks"""
+        with session_scope(read_only=True) as session:
+            return TaskService.get_batch_progress(session, batch_id)
+
 @main_bp.route('/re-ask')
 class ReAsk(MethodView):
     @main_bp.arguments(ReAskQuestionSchema)
@@ -545,7 +591,7 @@ class ReAsk(MethodView):
     def post(self, json_data):
         """Re-create sql generation task"""
         with session_scope() as session:
-            task_id = asyncio.run(TaskService.re_create_task(session, json_data['taskId']))
+            task_id = run_async(TaskService.re_create_task(session, json_data['taskId'], priority=JobPriority.INTERACTIVE.value))
             return {"task_id": task_id}
 
 @main_bp.route('/task/<int:task_id>')
@@ -566,6 +612,22 @@ class TaskResource(MethodView):
             TaskService.delete_task(session, task_id)
             return {'message': 'Task deleted'}
 
+@main_bp.route('/task/<int:task_id>/sql-stream')
+class TaskSqlStream(MethodView):
+    def get(self, task_id):
+        """Generate SQL for the task, streaming the SQL as Server-Sent Events while it is generated"""
+        with session_scope(read_only=True) as session:
+            TaskService.check_can_generate_sql(session, task_id)
+        
+        def generate():
+            with session_scope() as session:
+                for event in iterate_async(TaskService.generate_sql_stream(session, task_id)):
+                    yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        
+        return Response(stream_with_context(generate()),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @main_bp.route('/generate')
 class Generate(MethodView):
     @main_bp.arguments(GenerateSchema)
@@ -699,7 +761,7 @@ class Jobs(MethodView):
     def post(self, json_data):
         """Add job"""
         with session_scope() as session:
-            JobService.create_job(session, json_data['task_id'], json_data['job_type'])
+            JobService.create_job(session, json_data['task_id'], json_data['job_type'], priority=JobPriority.INTERACTIVE.value)
             return {'message': 'Job added'}
 
 @main_bp.route('/jobs/<int:job_id>/cancel')
@@ -719,6 +781,35 @@ class TaskJobs(MethodView):
         with session_scope(read_only=True) as session:
             return {"jobs": JobService.get_jobs(session, task_id)}
 
+# Event streams are closed after this many seconds, EventSource clients reconnect automatically
+JOB_EVENT_STREAM_SECONDS = 300
+
+@main_bp.route('/task/<int:task_id>/job-events')
+class TaskJobEvents(MethodView):
+    def get(self, task_id):
+        """Stream the job state transitions and stage results of the task as Server-Sent Events, instead of polling its jobs"""
+        if not job_event_service.streams_available(db.engine):
+            abort(404, message="Job events are only available with gthread workers on PostgreSQL, poll the task instead")
+        subscriber = job_event_service.subscribe(task_id)
+        
+        def generate():
+            try:
+                deadline = time.time() + JOB_EVENT_STREAM_SECONDS
+                while time.time() < deadline:
+                    try:
+                        job_event = subscriber.get(timeout=15)
+                    except queue.Empty:
+                        # Keep the connection open through proxies
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield f"event: job\ndata: {json.dumps(job_event)}\n\n"
+            finally:
+                job_event_service.unsubscribe(task_id, subscriber)
+        
+        return Response(generate(),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @main_bp.route('/jobs/<int:job_id>')
 class JobDetail(MethodView):
     @main_bp.response(200, JobSchema)
@@ -0,0 +1,90 @@
+from typing import Awaitable, Callable
+import asyncio
+import os
+import threading
+import time
+
+# Per-query fields of a vector query result
+QUERY_RESULT_KEYS = ['ids', 'documents', 'metadatas', 'distances', 'embeddings']
+
+class BatchQueryService:
+    """
+    Coalesce the vector queries of the tasks of a batch
+
+    The first retrieval job of a batch queries the vector store for up to max_batch_size pending
+    tasks of the batch at once. Its siblings running in this worker take their results from here
+    instead of querying again; siblings running elsewhere load their own batch.
+    """
+    def __init__(self, max_batch_size: int, ttl: float):
+        self.max_batch_size = max_batch_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (job_type, task_id) -> (expires at, query result of the task)
+        self._results: dict[tuple[str, int], tuple[float, dict]] = {}
+        # (job_type, batch_id) -> set once the batch being loaded is available
+        self._loading: dict[tuple[str, str], threading.Event] = {}
+
+    async def get_result_async(self, job_type: str, batch_id: str, task_id: int, load_batch: Callable[[], Awaitable[dict[int, dict]]]) -> dict:
+        """
+        Get the query result of a task, loading a batch if needed
+
+        Args:
+            load_batch: Queries the store for a batch of tasks including task_id, returns task ID -> result
+        """
+        while True:
+            result, loading, is_loader = self._get_or_start_loading(job_type, batch_id, task_id)
+            if result is not None:
+                return result
+            if is_loader:
+                break
+            await asyncio.to_thread(loading.wait, 60)
+
+        results = {}
+        try:
+            results = await load_batch()
+        finally:
+            self._finish_loading(job_type, batch_id, task_id, results, loading)
+        return results[task_id]
+
+    def _get_or_start_loading(self, job_type: str, batch_id: str, task_id: int) -> tuple[dict | None, threading.Event | None, bool]:
+        """The cached result of the task, or the loading event of its batch and whether the caller must load it"""
+        with self._lock:
+            self._evict_expired()
+            key = (job_type, task_id)
+            if key in self._results:
+                return self._results.pop(key)[1], None, False
+            batch_key = (job_type, batch_id)
+            loading = self._loading.get(batch_key)
+            if loading is None:
+                loading = threading.Event()
+                self._loading[batch_key] = loading
+                return None, loading, True
+            return None, loading, False
+
+    def _finish_loading(self, job_type: str, batch_id: str, task_id: int, results: dict[int, dict], loading: threading.Event):
+        with self._lock:
+            expires_at = time.time() + self.ttl
+            for result_task_id, result in results.items():
+                if result_task_id != task_id:
+                    self._results[(job_type, result_task_id)] = (expires_at, result)
+            self._loading.pop((job_type, batch_id), None)
+        loading.set()
+
+    def _evict_expired(self):
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self._results.items() if expires_at < now]:
+            del self._results[key]
+
+    @staticmethod
+    def split_results(results: dict, task_ids: list[int]) -> dict[int, dict]:
+        """Split the result of a batched query into single-query results per task"""
+        keys = [key for key in QUERY_RESULT_KEYS if results.get(key) is not None]
+        return {
+            task_id: {key: [results[key][i]] for key in keys}
+            for i, task_id in enumerate(task_ids)
+        }
+
+batch_query_service = BatchQueryService(
+    max_batch_size=int(os.getenv('BATCH_QUERY_SIZE', '32')),
+    ttl=float(os.getenv('BATCH_QUERY_TTL', '300'))
+)
@@ -1,3 +1,5 @@
+import time
+from sqlalchemy import and_, or_
 from models.definition_column import DefinitionColumn
 from models.definition_table import DefinitionTable
 from models.definition_relation import DefinitionRelation
@@ -9,7 +11,8 @@ from models.definition_doc import DefinitionDoc
 from models.project import Project
 from dto.definition_rule_dto import DefinitionRuleDTO
 from models.definition_rule import DefinitionRule
-from utils.utils import reverse_relation_type
+from utils.utils import reverse_relation_type, vector_content_hash
+from vectors.embedding import get_embedding_provider
 from dto.gen_ai_comments_dto import GenAICommentsTableDTO
 from services.openai_service import OpenAIService
 from utils.utils import extract_json
@@ -17,6 +20,8 @@ from dto.gen_ai_comments_dto import GenAICommentsResponseDTO, GenAICommentsRespo
 from database import db
 from models.task import Task
 from dto.project_settings_dto import ProjectSettingsDTO
+from services.vector_build_service import VectorBuildService
+from services.project_service import ProjectService
 from models.task_doc import TaskDoc
 from models.task_sql import TaskSQL
 from models.task_table import TaskTable
@@ -34,30 +39,32 @@ class DefService:
             DefinitionTable.disabled: query.disabled,
             DefinitionTable.def_waiting: True
         })
+        table_definitions = session.query(DefinitionTable).filter_by(project_id=query.project_id, def_table=query.table).all()
+        DefService.update_served_version_documents(session, query.project_id, table_definitions, [])
         
     @staticmethod
     def update_ddl(session, project_id: int, table_csv_reader, column_csv_reader):
         """Update DDL"""
         project = session.query(Project).get(project_id)
         
-        # Increment version number
-        new_version = project.cur_version + 1
+        # Build the next version, retrieval keeps using the current one until it is complete (see cutover_index_version)
+        new_version = (project.next_version or project.cur_version) + 1
         
         # Import table definitions
         DefService.import_table_definitions(session, project_id, table_csv_reader, new_version)
         # Import column definitions 
         DefService.import_column_definitions(session, project_id, column_csv_reader, new_version)
         
-        # Update project
-        project.cur_version = new_version
+        # Set once all definitions are imported (they are committed one by one), the cutover waits for it
+        project.next_version = new_version
     
     @staticmethod
     def update_ddl_by_query(session, update_ddl_by_query_dto: UpdateDDLByQueryDTO):
         """Update DDL using query result json"""
         project = session.query(Project).get(update_ddl_by_query_dto.project_id)
         
-        # Increment version number
-        new_version = project.cur_version + 1
+        # Build the next version, retrieval keeps using the current one until it is complete (see cutover_index_version)
+        new_version = (project.next_version or project.cur_version) + 1
         
         # Import table definitions
         for table in update_ddl_by_query_dto.tables:
@@ -66,54 +73,191 @@ class DefService:
         for column in update_ddl_by_query_dto.columns:
             DefService.add_or_update_column_definition(session, update_ddl_by_query_dto.project_id, column.table, column.column, column.type, column.comment, cur_version=new_version)
         
-        # Update project
-        project.cur_version = new_version
+        # Set once all definitions are imported (they are committed one by one), the cutover waits for it
+        project.next_version = new_version
     
     @staticmethod
     def refresh_index(session, query: RefreshIndexQueryDTO):
-        """Refresh index"""
+        """
+        Refresh index
+        
+        Reconciles the vector stores with the definitions instead of rebuilding them: only rows whose
+        vector document changed are queued for the vector build, only orphan documents are deleted,
+        retrieval keeps using the unchanged documents meanwhile.
+        """
         project = session.query(Project).get(query.project_id)
+        ProjectService.bump_index_generation(session, [query.project_id])
+        from vector_stores import table_def_store, column_def_store, doc_def_store, sql_log_store
+        from services.task_service import TaskService
+        
+        # Definitions and documents of the latest version, documents of the current version are
+        # dropped at cutover if a newer version is being built
+        latest_version = project.next_version or project.cur_version
+        version_where = {"$and": [{"project_id": query.project_id}, {"version": latest_version}]}
         
         # table
         if query.refresh_table:
-            # clear table_def_store
-            from vector_stores import table_def_store
-            table_def_store.delete_documents(where={"project_id": query.project_id})
-            # Re-add to vector database
-            session.query(DefinitionTable).filter_by(project_id=query.project_id, def_version=project.cur_version).update({
-                DefinitionTable.def_waiting: True
-            })
+            DefService.reconcile_vector_db(
+                session, table_def_store, DefinitionTable, DefService.table_vector_document, query.project_id,
+                session.query(DefinitionTable).filter_by(project_id=query.project_id, def_version=latest_version),
+                where=version_where)
             
         # column
         if query.refresh_column:
-            # clear column_def_store
-            from vector_stores import column_def_store
-            column_def_store.delete_documents(where={"project_id": query.project_id})
-            # Re-add to vector database
-            session.query(DefinitionColumn).filter_by(project_id=query.project_id, def_version=project.cur_version).update({
-                DefinitionColumn.def_waiting: True
-            })
+            DefService.reconcile_vector_db(
+                session, column_def_store, DefinitionColumn, DefService.column_vector_document, query.project_id,
+                session.query(DefinitionColumn).filter_by(project_id=query.project_id, def_version=latest_version),
+                where=version_where)
             
         # doc
         if query.refresh_doc:
-            # clear doc_def_store
-            from vector_stores import doc_def_store
-            doc_def_store.delete_documents(where={"project_id": query.project_id})
-            # Re-add to vector database
-            session.query(DefinitionDoc).filter_by(project_id=query.project_id).update({
-                DefinitionDoc.def_waiting: True
-            })
+            DefService.reconcile_vector_db(
+                session, doc_def_store, DefinitionDoc, DefService.doc_vector_document, query.project_id,
+                session.query(DefinitionDoc).filter_by(project_id=query.project_id))
             
         # sql log
         if query.refresh_sql:
-            # clear sql_log_store
-            from vector_stores import sql_log_store
-            sql_log_store.delete_documents(where={"project_id": query.project_id})
-            # Re-add to vector database
-            session.query(Task).filter_by(project_id=query.project_id, sql_refer=True).update({
-                Task.def_waiting: True
-            })
+            DefService.reconcile_vector_db(
+                session, sql_log_store, Task, TaskService.task_vector_document, query.project_id,
+                session.query(Task).filter_by(project_id=query.project_id, sql_refer=True))
+    
+    @staticmethod
+    def reconcile_vector_db(session, store, model, vector_document, project_id: int, rows_query, where: dict = None) -> tuple[int, int]:
+        """
+        Flag the rows whose vector document changed and delete the orphan documents of a project
+        
+        The content hash of each row is compared with the one stored in the document metadata.
+        
+        Args:
+            where: Documents to reconcile with the rows, defaults to all documents of the project
+        
+        Returns:
+            tuple[int, int]: Number of rows flagged for the vector build, number of orphan documents deleted
+        """
+        start_time = time.time()
+        indexed_metadatas = store.get_metadatas(where=where or {"project_id": project_id})
+        expected_doc_ids = set()
+        changed_ids = []
+        for row in rows_query.yield_per(1000):
+            _, metadata, doc_id = vector_document(row)
+            expected_doc_ids.add(doc_id)
+            indexed_metadata = indexed_metadatas.get(doc_id)
+            if not row.def_waiting and (indexed_metadata is None or indexed_metadata.get("content_hash") != metadata["content_hash"]):
+                changed_ids.append(row.id)
+        for start in range(0, len(changed_ids), 1000):
+            session.query(model).filter(model.id.in_(changed_ids[start:start + 1000])).update({
+                model.def_waiting: True
+            }, synchronize_session=False)
+        
+        orphan_doc_ids = [doc_id for doc_id in indexed_metadatas if doc_id not in expected_doc_ids]
+        if orphan_doc_ids:
+            store.delete_documents_by_ids(orphan_doc_ids, where=where or {"project_id": project_id})
+        print(f"Reconciled {model.__tablename__} vectors of project {project_id} in {time.time() - start_time:.2f}s: "
+              f"{len(indexed_metadatas)} indexed, {len(changed_ids)} changed, {len(orphan_doc_ids)} orphans deleted")
+        return len(changed_ids), len(orphan_doc_ids)
+    
+    @staticmethod
+    def update_served_version_documents(session, project_id: int, table_definitions: list[DefinitionTable], column_definitions: list[DefinitionColumn]):
+        """
+        Apply edits made while a new index version is being built to the documents of the served version
+        
+        Definitions imported into the version being built only get documents of that version from the
+        vector build, so an edit (disabling a table, an AI comment) would reach retrieval only at the
+        cutover. Only existing documents are rewritten, definitions new in the version being built stay
+        out of the served version.
+        """
+        cur_version, next_version = session.query(Project.cur_version, Project.next_version).filter(Project.id == project_id).one()
+        if next_version is None:
+            return
+        from vector_stores import table_def_store, column_def_store
+        updated = False
+        for store, definitions, vector_document in ((table_def_store, table_definitions, DefService.table_vector_document),
+                                                    (column_def_store, column_definitions, DefService.column_vector_document)):
+            moved_definitions = [definition for definition in definitions if definition.def_version != cur_version]
+            if not moved_definitions:
+                continue
+            indexed_metadatas = store.get_metadatas(where={"$and": [
+                {"project_id": project_id},
+                {"version": cur_version},
+                {"table": {"$in": sorted({definition.def_table for definition in moved_definitions})}}
+            ]})
+            documents = [vector_document(definition, cur_version) for definition in moved_definitions]
+            documents = [document for document in documents if document[2] in indexed_metadatas]
+            if documents:
+                store.add_documents(*[list(values) for values in zip(*documents)])
+                updated = True
+        if updated:
+            ProjectService.bump_index_generation(session, [project_id])
+    
+    @staticmethod
+    def cutover_index_version(session, project: Project) -> bool:
+        """
+        Make the version being built current once all its table and column documents are built
+        
+        Retrieval switches to the new documents with the version, then the documents of older
+        versions are dropped with one filtered delete per store. While a newer DDL update is being
+        imported (definitions already moved past next_version), the cutover waits for it, since the
+        moved definitions may have no document of next_version.
+        
+        Returns:
+            bool: Whether the version was switched
+        """
+        next_version = project.next_version
+        if next_version is None:
+            return False
+        waiting_count = 0
+        for model in (DefinitionTable, DefinitionColumn):
+            waiting_count += session.query(model).filter(
+                model.project_id == project.id,
+                or_(
+                    model.def_version > next_version,
+                    and_(model.def_version == next_version, model.def_waiting == True)
+                )
+            ).count()
+        if waiting_count > 0:
+            return False
+        
+        previous_version = project.cur_version
+        project.cur_version = next_version
+        project.next_version = None
+        ProjectService.bump_index_generation(session, [project.id])
+        session.commit()
+        print(f"Project {project.id} index version switched from {previous_version} to {next_version}")
         
+        DefService.remove_old_version_vectors(project.id, next_version)
+        return True
+    
+    @staticmethod
+    def remove_old_version_vectors(project_id: int, cur_version: int):
+        """Delete the table and column documents of the versions before cur_version, one filtered delete per store"""
+        from vector_stores import table_def_store, column_def_store
+        old_versions_where = {"$and": [{"project_id": project_id}, {"version": {"$lt": cur_version}}]}
+        table_def_store.delete_documents(where=old_versions_where)
+        column_def_store.delete_documents(where=old_versions_where)
+    
+    @staticmethod
+    def remove_old_version_definitions(session, project_id: int, cur_version: int) -> tuple[int, int]:
+        """
+        Delete the table and column definitions of the versions before cur_version and their documents
+        
+        The documents are deleted first, so rows are kept for a retry if the vector store fails.
+        
+        Returns:
+            tuple[int, int]: Number of table definitions deleted, number of column definitions deleted
+        """
+        DefService.remove_old_version_vectors(project_id, cur_version)
+        table_count = session.query(DefinitionTable).filter(
+            DefinitionTable.project_id == project_id,
+            DefinitionTable.def_version < cur_version
+        ).delete(synchronize_session=False)
+        column_count = session.query(DefinitionColumn).filter(
+            DefinitionColumn.project_id == project_id,
+            DefinitionColumn.def_version < cur_version
+        ).delete(synchronize_session=False)
+        ProjectService.bump_index_generation(session, [project_id])
+        session.commit()
+        return table_count, column_count
+    
     @staticmethod
     def get_project_settings(session, project_id: int) -> ProjectSettingsDTO:
         """Get project settings"""
@@ -127,6 +271,13 @@ class DefService:
         vector_waiting_doc_count = session.query(DefinitionDoc).filter_by(def_waiting=True).count()
         # Get count of tasks waiting for vector building
         vector_waiting_task_count = session.query(Task).filter_by(def_waiting=True).count()
+        # Completion estimate from the throughput measured by the vector build job
+        vector_build_rate, vector_build_eta = VectorBuildService.estimate(session, {
+            'table': vector_waiting_table_count,
+            'column': vector_waiting_column_count,
+            'doc': vector_waiting_doc_count,
+            'task': vector_waiting_task_count,
+        })
         
         definition_doc_count = session.query(DefinitionDoc).filter_by(project_id=project_id).count()
         definition_rule_count = session.query(DefinitionRule).filter_by(project_id=project_id).count()
@@ -150,6 +301,8 @@ class DefService:
             vector_waiting_column_count=vector_waiting_column_count,
             vector_waiting_doc_count=vector_waiting_doc_count,
             vector_waiting_task_count=vector_waiting_task_count,
+            vector_build_rate=vector_build_rate,
+            vector_build_eta=vector_build_eta,
             definition_doc_count=definition_doc_count,
             definition_rule_count=definition_rule_count,
             definition_table_count=definition_table_count,
@@ -211,11 +364,39 @@ class DefService:
             )
             session.add(table_definition)
         
+        if table_definition.def_version != cur_version:
+            # Documents are per version, the row needs documents in the new version
+            table_definition.def_waiting = True
         table_definition.def_version = cur_version
         session.commit()
         
     @staticmethod
     def add_or_update_table_vector_db(table_definition: DefinitionTable):
+        DefService.add_tables_vector_db([table_definition])
+    
+    @staticmethod
+    def add_tables_vector_db(table_definitions: list[DefinitionTable]):
+        """Add or update table definitions in the vector store with one batch upsert"""
+        if not table_definitions:
+            return
+        documents, metadatas, doc_ids = zip(*[DefService.table_vector_document(table_definition) for table_definition in table_definitions])
+        from vector_stores import table_def_store
+        table_def_store.add_documents(list(documents), list(metadatas), list(doc_ids))
+        DefService.delete_legacy_documents(table_def_store, table_definitions)
+    
+    @staticmethod
+    def delete_legacy_documents(store, definitions):
+        """Delete the documents indexed before IDs were versioned, per project so sharded stores route the delete"""
+        doc_ids_by_project = {}
+        for definition in definitions:
+            doc_ids_by_project.setdefault(definition.project_id, []).append(str(definition.id))
+        for project_id, doc_ids in doc_ids_by_project.items():
+            store.delete_documents_by_ids(doc_ids, where={"project_id": project_id})
+    
+    @staticmethod
+    def table_vector_document(table_definition: DefinitionTable, version: int = None) -> tuple[str, dict, str]:
+        """Document, metadata and ID of a table definition in the vector store, in its version unless another one is given"""
+        version = version or table_definition.def_version
         table_name = table_definition.def_table
         table_comment = table_definition.def_comment
         ai_comment = table_definition.def_ai_comment
@@ -226,31 +407,17 @@ class DefService:
         # 3. table_name
         final_comment = ai_comment if ai_comment else table_comment if table_comment else table_name
             
-        # Add to vector store
-        from vector_stores import table_def_store
-        table_def_store.add_document(
-            document=f"Table: {table_name}\nDescription: {final_comment}",
-            metadata={
+        return DefService.with_content_hash(
+            f"Table: {table_name}\nDescription: {final_comment}",
+            {
                 "project_id": table_definition.project_id,
                 "table": table_name,
-                "version": table_definition.def_version,
+                "version": version,
                 "disabled": table_definition.disabled or False
             },
-            doc_id=str(table_definition.id)
+            DefService.versioned_doc_id(table_definition.id, version)
         )
 
-    @staticmethod
-    def remove_table_vector_db(table_definition: DefinitionTable):
-        table_name = table_definition.def_table
-        from vector_stores import table_def_store
-        table_def_store.delete_documents(where={
-            "$and": [
-                {"project_id": {"$eq": table_definition.project_id}},
-                {"table": {"$eq": table_name}},
-                {"version": {"$eq": table_definition.def_version}}
-            ]
-        })
-        
     @staticmethod
     def add_or_update_column_definition(session, project_id: int, table_name: str, column_name: str, data_type: str, comment: str | None = None, ai_comment: str = None, cur_version: int = 1):
         """Add or update column definition"""
@@ -285,11 +452,30 @@ class DefService:
             )
             session.add(column_definition)
         
+        if column_definition.def_version != cur_version:
+            # Documents are per version, the row needs documents in the new version
+            column_definition.def_waiting = True
         column_definition.def_version = cur_version
         session.commit()
         
     @staticmethod
     def add_or_update_column_vector_db(column_definition: DefinitionColumn):
+        DefService.add_columns_vector_db([column_definition])
+    
+    @staticmethod
+    def add_columns_vector_db(column_definitions: list[DefinitionColumn]):
+        """Add or update column definitions in the vector store with one batch upsert"""
+        if not column_definitions:
+            return
+        documents, metadatas, doc_ids = zip(*[DefService.column_vector_document(column_definition) for column_definition in column_definitions])
+        from vector_stores import column_def_store
+        column_def_store.add_documents(list(documents), list(metadatas), list(doc_ids))
+        DefService.delete_legacy_documents(column_def_store, column_definitions)
+    
+    @staticmethod
+    def column_vector_document(column_definition: DefinitionColumn, version: int = None) -> tuple[str, dict, str]:
+        """Document, metadata and ID of a column definition in the vector store, in its version unless another one is given"""
+        version = version or column_definition.def_version
         table_name = column_definition.def_table
         column_name = column_definition.def_column
         data_type = column_definition.def_type
@@ -302,34 +488,18 @@ class DefService:
         # 3. column_name
         final_comment = ai_comment if ai_comment else comment if comment else column_name
             
-        # Add to vector store
-        from vector_stores import column_def_store
-        column_def_store.add_document(
-            document=f"Table: {table_name}\nColumn: {column_name}\nDescription: {final_comment}",
-            metadata={
+        return DefService.with_content_hash(
+            f"Table: {table_name}\nColumn: {column_name}\nDescription: {final_comment}",
+            {
                 "project_id": column_definition.project_id,
                 "table": table_name,
                 "column": column_name,
                 "data_type": data_type,
-                "version": column_definition.def_version
+                "version": version
             },
-            doc_id=str(column_definition.id)
+            DefService.versioned_doc_id(column_definition.id, version)
         )
 
-    @staticmethod
-    def remove_column_vector_db(column_definition: DefinitionColumn):
-        table_name = column_definition.def_table
-        column_name = column_definition.def_column
-        from vector_stores import column_def_store
-        column_def_store.delete_documents(where={
-            "$and": [
-                {"project_id": {"$eq": column_definition.project_id}},
-                {"table": {"$eq": table_name}},
-                {"column": {"$eq": column_name}},
-                {"version": {"$eq": column_definition.def_version}}
-            ]
-        })
-        
     @staticmethod
     def import_table_definitions(session, project_id: int, csv_reader, cur_version):
         """Import table definitions from CSV data"""
@@ -398,11 +568,15 @@ class DefService:
             DefinitionTable.def_waiting: True
         })
         
+        changed_column_defs = []
         for column in columns:
             column_def = session.query(DefinitionColumn).filter_by(project_id=project_id, def_table=table, def_column=column.col).first()
             # Performance optimization: only update if AI comment has changed
             if column_def and column_def.def_ai_comment != column.comment:
                 column_def.update(def_ai_comment=column.comment, def_waiting=True)
+                changed_column_defs.append(column_def)
+        table_defs = session.query(DefinitionTable).filter_by(project_id=project_id, def_table=table).all()
+        DefService.update_served_version_documents(session, project_id, table_defs, changed_column_defs)
         
         # First delete relations where table1 or table2 matches the table
         session.query(DefinitionRelation).filter_by(project_id=project_id, table1=table).delete()
@@ -445,19 +619,49 @@ class DefService:
         """Update document vector database"""
         from vector_stores import doc_def_store
         if is_delete:
-            doc_def_store.delete_documents(where={"id": doc_definition.id})
+            doc_def_store.delete_documents(where={
+                "$and": [
+                    {"project_id": {"$eq": doc_definition.project_id}},
+                    {"id": {"$eq": doc_definition.id}}
+                ]
+            })
         else:
-            doc_def_store.add_document(
-                document=doc_definition.def_doc,
-                metadata={
-                    "project_id": doc_definition.project_id,
-                    "id": doc_definition.id, 
-                    "content": doc_definition.def_doc,
-                    "def_selected": doc_definition.def_selected or False,
-                    "disabled": doc_definition.disabled or False
-                },
-                doc_id=str(doc_definition.id)
-            )
+            DefService.add_docs_vector_db([doc_definition])
+    
+    @staticmethod
+    def add_docs_vector_db(doc_definitions: list[DefinitionDoc]):
+        """Add or update document definitions in the vector store with one batch upsert"""
+        if not doc_definitions:
+            return
+        documents, metadatas, doc_ids = zip(*[DefService.doc_vector_document(doc_definition) for doc_definition in doc_definitions])
+        from vector_stores import doc_def_store
+        doc_def_store.add_documents(list(documents), list(metadatas), list(doc_ids))
+    
+    @staticmethod
+    def doc_vector_document(doc_definition: DefinitionDoc) -> tuple[str, dict, str]:
+        """Document, metadata and ID of a document definition in the vector store"""
+        return DefService.with_content_hash(
+            doc_definition.def_doc,
+            {
+                "project_id": doc_definition.project_id,
+                "id": doc_definition.id, 
+                "content": doc_definition.def_doc,
+                "def_selected": doc_definition.def_selected or False,
+                "disabled": doc_definition.disabled or False
+            },
+            str(doc_definition.id)
+        )
+    
+    @staticmethod
+    def versioned_doc_id(definition_id: int, def_version: int) -> str:
+        """ID of the vector document of a table or column definition, each index version has its own documents"""
+        return f"{definition_id}:{def_version}"
+    
+    @staticmethod
+    def with_content_hash(document: str, metadata: dict, doc_id: str) -> tuple[str, dict, str]:
+        """Add the content hash to the metadata of a vector document, refresh_index compares it to find changed rows"""
+        metadata["content_hash"] = vector_content_hash(document, metadata, get_embedding_provider().name)
+        return document, metadata, doc_id
     
     @staticmethod
     def add_doc_definition(session, project_id: int, def_doc, def_selected=False, disabled=False):
@@ -482,6 +686,7 @@ class DefService:
         
         # Delete vector database
         DefService.refresh_doc_vector_db(doc_definition, is_delete=True)
+        ProjectService.bump_index_generation(session, [doc_definition.project_id])
 
     @staticmethod
     def query_doc_definition(project_id, query):
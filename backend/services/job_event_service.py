@@ -0,0 +1,132 @@
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from services.job_notify_service import start_pg_listener
+import json
+import os
+import queue
+import threading
+
+# PostgreSQL channel used to publish job state transitions
+JOB_EVENT_CHANNEL = 'sqlwise_job_event'
+# Events buffered per subscriber, a subscriber that falls behind loses the oldest events
+SUBSCRIBER_QUEUE_SIZE = 100
+# NOTIFY payloads are limited to 8000 bytes
+MAX_ERROR_MESSAGE_LENGTH = 1000
+MAX_PAYLOAD_BYTES = 7900
+
+class JobEventService:
+    """
+    Push job state transitions and stage results to the subscribers of a task
+
+    On PostgreSQL events are published with NOTIFY by whichever process changes the job (web or
+    worker), each web process LISTENs once and fans the events out to its subscribers.
+    Other databases only deliver events published in the same process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # task_id -> queues of the subscribers
+        self._subscribers: dict[int, set[queue.Queue]] = {}
+        self.listening = False
+
+    def publish(self, session, job, result: dict = None):
+        """Publish the current state of a job, it is delivered when the session commits"""
+        self.publish_event(session, job.task_id, job.id, job.job_type, job.job_status, job.job_cost_time, job.error_message, result)
+
+    def publish_event(self, session, task_id: int, job_id: int, job_type: str, job_status: str,
+                      job_cost_time: int = 0, error_message: str = None, result: dict = None):
+        """
+        Publish a job state transition, it is delivered when the session commits
+        
+        A result too large for a notification is left out and flagged with result_omitted,
+        subscribers then fetch the task.
+        """
+        job_event = {
+            'task_id': task_id,
+            'job_id': job_id,
+            'job_type': job_type,
+            'job_status': job_status,
+            'job_cost_time': job_cost_time,
+            'error_message': error_message[:MAX_ERROR_MESSAGE_LENGTH] if error_message else None,
+            'result': result,
+        }
+        payload = json.dumps(job_event, ensure_ascii=False)
+        if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            job_event['result'] = None
+            job_event['result_omitted'] = True
+            payload = json.dumps(job_event, ensure_ascii=False)
+        if session.get_bind().dialect.name == 'postgresql':
+            # NOTIFY is transactional, listeners receive it after commit
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {'channel': JOB_EVENT_CHANNEL, 'payload': payload})
+        else:
+            session.info.setdefault('job_events', []).append(job_event)
+
+    def streams_available(self, engine) -> bool:
+        """
+        Whether event streams can be served by this process
+
+        Jobs run in other processes, so events need PostgreSQL NOTIFY to arrive. An open stream
+        holds its worker, which only gthread workers can afford.
+        """
+        if os.getenv('GUNICORN_WORKER_CLASS', 'sync') != 'gthread':
+            return False
+        self.start_listener(engine)
+        return self.listening
+
+    def subscribe(self, task_id: int) -> queue.Queue:
+        """Subscribe to the job events of a task"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, task_id: int, subscriber: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[task_id]
+
+    def dispatch(self, job_event: dict):
+        """Fan an event out to the subscribers of its task in this process"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_event['task_id'], ()))
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(job_event)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def start_listener(self, engine):
+        """Start receiving the events published by other processes, only supported on PostgreSQL"""
+        with self._lock:
+            if engine.dialect.name != 'postgresql' or self.listening:
+                return
+            self.listening = True
+        start_pg_listener(engine, [JOB_EVENT_CHANNEL], self._on_notify, name='job-event-listener')
+
+    def _on_notify(self, channel: str, payload: str):
+        try:
+            self.dispatch(json.loads(payload))
+        except Exception as e:
+            print(f"invalid job event: {str(e)}")
+
+job_event_service = JobEventService()
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_after_commit(session):
+    """Deliver the events published in this process once they are committed"""
+    for job_event in session.info.pop('job_events', []):
+        job_event_service.dispatch(job_event)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def clear_after_rollback(session, previous_transaction):
+    """Rolled back transitions are not published"""
+    session.info.pop('job_events', None)
@@ -0,0 +1,103 @@
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from typing import Callable
+import select
+import threading
+import time
+
+# PostgreSQL channel used to announce new jobs
+JOB_CHANNEL = 'sqlwise_job'
+
+class JobNotifyService:
+    """
+    Wake up job workers as soon as a job is created
+
+    On PostgreSQL new jobs are announced with NOTIFY, workers on any host block on LISTEN.
+    Workers in the same process are woken directly, other databases rely on the workers' poll fallback.
+    """
+    def __init__(self):
+        self.wakeup_event = threading.Event()
+        self.listening = False
+
+    def notify(self, session, job_type: str):
+        """Announce a new job, it is delivered when the session commits"""
+        if session.get_bind().dialect.name == 'postgresql':
+            # NOTIFY is transactional, listeners receive it after commit
+            session.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': JOB_CHANNEL, 'payload': job_type})
+        session.info['job_notify'] = True
+
+    def wake(self):
+        """Wake up the workers of this process"""
+        self.wakeup_event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Block until a job is announced or the timeout expires
+
+        Returns:
+            bool: True if woken by a notification
+        """
+        woken = self.wakeup_event.wait(timeout)
+        self.wakeup_event.clear()
+        return woken
+
+    def start_listener(self, engine):
+        """Start listening for job notifications, only supported on PostgreSQL"""
+        if engine.dialect.name != 'postgresql' or self.listening:
+            return
+        self.listening = True
+        # Jobs may have been created while not listening, check on every (re)connect
+        start_pg_listener(engine, [JOB_CHANNEL], lambda channel, payload: self.wake(),
+                          on_connect=self.wake, name='job-listener')
+
+def start_pg_listener(engine, channels: list[str], on_notify: Callable[[str, str], None],
+                      on_connect: Callable[[], None] = None, name: str = 'pg-listener'):
+    """
+    Call on_notify(channel, payload) for every notification on the channels, in a background thread
+
+    Args:
+        on_connect: Called after (re)connecting, notifications sent while disconnected are lost
+    """
+    url = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    threading.Thread(target=_listen, args=(url, channels, on_notify, on_connect), name=name, daemon=True).start()
+
+def _listen(url: str, channels: list[str], on_notify: Callable[[str, str], None], on_connect: Callable[[], None] = None):
+    import psycopg2
+    import psycopg2.extensions
+    while True:
+        conn = None
+        try:
+            # Dedicated connection, LISTEN needs to stay on the same session
+            conn = psycopg2.connect(url)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                for channel in channels:
+                    cursor.execute(f"LISTEN {channel}")
+            if on_connect:
+                on_connect()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    on_notify(notify.channel, notify.payload)
+        except Exception as e:
+            print(f"listener on {', '.join(channels)} error: {str(e)}, reconnecting")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+job_notify_service = JobNotifyService()
+
+@event.listens_for(Session, 'after_commit')
+def wake_after_commit(session):
+    """Wake up in-process workers once the new job is visible"""
+    if session.info.pop('job_notify', False):
+        job_notify_service.wake()
+
+@event.listens_for(Session, 'after_soft_rollback')
+def clear_after_rollback(session, previous_transaction):
+    """Rolled back jobs are not announced"""
+    session.info.pop('job_notify', None)
@@ -4,10 +4,24 @@ from models.task_sql import TaskSQL
 from models.task_table import TaskTable
 from models.task_column import TaskColumn
 from models.task import Task
-from enums import JobStatus
+from enums import JobStatus, JobPriority
 from dto.job_dto import JobDTO
 from database import db
 from enums import JobType
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_, case, func, insert
+from services.job_notify_service import job_notify_service
+from services.job_event_service import job_event_service
+import math
+
+# Share of the claims each priority gets when several priorities are waiting
+PRIORITY_WEIGHTS = {
+    JobPriority.INTERACTIVE.value: 8,
+    JobPriority.NORMAL.value: 4,
+    JobPriority.BULK.value: 1,
+}
+# Job types that run in the background unless a priority is given
+BULK_JOB_TYPES = [JobType.LEARN_FROM_SQL.value]
 
 class JobService:
     @staticmethod
@@ -24,11 +38,19 @@ class JobService:
                      error_message=job.error_message, 
                      created_at=job.created_at, 
                      updated_at=job.updated_at,
-                     job_cost_time=job.job_cost_time)
+                     job_cost_time=job.job_cost_time,
+                     priority=job.priority)
             
     @staticmethod
-    def create_job(session, task_id: int, job_type: str):
-        """Create a new job"""
+    def create_job(session, task_id: int, job_type: str, priority: int = None, worker_id: str = None, lease_seconds: int = 0) -> Job:
+        """
+        Create a new job
+        
+        Args:
+            priority: Job priority, defaults to bulk for background job types and normal otherwise
+            worker_id: Create the job already claimed by this worker, it is run in-process instead of being queued
+            lease_seconds: Lease length of the claim
+        """
         task = session.query(Task).get(task_id)
         if not task:
             raise ValueError("Task does not exist")
@@ -39,7 +61,6 @@ class JobService:
             session.query(TaskSQL).filter(TaskSQL.task_id == task_id).delete()
         if job_type == JobType.GEN_RELATED_COLUMNS.value:
             task.related_columns = None
-            session.commit()
         if job_type == JobType.MATCH_DDL.value:
             session.query(TaskTable).filter(TaskTable.task_id == task_id).delete()
             session.query(TaskColumn).filter(TaskColumn.task_id == task_id).delete()
@@ -47,25 +68,255 @@ class JobService:
             task.sql = None
             task.sql_right = None
             task.sql_refer = None
-            session.commit()
         if job_type == JobType.LEARN_FROM_SQL.value:
             task.learn_result = None
-            session.commit()
         
         # Create job
-        job = Job(project_id=task.project_id, task_id=task_id, job_type=job_type)
+        if priority is None:
+            priority = JobPriority.BULK.value if job_type in BULK_JOB_TYPES else JobPriority.NORMAL.value
+        job = Job(project_id=task.project_id, task_id=task_id, job_type=job_type, priority=priority)
+        if worker_id:
+            job.job_status = JobStatus.RUNNING.value
+            job.worker_id = worker_id
+            job.claimed_at = datetime.now(timezone.utc)
+            job.lease_expires_at = job.claimed_at + timedelta(seconds=lease_seconds)
+            job.attempts = 1
+        else:
+            job.job_status = JobStatus.INIT.value
         session.add(job)
+        session.flush()
+        job_event_service.publish(session, job)
+        if not worker_id:
+            # Wake up workers instead of waiting for their next poll
+            job_notify_service.notify(session, job_type)
+        return job
+        
+    @staticmethod
+    def create_jobs(session, project_id: int, task_ids: list[int], job_type: str, priority: int = JobPriority.NORMAL.value):
+        """
+        Create a job for each of many new tasks with a single bulk insert
         
+        Unlike create_job nothing is cleaned up, the tasks must not have run yet.
+        """
+        if not task_ids:
+            return
+        now = datetime.now(timezone.utc)
+        # Bulk inserts skip the ORM events, timestamps are set here
+        created_jobs = session.execute(insert(Job).returning(Job.id, Job.task_id), [{
+            'project_id': project_id,
+            'task_id': task_id,
+            'job_type': job_type,
+            'job_status': JobStatus.INIT.value,
+            'priority': priority,
+            'created_at': now,
+            'updated_at': now,
+        } for task_id in task_ids]).all()
+        for job_id, task_id in created_jobs:
+            job_event_service.publish_event(session, task_id, job_id, job_type, JobStatus.INIT.value)
+        job_notify_service.notify(session, job_type)
+    
+    @staticmethod
+    def start_pipeline(session, task_id: int, priority: int = JobPriority.NORMAL.value):
+        """Create the first jobs of a task's pipeline, the stages are declared in jobs.job_pipeline"""
+        from jobs.job_pipeline import pipeline
+        pipeline.start(session, task_id, priority)
+    
+    @staticmethod
+    def get_latest_job(session, task_id: int, job_type: str) -> Job | None:
+        """Get the latest job of a type for a task"""
+        return session.query(Job)\
+            .filter(Job.task_id == task_id, Job.job_type == job_type)\
+            .order_by(Job.id.desc())\
+            .first()
+    
     @staticmethod
     def cancel_job(session, job_id: int):
         """Cancel a job"""
-        session.query(Job).filter(Job.id == job_id).update({'job_status': JobStatus.CANCELED.value})
+        job = session.query(Job).get(job_id)
+        if not job:
+            return
+        job.job_status = JobStatus.CANCELED.value
+        job_event_service.publish(session, job)
+        
+    @staticmethod
+    def claimable_filter(now: datetime, max_attempts: int):
+        """Jobs that can be claimed: not started yet, or running with an expired lease and attempts left"""
+        return or_(
+            Job.job_status == JobStatus.INIT.value,
+            and_(Job.job_status == JobStatus.RUNNING.value, Job.lease_expires_at < now, Job.attempts < max_attempts)
+        )
+    
+    @staticmethod
+    def fail_abandoned_jobs(session, max_attempts: int) -> int:
+        """
+        Fail the jobs whose lease expired after their last attempt, a job that keeps crashing its worker is not retried forever
+        
+        Returns:
+            int: Number of jobs failed
+        """
+        now = datetime.now(timezone.utc)
+        jobs = session.query(Job).filter(
+            Job.job_status == JobStatus.RUNNING.value,
+            Job.lease_expires_at < now,
+            Job.attempts >= max_attempts
+        ).with_for_update(skip_locked=True).all()
+        for job in jobs:
+            job.job_status = JobStatus.FAIL.value
+            job.error_message = f"Worker lost after {job.attempts} attempts"
+            job_event_service.publish(session, job)
+        session.commit()
+        return len(jobs)
+
+    @staticmethod
+    def claim_jobs(session, worker_id: str, capacity: dict[str, int], limit: int, lease_seconds: int,
+                   job_classes: dict[str, str] = None, max_attempts: int = 3,
+                   fair_share_window: int = 300) -> list[tuple[int, str]]:
+        """
+        Atomically claim jobs for a worker
+
+        On PostgreSQL the candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED, so several
+        workers can claim concurrently without blocking each other or claiming the same job.
+        Other databases (SQLite) fall back to a compare-and-set update per job.
+
+        Jobs are picked by weighted fair queuing: every (project, priority) pair is a queue, and
+        the n-th waiting job of a queue is due at (served + n) / weight of its priority, where
+        served is the number of jobs of the queue claimed in the last fair_share_window seconds.
+        A queue that was just served falls behind the others, so with one free slot the projects
+        take turns instead of the oldest job always winning, and bulk jobs still get their share
+        while interactive work is waiting.
+
+        Args:
+            worker_id: ID of the claiming worker
+            capacity: Number of jobs that can be claimed per concurrency class
+            limit: Maximum number of jobs to claim in total
+            lease_seconds: Lease length, the job can be reclaimed by another worker after it expires
+            job_classes: Job type -> concurrency class, by default each job type is its own class
+            max_attempts: Jobs with an expired lease are not reclaimed after this many claims
+            fair_share_window: Seconds of claim history counted as served
+
+        Returns:
+            list[tuple[int, str]]: (job ID, job type) of claimed jobs, in scheduling order
+        """
+        if limit <= 0 or not capacity:
+            return []
+        if job_classes is None:
+            job_classes = {job_type: job_type for job_type in capacity}
+        job_types = [job_type for job_type, job_class in job_classes.items() if capacity.get(job_class, 0) > 0]
+        if not job_types:
+            return []
+        now = datetime.now(timezone.utc)
+        claimable = JobService.claimable_filter(now, max_attempts)
+        # Position of each job in its (project, priority) queue
+        ranked = session.query(
+                Job.id.label('id'),
+                func.row_number().over(partition_by=(Job.project_id, Job.priority), order_by=Job.id).label('queue_rank')
+            )\
+            .filter(claimable, Job.job_type.in_(job_types))\
+            .subquery()
+        # Jobs claimed recently per (project, priority) queue
+        served = session.query(
+                Job.project_id.label('project_id'),
+                Job.priority.label('priority'),
+                func.count(Job.id).label('served')
+            )\
+            .filter(Job.claimed_at >= now - timedelta(seconds=fair_share_window))\
+            .group_by(Job.project_id, Job.priority)\
+            .subquery()
+        # Virtual finish time: served and queue position divided by the weight (multiplied by the integer stride)
+        weight_lcm = math.lcm(*PRIORITY_WEIGHTS.values())
+        strides = {priority: weight_lcm // weight for priority, weight in PRIORITY_WEIGHTS.items()}
+        virtual_time = (func.coalesce(served.c.served, 0) + ranked.c.queue_rank) * case(strides, value=Job.priority, else_=weight_lcm)
+        query = session.query(Job.id, Job.job_type, Job.task_id)\
+            .join(ranked, ranked.c.id == Job.id)\
+            .outerjoin(served, and_(served.c.project_id == Job.project_id, served.c.priority == Job.priority))\
+            .filter(ranked.c.queue_rank <= limit)\
+            .order_by(virtual_time, Job.priority.desc(), Job.id)\
+            .limit(sum(capacity.values()))
+        values = {
+            Job.job_status: JobStatus.RUNNING.value,
+            Job.worker_id: worker_id,
+            Job.lease_expires_at: now + timedelta(seconds=lease_seconds),
+            Job.attempts: Job.attempts + 1,
+            Job.claimed_at: now,
+            Job.updated_at: now,
+        }
+        
+        if db.engine.dialect.name == 'postgresql':
+            candidates = query.with_for_update(skip_locked=True, of=Job).all()
+        else:
+            candidates = query.all()
+        
+        # Respect the capacity of each concurrency class
+        remaining = dict(capacity)
+        selected = []
+        for job_id, job_type, task_id in candidates:
+            if len(selected) >= limit:
+                break
+            job_class = job_classes[job_type]
+            if remaining.get(job_class, 0) > 0:
+                remaining[job_class] -= 1
+                selected.append((job_id, job_type, task_id))
+        
+        claimed = []
+        if db.engine.dialect.name == 'postgresql':
+            # Rows are locked by us, unselected candidates are released on commit
+            if selected:
+                session.query(Job).filter(Job.id.in_([job_id for job_id, _, _ in selected]))\
+                    .update(values, synchronize_session=False)
+            claimed = selected
+        else:
+            for job_id, job_type, task_id in selected:
+                count = session.query(Job).filter(Job.id == job_id, claimable)\
+                    .update(values, synchronize_session=False)
+                if count == 1:
+                    claimed.append((job_id, job_type, task_id))
+        for job_id, job_type, task_id in claimed:
+            job_event_service.publish_event(session, task_id, job_id, job_type, JobStatus.RUNNING.value)
+        session.commit()
+        return [(job_id, job_type) for job_id, job_type, _ in claimed]
+
+    @staticmethod
+    def finish_job(session, job_id: int, worker_id: str, job_status: str, job_cost_time: int = 0, error_message: str = None,
+                   result: dict = None) -> bool:
+        """
+        Record the outcome of a job claimed by a worker
         
+        Args:
+            result: Result of the stage, sent to the subscribers of the task with the job event
+        
+        Returns:
+            bool: False if the job is no longer running under the worker's claim (canceled or reclaimed)
+        """
+        job = session.query(Job).get(job_id)
+        if job.job_status != JobStatus.RUNNING.value or job.worker_id != worker_id:
+            return False
+        job.job_status = job_status
+        job.job_cost_time = job_cost_time
+        job.error_message = error_message
+        job_event_service.publish(session, job, result)
+        return True
+
+    @staticmethod
+    def renew_leases(session, worker_id: str, lease_seconds: int):
+        """Extend the lease of running jobs held by the worker"""
+        now = datetime.now(timezone.utc)
+        session.query(Job).filter(
+            Job.worker_id == worker_id,
+            Job.job_status == JobStatus.RUNNING.value
+        ).update({Job.lease_expires_at: now + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+
     @staticmethod
-    def get_init_job_ids() -> list[int]:
-        """Get all job IDs with initialization status"""
-        session = db.session
-        return [job.id for job in session.query(Job).filter(Job.job_status == JobStatus.INIT.value).all()]
+    def release_job(session, job_id: int, worker_id: str):
+        """Give a claimed job back to the queue"""
+        job = session.query(Job).get(job_id)
+        if job.job_status != JobStatus.RUNNING.value or job.worker_id != worker_id:
+            return
+        job.job_status = JobStatus.INIT.value
+        job.worker_id = None
+        job.lease_expires_at = None
+        # The job was never started
+        job.attempts = max(job.attempts - 1, 0)
+        job_event_service.publish(session, job)
     
     @staticmethod
     def get_jobs(session, task_id: int) -> list[JobDTO]:
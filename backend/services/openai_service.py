@@ -1,13 +1,29 @@
-from typing import List
+from typing import AsyncIterator, List
 from openai.types.chat import ChatCompletionMessageParam
 from openai.types.chat.completion_create_params import ResponseFormat
 from openai import AsyncOpenAI
+import asyncio
 import os
+import threading
+import weakref
 
-openai_client = AsyncOpenAI(
-    api_key=os.getenv('OPENAI_API_KEY'),
-    base_url=os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')  # Support custom base URL
-)
+# One client per event loop: the client's connection pool is bound to the loop it was first used on,
+# loops are long-lived (see utils.event_loop) so connections are reused across jobs
+_openai_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_openai_clients_lock = threading.Lock()
+
+def get_openai_client() -> AsyncOpenAI:
+    """Get the OpenAI client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _openai_clients_lock:
+        client = _openai_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                base_url=os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')  # Support custom base URL
+            )
+            _openai_clients[loop] = client
+        return client
 
 default_model = os.getenv('OPENAI_API_MODEL')
 default_temperature = float(os.getenv('OPENAI_API_TEMPERATURE', 0.5))
@@ -33,7 +49,7 @@ class OpenAIService:
             str: AI response text
         """
         try:
-            response = await openai_client.chat.completions.create(
+            response = await get_openai_client().chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
@@ -42,4 +58,37 @@ class OpenAIService:
             print('openai response', response)
             return response.choices[0].message.content
         except Exception as e:
-            raise Exception(f"OpenAI API call failed: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"OpenAI API call failed: {str(e)}")
+
+    @staticmethod
+    async def chat_completion_stream(
+        messages: List[ChatCompletionMessageParam], 
+        model: str = default_model,
+        temperature: float = default_temperature,
+        response_format: ResponseFormat = None
+    ) -> AsyncIterator[str]:
+        """
+        Call OpenAI Chat Completion API in streaming mode
+        
+        Args:
+            messages: List of messages
+            model: Model name
+            temperature: Temperature parameter
+            response_format: Response format parameter
+            
+        Returns:
+            AsyncIterator[str]: AI response text, chunk by chunk
+        """
+        try:
+            stream = await get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                response_format=response_format,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise Exception(f"OpenAI API call failed: {str(e)}")
@@ -9,6 +9,7 @@ from models.definition_rule import DefinitionRule
 from models.task import Task
 import csv
 import os
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 class ProjectService:
@@ -48,7 +49,12 @@ class ProjectService:
         session.query(DefinitionDoc).filter(DefinitionDoc.project_id == id).delete()
         session.query(DefinitionRule).filter(DefinitionRule.project_id == id).delete()
         session.query(Task).filter(Task.project_id == id).delete()
-        
+
+        # Delete the vectors of the project, sharded stores drop its collections
+        from vector_stores import registry, COLLECTIONS
+        for collection_name in COLLECTIONS:
+            registry.get(collection_name).delete_documents({"project_id": id})
+
         # Delete project
         session.delete(project)
 
@@ -65,6 +71,24 @@ class ProjectService:
             raise ValueError(f"Project with id {id} not found")
         return project
 
+    @staticmethod
+    def get_index_generation(session: Session, id: int) -> tuple[int, int]:
+        """Current version and index generation of a project, retrieval results are cached per generation"""
+        row = session.query(Project.cur_version, Project.index_generation).filter(Project.id == id).first()
+        if not row:
+            raise ValueError(f"Project with id {id} not found")
+        return row.cur_version, row.index_generation or 0
+
+    @staticmethod
+    def bump_index_generation(session: Session, ids) -> None:
+        """Invalidate cached retrieval results of projects whose vector index changed, takes effect on commit"""
+        ids = {id for id in ids if id is not None}
+        if not ids:
+            return
+        session.query(Project).filter(Project.id.in_(ids)).update({
+            Project.index_generation: func.coalesce(Project.index_generation, 0) + 1
+        }, synchronize_session=False)
+
     @classmethod
     def create_example_project(cls, session: Session):
         """Create an example project with predefined tables, columns, documents and rules"""
@@ -8,8 +8,10 @@ from models.definition_doc import DefinitionDoc
 import json
 from utils.utils import extract_json
 from models.job import Job
-from enums import JobType, JobStatus
+from enums import JobType, JobStatus, JobPriority
 from services.job_service import JobService
+from services.job_notify_service import job_notify_service
+from services.project_service import ProjectService
 from database import OptimisticLockException
 from models.task_sql import TaskSQL
 from models.task_doc import TaskDoc
@@ -19,13 +21,29 @@ from dto.learn_result_dto import LearnResultDTO
 from models.definition_table import DefinitionTable
 from models.definition_column import DefinitionColumn
 from models.definition_relation import DefinitionRelation
-from utils.structure_util import get_doc_content, get_rule_structure_markdown
-from utils.utils import reverse_relation_type
+from utils.structure_util import get_doc_content, get_rule_structure_markdown, format_doc_content, format_sql_log_structure_markdown
+from utils.utils import reverse_relation_type, extract_partial_json_string, vector_content_hash
+from vectors.embedding import get_embedding_provider
 from models.project import Project
 from database import db
 from dto.update_task_query import UpdateTaskQueryDTO
+from dto.pipeline_context_dto import PipelineContextDTO
+from dto.batch_progress_dto import BatchProgressDTO
+from sqlalchemy import insert, func
+from datetime import datetime, timezone
+import uuid
+import asyncio
+import os
+import socket
+import time
+from typing import AsyncIterator, Callable
 from utils.prompt_util import get_gen_sql, get_gen_related_columns, get_learn, get_optimize_question
 
+# Seconds before SQL generation is failed, in the job workers and when streamed
+GENERATE_SQL_TIMEOUT = 300
+# Streamed SQL generation is not renewed by the job workers, the lease outlasts its timeout so it is never reclaimed while streaming
+STREAM_LEASE_SECONDS = GENERATE_SQL_TIMEOUT + 60
+
 # 1. AI: AI generates all possible "table names & field names"
 # 2. Vector DB: First query tables, iterate through each table name to get top n results 
 # 3. Vector DB: Then filter columns within these tables
@@ -35,7 +53,7 @@ class TaskService:
         task = session.query(Task).get(query.task_id)
         
         if query.question_modified:
-            task.update(question=query.question)
+            task.update(question=query.question, question_translation=None, question_embedding=None, question_embedding_model=None)
         if query.question_supplement_modified:
             task.update(question_supplement=query.question_supplement)
         if query.options_modified:
@@ -103,14 +121,38 @@ class TaskService:
         """
         from vector_stores import sql_log_store
         if task.sql_refer and not is_delete:
-            sql_log_store.add_document(task.question, {
-                "project_id": task.project_id,
-                "task_id": str(task.id), 
-                "question": task.question, 
-                "sql": task.sql,
-            }, str(task.id))
+            sql_log_store.add_document(*TaskService.task_vector_document(task))
         else:
-            sql_log_store.delete_documents({"task_id": str(task.id)})
+            sql_log_store.delete_documents({"$and": [{"project_id": task.project_id}, {"task_id": str(task.id)}]})
+    
+    @staticmethod
+    def refresh_tasks_vector_db(tasks: list[Task]):
+        """
+        Update the vector database for several tasks, with one batch upsert and one delete
+        """
+        from vector_stores import sql_log_store
+        refer_tasks = [task for task in tasks if task.sql_refer]
+        if refer_tasks:
+            documents, metadatas, doc_ids = zip(*[TaskService.task_vector_document(task) for task in refer_tasks])
+            sql_log_store.add_documents(list(documents), list(metadatas), list(doc_ids))
+        other_task_ids_by_project = {}
+        for task in tasks:
+            if not task.sql_refer:
+                other_task_ids_by_project.setdefault(task.project_id, []).append(str(task.id))
+        for project_id, other_task_ids in other_task_ids_by_project.items():
+            sql_log_store.delete_documents({"$and": [{"project_id": project_id}, {"task_id": {"$in": other_task_ids}}]})
+    
+    @staticmethod
+    def task_vector_document(task: Task) -> tuple[str, dict, str]:
+        """Document, metadata and ID of a referable task in the SQL log store"""
+        metadata = {
+            "project_id": task.project_id,
+            "task_id": str(task.id), 
+            "question": task.question, 
+            "sql": task.sql,
+        }
+        metadata["content_hash"] = vector_content_hash(task.question, metadata, get_embedding_provider().name)
+        return task.question, metadata, str(task.id)
     
     @staticmethod
     async def optimize_question(question: str) -> str:
@@ -130,12 +172,14 @@ class TaskService:
         return optimized_question
     
     @staticmethod
-    async def create_task(session, project_id: int, question: str, question_supplement: str, options: dict = None, rules: list[int] = None) -> int:
+    async def create_task(session, project_id: int, question: str, question_supplement: str, options: dict = None, rules: list[int] = None,
+                          priority: int = JobPriority.NORMAL.value) -> int:
         """
         Create a new task
         
         Args:
             question: User's question
+            priority: Priority of the task's jobs
             
         Returns:
             Task: Created task instance
@@ -144,25 +188,89 @@ class TaskService:
         session.add(task)
         session.commit()
         
-        # Create job
-        JobService.create_job(session, task.id, JobType.MATCH_DOC.value)
+        # Create jobs
+        JobService.start_pipeline(session, task.id, priority)
 
         return task.id
             
     @staticmethod
-    async def re_create_task(session, task_id: int) -> int:
+    def create_tasks(session, project_id: int, questions: list[str], question_supplement: str = None, options: dict = None, rules: list[int] = None,
+                     priority: int = JobPriority.BULK.value) -> tuple[str, list[int]]:
+        """
+        Create a batch of tasks and their first jobs with bulk inserts, in the session's transaction
+        
+        Args:
+            questions: User questions, one task per question
+            priority: Priority of the tasks' jobs
+            
+        Returns:
+            tuple[str, list[int]]: Batch ID and IDs of the created tasks, in the order of the questions
+        """
+        if not questions:
+            raise ValueError('questions is empty')
+        batch_id = uuid.uuid4().hex
+        options = options or {}
+        now = datetime.now(timezone.utc)
+        # Bulk inserts skip the ORM events, timestamps are set here
+        task_ids = session.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), [{
+            'project_id': project_id,
+            'question': question,
+            'question_supplement': question_supplement,
+            'options': options,
+            'rules': rules,
+            'batch_id': batch_id,
+            'created_at': now,
+            'updated_at': now,
+        } for question in questions]).all()
+        
+        # Create jobs
+        from jobs.job_pipeline import pipeline
+        pipeline.start_tasks(session, project_id, task_ids, options, priority)
+        
+        return batch_id, task_ids
+    
+    @staticmethod
+    def get_batch_progress(session, batch_id: str) -> BatchProgressDTO:
+        """Get the aggregate progress of a batch of tasks"""
+        task_count, sql_task_count = session.query(func.count(Task.id), func.count(Task.sql))\
+            .filter(Task.batch_id == batch_id)\
+            .one()
+        if task_count == 0:
+            raise ValueError('Batch not found')
+        job_counts = dict(session.query(Job.job_status, func.count(Job.id))
+                          .join(Task, Task.id == Job.task_id)
+                          .filter(Task.batch_id == batch_id)
+                          .group_by(Job.job_status)
+                          .all())
+        active_task_count = session.query(func.count(func.distinct(Job.task_id)))\
+            .join(Task, Task.id == Job.task_id)\
+            .filter(Task.batch_id == batch_id, Job.job_status.in_([JobStatus.INIT.value, JobStatus.RUNNING.value]))\
+            .scalar()
+        return BatchProgressDTO(batch_id=batch_id,
+                                task_count=task_count,
+                                finished_task_count=task_count - active_task_count,
+                                sql_task_count=sql_task_count,
+                                init_job_count=job_counts.get(JobStatus.INIT.value, 0),
+                                running_job_count=job_counts.get(JobStatus.RUNNING.value, 0),
+                                success_job_count=job_counts.get(JobStatus.SUCCESS.value, 0),
+                                fail_job_count=job_counts.get(JobStatus.FAIL.value, 0),
+                                canceled_job_count=job_counts.get(JobStatus.CANCELED.value, 0))
+            
+    @staticmethod
+    async def re_create_task(session, task_id: int, priority: int = JobPriority.NORMAL.value) -> int:
         """
         Recreate a task
         
         Args:
             task_id: Task ID
+            priority: Priority of the task's jobs
         """
         task = session.query(Task).get(task_id)
         if not task:
             raise ValueError('Task not found')
         
-        # Create job
-        JobService.create_job(session, task_id, JobType.MATCH_DOC.value)
+        # Create jobs
+        JobService.start_pipeline(session, task_id, priority)
 
         return task_id
             
@@ -187,6 +295,7 @@ class TaskService:
         
         # Delete vector database
         TaskService.refresh_task_vector_db(task, is_delete=True)
+        ProjectService.bump_index_generation(session, [task.project_id])
             
     @staticmethod
     def get_task_detail(session, task_id: int) -> TaskDTO:
@@ -309,7 +418,7 @@ class TaskService:
         session.commit()
         
     @staticmethod
-    async def gen_related_columns_async(session, job_id: int):
+    async def gen_related_columns_async(session, job_id: int, context: PipelineContextDTO = None):
         """
         Async task to generate related columns
         """
@@ -324,10 +433,10 @@ class TaskService:
         # Build prompt
         
         # Get associated documents
-        doc_content = get_doc_content(session, task_id)
+        doc_content = TaskService.get_context_doc_content(session, task_id, context)
         
         # Get associated SQL records
-        sql_content = get_sql_log_structure_markdown(session, task_id)
+        sql_content = TaskService.get_context_sql_content(session, task_id, context)
         
         prompt = get_gen_related_columns(question, question_supplement, doc_content, sql_content)
         # Write to job
@@ -358,9 +467,99 @@ class TaskService:
             raise OptimisticLockException()
         task.update(related_columns=json.dumps(related_columns))
         session.commit()
+        if context:
+            context.related_columns = related_columns
+        return {'related_columns': related_columns}
+        
+    @staticmethod
+    def get_context_doc_content(session, task_id: int, context: PipelineContextDTO = None) -> str:
+        """Get associated document content, from the pipeline context if the documents were matched in it"""
+        if context and context.doc_contents is not None:
+            return format_doc_content(context.doc_contents)
+        return get_doc_content(session, task_id)
+    
+    @staticmethod
+    def get_context_sql_content(session, task_id: int, context: PipelineContextDTO = None) -> str:
+        """Get associated SQL records, from the pipeline context if the SQL logs were matched in it"""
+        if context and context.sql_logs is not None:
+            return format_sql_log_structure_markdown(context.sql_logs)
+        return get_sql_log_structure_markdown(session, task_id)
+        
+    @staticmethod
+    async def get_question_embeddings(session, store, tasks: list[Task]) -> list[list[float]]:
+        """
+        Get the embeddings of the tasks' questions
+        
+        The question is translated and embedded once per task and cached on the task, every
+        retrieval stage then queries by embedding. All collections share the same embedding function.
+        Stages running in parallel (MATCH_DOC and MATCH_SQL_LOG) serialize on the task rows, the
+        first one computes the embedding and the others read it. Embeddings of another embedding
+        model are recomputed.
+        """
+        model = get_embedding_provider().name
+        def is_missing(task: Task) -> bool:
+            return task.question_embedding is None or task.question_embedding_model != model
+        if not any(is_missing(task) for task in tasks):
+            return [task.question_embedding for task in tasks]
+        # Lock in ID order so stages locking overlapping batches don't deadlock, and reload what was committed meanwhile
+        session.query(Task)\
+            .filter(Task.id.in_([task.id for task in tasks]))\
+            .order_by(Task.id)\
+            .with_for_update()\
+            .populate_existing()\
+            .all()
+        missing_tasks = [task for task in tasks if is_missing(task)]
+        if missing_tasks:
+            # The translation does not depend on the model, only questions never translated are translated
+            untranslated_tasks = [task for task in missing_tasks if task.question_translation is None]
+            if untranslated_tasks:
+                translations = await store.translate_texts([task.question for task in untranslated_tasks])
+                for task, translation in zip(untranslated_tasks, translations):
+                    task.question_translation = translation
+            embeddings = await store.embed_texts([task.question_translation for task in missing_tasks])
+            for task, embedding in zip(missing_tasks, embeddings):
+                # Cache only, not a change of the task: the version is not bumped
+                task.question_embedding = embedding
+                task.question_embedding_model = model
+        # Release the row locks
+        session.commit()
+        return [task.question_embedding for task in tasks]
+    
+    @staticmethod
+    async def query_task_documents(session, task: Task, job_type: str, store, n_results: int, where: dict) -> dict:
+        """
+        Query an async vector store with the embedding of the task's question
+        
+        Tasks of a batch are queried together with the other tasks of the batch waiting for the same stage.
+        """
+        if not task.batch_id:
+            return await store.query_embeddings(await TaskService.get_question_embeddings(session, store, [task]),
+                                                n_results=n_results, where=where)
         
+        from services.batch_query_service import batch_query_service
+        async def load_batch():
+            sibling_task_ids = session.query(Job.task_id)\
+                .join(Task, Task.id == Job.task_id)\
+                .filter(Task.batch_id == task.batch_id,
+                        Task.id != task.id,
+                        Job.job_type == job_type,
+                        Job.job_status.in_([JobStatus.INIT.value, JobStatus.RUNNING.value]))\
+                .distinct()\
+                .order_by(Job.task_id)\
+                .limit(batch_query_service.max_batch_size - 1)\
+                .all()
+            sibling_tasks = session.query(Task)\
+                .filter(Task.id.in_([sibling_task_id for sibling_task_id, in sibling_task_ids]))\
+                .order_by(Task.id)\
+                .all()
+            batch_tasks = [task] + sibling_tasks
+            embeddings = await TaskService.get_question_embeddings(session, store, batch_tasks)
+            results = await store.query_embeddings(embeddings, n_results=n_results, where=where)
+            return batch_query_service.split_results(results, [batch_task.id for batch_task in batch_tasks])
+        return await batch_query_service.get_result_async(job_type, task.batch_id, task.id, load_batch)
+    
     @staticmethod
-    async def match_doc_async(session, job_id: int):
+    async def match_doc_async(session, job_id: int, context: PipelineContextDTO = None):
         """
         Async task to match documents
         """
@@ -369,17 +568,18 @@ class TaskService:
         
         task = session.query(Task).get(task_id)
         # Vector database: query top 5 results
-        from vector_stores import doc_def_store
-        results = doc_def_store.query_documents(task.question,
-                                                n_results=task.options.get('matchDocCount', 5),
-                                                where={"$and": [
-                                                    {"project_id": {"$eq": task.project_id}},
-                                                    {"def_selected": {"$eq": False}},
-                                                    {"disabled": {"$eq": False}}
-                                                ]})
+        from vector_stores import async_doc_def_store
+        results = await TaskService.query_task_documents(session, task, JobType.MATCH_DOC.value, async_doc_def_store,
+                                                   n_results=task.options.get('matchDocCount', 5),
+                                                   where={"$and": [
+                                                       {"project_id": {"$eq": task.project_id}},
+                                                       {"def_selected": {"$eq": False}},
+                                                       {"disabled": {"$eq": False}}
+                                                   ]})
         
         # Record added doc_ids to prevent duplicates
         added_doc_ids = set()
+        doc_contents = []
         
         # Add default selected (and not disabled) docs
         doc_definitions = session.query(DefinitionDoc).filter_by(project_id=task.project_id, def_selected=True, disabled=False).all()
@@ -388,6 +588,7 @@ class TaskService:
                 task_doc = TaskDoc(project_id=task.project_id, task_id=task_id, doc_id=doc_definition.id)
                 session.add(task_doc)
                 added_doc_ids.add(doc_definition.id)
+                doc_contents.append(doc_definition.def_doc)
                 
         # Add new docs
         for result in results['metadatas'][0]:
@@ -396,12 +597,16 @@ class TaskService:
                 task_doc = TaskDoc(project_id=task.project_id, task_id=task_id, doc_id=doc_id)
                 session.add(task_doc)
                 added_doc_ids.add(doc_id)
+                doc_contents.append(result['content'])
             
         session.commit()
+        if context:
+            context.doc_contents = doc_contents
+        return {'doc_ids': list(added_doc_ids)}
         
         
     @staticmethod
-    async def match_sql_log_async(session, job_id: int):
+    async def match_sql_log_async(session, job_id: int, context: PipelineContextDTO = None):
         """
         Async task to match SQL logs
         """
@@ -411,20 +616,23 @@ class TaskService:
         task = session.query(Task).get(task_id)
         
         # Vector database: query top 5 results
-        from vector_stores import sql_log_store
-        results = sql_log_store.query_documents(task.question,
-                                                n_results=task.options.get('matchSqlLogCount', 5),
-                                                where={"project_id": task.project_id})
+        from vector_stores import async_sql_log_store
+        results = await TaskService.query_task_documents(session, task, JobType.MATCH_SQL_LOG.value, async_sql_log_store,
+                                                   n_results=task.options.get('matchSqlLogCount', 5),
+                                                   where={"project_id": task.project_id})
         
         # Add new task_sql records
         for result in results['metadatas'][0]:
             task_sql = TaskSQL(project_id=task.project_id, task_id=task_id, sql_id=result['task_id'])
             session.add(task_sql)
         session.commit()
+        if context:
+            context.sql_logs = [(result['question'], result['sql']) for result in results['metadatas'][0]]
+        return {'sql_ids': [result['task_id'] for result in results['metadatas'][0]]}
         
         
     @staticmethod
-    async def match_ddl_async(session, job_id: int):
+    async def match_ddl_async(session, job_id: int, context: PipelineContextDTO = None):
         """
         Async task to match DDL
         """
@@ -432,53 +640,47 @@ class TaskService:
         task_id = job.task_id
         
         task = session.query(Task).get(task_id)
-        related_columns_info = json.loads(task.related_columns)
+        if context and context.related_columns is not None:
+            related_columns_info = context.related_columns
+        else:
+            related_columns_info = json.loads(task.related_columns)
         related_tables = related_columns_info['tables']
         related_columns = related_columns_info['columns']
         
         # Vector database: first query tables, then query top 5 results for each table
-        from vector_stores import table_def_store, column_def_store
+        # One batched query for all related tables and one for all related columns
+        from vector_stores import async_table_def_store, async_column_def_store
         all_table_set = set()
+        # Documents of the current index version only, a newer version may be half built
+        cur_version = session.query(Project.cur_version).filter(Project.id == task.project_id).scalar()
         
-        # Use thread pool to concurrently query tables
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def query_table(related_table):
-            table_name = related_table['t']
-            table_description = related_table['d']
-            results = table_def_store.query_documents(f"Table: {table_name}\nDescription: {table_description}",
-                                                      n_results=task.options.get('matchDdlTableCount', 5),
-                                                      where={"$and": [
-                                                          {"project_id": {"$eq": task.project_id}},
-                                                          {"disabled": {"$eq": False}}
-                                                      ]})
-            return [metadata['table'] for metadata in results['metadatas'][0]]
-            
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            table_results = list(executor.map(query_table, related_tables))
-            for tables in table_results:
-                all_table_set.update(tables)
+        if related_tables:
+            table_results = await async_table_def_store.query_documents_batch(
+                [f"Table: {related_table['t']}\nDescription: {related_table['d']}" for related_table in related_tables],
+                n_results=task.options.get('matchDdlTableCount', 5),
+                where={"$and": [
+                    {"project_id": {"$eq": task.project_id}},
+                    {"version": {"$eq": cur_version}},
+                    {"disabled": {"$eq": False}}
+                ]})
+            for metadatas in table_results['metadatas']:
+                all_table_set.update(metadata['table'] for metadata in metadatas)
         
         # Vector database: query top 5 results for each table
         all_columns = {}
         
-        def query_column(related_column):
-            table_name = related_column['t']
-            column_name = related_column['c']
-            column_description = related_column['d']
-            results = column_def_store.query_documents(f"Table: {table_name}\nColumn: {column_name}\nDescription: {column_description}",
-                                                       n_results=task.options.get('matchDdlColumnCount', 5),
-                                                       where={"$and": [{"table": {"$in": list(all_table_set)}},
-                                                                      {"project_id": task.project_id}]})
-            return [(result['table'], result['column']) for result in results['metadatas'][0]]
-            
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            column_results = list(executor.map(query_column, related_columns))
-            for table_column_pairs in column_results:
-                for table, column in table_column_pairs:
-                    table_set = all_columns.get(table, set())
-                    table_set.add(column)
-                    all_columns[table] = table_set
+        if related_columns and all_table_set:
+            column_results = await async_column_def_store.query_documents_batch(
+                [f"Table: {related_column['t']}\nColumn: {related_column['c']}\nDescription: {related_column['d']}" for related_column in related_columns],
+                n_results=task.options.get('matchDdlColumnCount', 5),
+                where={"$and": [{"table": {"$in": list(all_table_set)}},
+                               {"project_id": task.project_id},
+                               {"version": cur_version}]})
+            for metadatas in column_results['metadatas']:
+                for result in metadatas:
+                    table_set = all_columns.get(result['table'], set())
+                    table_set.add(result['column'])
+                    all_columns[result['table']] = table_set
                 
         # Add new task_table records
         for table_name in all_columns:
@@ -499,28 +701,35 @@ class TaskService:
                 )
                 session.add(task_column)
         session.commit()
+        if context:
+            context.selected_columns = all_columns
+        return {'columns': {table_name: list(column_names) for table_name, column_names in all_columns.items()}}
         
     @staticmethod
-    async def generate_sql_async(session, job_id: int):
+    async def generate_sql_async(session, job_id: int, context: PipelineContextDTO = None, on_partial_sql: Callable[[str], None] = None):
         """
         Async task to generate SQL
+        
+        Args:
+            on_partial_sql: Stream the completion and call it with the SQL generated so far
         """
         job = session.query(Job).get(job_id)
         job_version = job.version
         task_id = job.task_id
         
         # Get table structure markdown
-        table_structure_markdown = get_table_structure_markdown(session, task_id)
-        relation_structure_markdown = get_relation_structure_markdown(session, task_id)
+        selected_columns = context.selected_columns if context else None
+        table_structure_markdown = get_table_structure_markdown(session, task_id, selected_columns)
+        relation_structure_markdown = get_relation_structure_markdown(session, task_id, selected_columns)
         
         task = session.query(Task).get(task_id)
         project = session.query(Project).get(task.project_id)
         task_version = task.version
 
         # Get associated documents
-        doc_content = get_doc_content(session, task_id)
+        doc_content = TaskService.get_context_doc_content(session, task_id, context)
         # Get associated SQL records
-        sql_content = get_sql_log_structure_markdown(session, task_id)
+        sql_content = TaskService.get_context_sql_content(session, task_id, context)
         
         # Get rules structure markdown
         rules_structure_markdown = get_rule_structure_markdown(session, task)
@@ -548,12 +757,27 @@ class TaskService:
 
         # Call OpenAI to generate SQL
         from services.openai_service import OpenAIService
-        sql_str = await OpenAIService.chat_completion(
-            messages=[{"role": "user", "content": prompt}],
-            response_format={
-                'type': 'json_object'
-            },
-        )
+        if on_partial_sql:
+            sql_str = ''
+            partial_sql = ''
+            async for chunk in OpenAIService.chat_completion_stream(
+                messages=[{"role": "user", "content": prompt}],
+                response_format={
+                    'type': 'json_object'
+                },
+            ):
+                sql_str += chunk
+                new_partial_sql = extract_partial_json_string(sql_str, 'sql')
+                if new_partial_sql and new_partial_sql != partial_sql:
+                    partial_sql = new_partial_sql
+                    on_partial_sql(partial_sql)
+        else:
+            sql_str = await OpenAIService.chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                response_format={
+                    'type': 'json_object'
+                },
+            )
         
         # Check job status
         if not TaskService.check_job_status(session, job_id):
@@ -571,14 +795,81 @@ class TaskService:
             raise OptimisticLockException()
         task.update(sql=sql_content)
         session.commit()
+        return {'sql': sql_content}
         
 
     @staticmethod
-    def req_generate_sql(session, task_id: int):
+    async def generate_sql_stream(session, task_id: int) -> AsyncIterator[dict]:
         """
-        Request to generate SQL
-        """ 
-        # Get task
+        Generate SQL for a task in this process, streaming the SQL as it is produced
+        
+        A GENERATE_SQL job is created already claimed by this process, so it shows up in the
+        task's jobs but is not picked up by the job workers.
+        
+        Returns:
+            AsyncIterator[dict]: Events: {'event': 'partial', 'sql': ...} while generating,
+                then {'event': 'done', 'sql': ...} with the formatted SQL or {'event': 'error', 'message': ...}
+        """
+        TaskService.check_can_generate_sql(session, task_id)
+        task = session.query(Task).get(task_id)
+        task.update(sql_right=None, sql_refer=None)
+        # Claimed by this web process, the job workers leave it alone
+        stream_worker_id = f"stream-{socket.gethostname()}-{os.getpid()}"
+        job = JobService.create_job(session, task_id, JobType.GENERATE_SQL.value,
+                                    priority=JobPriority.INTERACTIVE.value,
+                                    worker_id=stream_worker_id,
+                                    lease_seconds=STREAM_LEASE_SECONDS)
+        job_id = job.id
+        session.commit()
+        
+        partial_sqls = asyncio.Queue()
+        generation = asyncio.ensure_future(TaskService.generate_sql_async(session, job_id, on_partial_sql=partial_sqls.put_nowait))
+        partial_sql_task = None
+        start_time = time.time()
+        try:
+            while not generation.done():
+                remaining = start_time + GENERATE_SQL_TIMEOUT - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Stage {JobType.GENERATE_SQL.value} timed out after {GENERATE_SQL_TIMEOUT} seconds")
+                partial_sql_task = asyncio.ensure_future(partial_sqls.get())
+                await asyncio.wait([partial_sql_task, generation], timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if partial_sql_task.done():
+                    yield {'event': 'partial', 'sql': partial_sql_task.result()}
+                else:
+                    partial_sql_task.cancel()
+            result = generation.result()
+        except Exception as e:
+            if not generation.done():
+                # Timed out, stop generating before the session is reused
+                generation.cancel()
+                await asyncio.gather(generation, return_exceptions=True)
+            session.rollback()
+            JobService.finish_job(session, job_id, stream_worker_id, JobStatus.FAIL.value, error_message=str(e))
+            session.commit()
+            yield {'event': 'error', 'message': str(e)}
+            return
+        finally:
+            if partial_sql_task is not None and not partial_sql_task.done():
+                partial_sql_task.cancel()
+                await asyncio.gather(partial_sql_task, return_exceptions=True)
+            if not generation.done():
+                # The client went away, stop generating before the session is reused, then hand the job over to the job workers
+                generation.cancel()
+                await asyncio.gather(generation, return_exceptions=True)
+                session.rollback()
+                JobService.release_job(session, job_id, stream_worker_id)
+                job_notify_service.notify(session, JobType.GENERATE_SQL.value)
+                session.commit()
+        
+        job_cost_time = int((time.time() - start_time) * 1000)
+        JobService.finish_job(session, job_id, stream_worker_id, JobStatus.SUCCESS.value, job_cost_time, result=result)
+        session.commit()
+        task = session.query(Task).get(task_id)
+        yield {'event': 'done', 'sql': task.sql}
+    
+    @staticmethod
+    def check_can_generate_sql(session, task_id: int):
+        """Check that SQL can be generated for the task"""
         task = session.query(Task).get(task_id)
         if not task:
             raise ValueError('Task not found')
@@ -586,6 +877,14 @@ class TaskService:
         last_job = session.query(Job).filter(Job.task_id == task_id).order_by(Job.created_at.desc()).first()
         if last_job and last_job.job_status != JobStatus.SUCCESS.value and last_job.job_status != JobStatus.FAIL.value:
             raise ValueError('last job is running')
+    
+    @staticmethod
+    def req_generate_sql(session, task_id: int):
+        """
+        Request to generate SQL
+        """ 
+        TaskService.check_can_generate_sql(session, task_id)
+        task = session.query(Task).get(task_id)
         
         # Reset sql_right and sql_refer
         task.update(sql_right=None, sql_refer=None)
@@ -623,7 +922,7 @@ class TaskService:
         Update task question
         """
         task = session.query(Task).get(task_id)
-        task.update(question=question, question_supplement=question_supplement)
+        task.update(question=question, question_supplement=question_supplement, question_translation=None, question_embedding=None, question_embedding_model=None)
         
     @staticmethod
     def update_task_doc(session, task_id: int, doc_ids: list[int]):
@@ -675,7 +974,7 @@ class TaskService:
                 JobService.create_job(session, task_id, JobType.LEARN_FROM_SQL.value)
         
     @staticmethod
-    async def learn_from_sql_async(session, job_id: int):
+    async def learn_from_sql_async(session, job_id: int, context: PipelineContextDTO = None):
         """
         Async task to learn from SQL
         """
@@ -723,6 +1022,7 @@ class TaskService:
         if not task.learn_result:   
             task.update(learn_result=json.dumps(resp_json, ensure_ascii=False))
             session.commit()
+        return {'learn_result': resp_json}
 
     @staticmethod
     def accept_learn_result(session, task_id: int, learn_result: LearnResultDTO):
@@ -1,13 +1,26 @@
+import asyncio
+import httpx
 import os
 import requests
+import threading
 import uuid
+import weakref
 from typing import Optional
 
+# Request limits of the translator service
+MAX_BATCH_TEXTS = 100
+MAX_BATCH_CHARACTERS = 10000
+
 class TranslateService:
     def __init__(self):
         self.subscription_key = os.getenv('AZURE_TRANSLATOR_KEY')
         self.endpoint = os.getenv('AZURE_TRANSLATOR_ENDPOINT', 'https://api.cognitive.microsofttranslator.com')
         self.location = os.getenv('AZURE_TRANSLATOR_LOCATION', 'global')
+        # Keep-alive connection pool shared by all jobs of the worker
+        self.http_session = requests.Session()
+        # Async clients are bound to the event loop they were first used on, one per loop
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._async_clients_lock = threading.Lock()
         
     # check if the service is active
     def is_active(self) -> bool:
@@ -47,10 +60,143 @@ class TranslateService:
             'text': text
         }]
 
-        response = requests.post(constructed_url, params=params, headers=headers, json=body)
+        response = self.http_session.post(constructed_url, params=params, headers=headers, json=body)
         response.raise_for_status()
         
         translations = response.json()
         return translations[0]['translations'][0]['text'] 
+
+    def translate_batch(self, texts: list[str], target_language: str, source_language: Optional[str] = None) -> list[str]:
+        """
+        Translate several texts, sent in as few requests as the service limits allow
+        
+        Args:
+            texts: Texts to translate
+            target_language: Target language code (e.g., 'en', 'zh-Hans')
+            source_language: Source language code (optional)
+            
+        Returns:
+            Translated texts, in the same order
+        """
+        constructed_url = self.endpoint + '/translate'
+
+        params = {
+            'api-version': '3.0',
+            'to': target_language
+        }
+        
+        if source_language:
+            params['from'] = source_language
+
+        translated_texts = []
+        for chunk in self._chunk_texts(texts):
+            headers = {
+                'Ocp-Apim-Subscription-Key': self.subscription_key,
+                'Ocp-Apim-Subscription-Region': self.location,
+                'Content-type': 'application/json',
+                'X-ClientTraceId': str(uuid.uuid4())
+            }
+            body = [{'text': text} for text in chunk]
+            response = self.http_session.post(constructed_url, params=params, headers=headers, json=body)
+            response.raise_for_status()
+            translated_texts.extend(item['translations'][0]['text'] for item in response.json())
+        return translated_texts
+
+    def translate_batch_or_keep(self, texts: list[str], target_language: str) -> tuple[list[str], int]:
+        """
+        Translate several texts, texts that fail to translate are kept as is
+        
+        A request that fails is retried text by text, so one text the service rejects (e.g. over
+        the size limit) does not leave the other texts of its batch untranslated.
+        
+        Returns:
+            tuple[list[str], int]: Texts in the same order, number of texts kept untranslated
+        """
+        translated_texts = []
+        failed_count = 0
+        for chunk in self._chunk_texts(texts):
+            try:
+                translated_texts.extend(self.translate_batch(chunk, target_language))
+                continue
+            except Exception as e:
+                print(f"Failed to translate {len(chunk)} texts, retrying one by one: {str(e)}")
+            for text in chunk:
+                try:
+                    translated_texts.append(self.translate(text, target_language))
+                except Exception:
+                    translated_texts.append(text)
+                    failed_count += 1
+        return translated_texts, failed_count
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """Get the async HTTP client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(timeout=30)
+                self._async_clients[loop] = client
+            return client
+
+    async def translate_batch_async(self, texts: list[str], target_language: str, source_language: Optional[str] = None) -> list[str]:
+        """Same as translate_batch without blocking the event loop, the chunks are sent concurrently"""
+        constructed_url = self.endpoint + '/translate'
+
+        params = {
+            'api-version': '3.0',
+            'to': target_language
+        }
+        
+        if source_language:
+            params['from'] = source_language
+
+        client = self.get_async_client()
+        async def translate_chunk(chunk: list[str]) -> list[str]:
+            headers = {
+                'Ocp-Apim-Subscription-Key': self.subscription_key,
+                'Ocp-Apim-Subscription-Region': self.location,
+                'Content-type': 'application/json',
+                'X-ClientTraceId': str(uuid.uuid4())
+            }
+            body = [{'text': text} for text in chunk]
+            response = await client.post(constructed_url, params=params, headers=headers, json=body)
+            response.raise_for_status()
+            return [item['translations'][0]['text'] for item in response.json()]
+
+        chunks = await asyncio.gather(*[translate_chunk(chunk) for chunk in self._chunk_texts(texts)])
+        return [text for chunk in chunks for text in chunk]
+
+    async def translate_batch_or_keep_async(self, texts: list[str], target_language: str) -> tuple[list[str], int]:
+        """Same as translate_batch_or_keep without blocking the event loop"""
+        async def translate_chunk(chunk: list[str]) -> tuple[list[str], int]:
+            try:
+                return await self.translate_batch_async(chunk, target_language), 0
+            except Exception as e:
+                print(f"Failed to translate {len(chunk)} texts, retrying one by one: {str(e)}")
+            async def translate_text(text: str) -> tuple[str, int]:
+                try:
+                    return (await self.translate_batch_async([text], target_language))[0], 0
+                except Exception:
+                    return text, 1
+            results = await asyncio.gather(*[translate_text(text) for text in chunk])
+            return [text for text, _ in results], sum(failed for _, failed in results)
+
+        chunks = await asyncio.gather(*[translate_chunk(chunk) for chunk in self._chunk_texts(texts)])
+        return [text for chunk, _ in chunks for text in chunk], sum(failed_count for _, failed_count in chunks)
+
+    @staticmethod
+    def _chunk_texts(texts: list[str]):
+        """Split texts by the request limits of the service (100 texts, 10000 characters)"""
+        chunk = []
+        chunk_size = 0
+        for text in texts:
+            if chunk and (len(chunk) >= MAX_BATCH_TEXTS or chunk_size + len(text) > MAX_BATCH_CHARACTERS):
+                yield chunk
+                chunk = []
+                chunk_size = 0
+            chunk.append(text)
+            chunk_size += len(text)
+        if chunk:
+            yield chunk
     
 translate_service = TranslateService()
\ No newline at end of file
@@ -0,0 +1,81 @@
+from models.vector_build_stat import VectorBuildStat
+
+class AdaptiveBatchSizer:
+    """
+    Size the batches of the vector build from observed latency and backlog
+
+    Batches grow by a fixed step while they finish under the target latency and there is backlog
+    to fill them, and are halved as soon as the vector store or the translator slows down or fails (AIMD).
+    """
+    def __init__(self, initial_size: int, min_size: int, max_size: int, target_latency: float, step: int = None):
+        self.batch_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        # Additive increase, defaults to a tenth of the initial size
+        self.step = step or max(min_size, initial_size // 10, 1)
+        # Smoothed docs/s
+        self.rate = 0.0
+        # Latency of the last batch in seconds
+        self.latency = 0.0
+
+    def next_size(self, backlog: int) -> int:
+        """Size of the next batch, no larger than the backlog"""
+        return max(1, min(self.batch_size, backlog))
+
+    def record_success(self, count: int, latency: float):
+        """Adjust to a batch of count rows that took latency seconds"""
+        latency = max(latency, 0.001)
+        rate = count / latency
+        self.rate = rate if self.rate == 0 else self.rate * 0.7 + rate * 0.3
+        self.latency = latency
+        if latency > self.target_latency * 1.5:
+            self.batch_size = max(self.min_size, self.batch_size // 2)
+        elif latency < self.target_latency and count >= self.batch_size:
+            # Full batch under target: grow by one step
+            self.batch_size = min(self.max_size, self.batch_size + self.step)
+
+    def record_failure(self):
+        """Back off after a failed batch"""
+        self.batch_size = max(self.min_size, self.batch_size // 2)
+
+class VectorBuildService:
+    @staticmethod
+    def save_stat(session, entity: str, sizer: AdaptiveBatchSizer, backlog: int):
+        """Persist the throughput of an entity type, so every process can estimate the completion time"""
+        stat = session.query(VectorBuildStat).filter_by(entity=entity).first()
+        if not stat:
+            stat = VectorBuildStat(entity=entity)
+            session.add(stat)
+        stat.batch_size = sizer.batch_size
+        stat.rate = sizer.rate
+        stat.latency = int(sizer.latency * 1000)
+        stat.backlog = backlog
+
+    @staticmethod
+    def estimate(session, backlogs: dict[str, int]) -> tuple[float, int | None]:
+        """
+        Estimate the vector build rate and completion time
+
+        Entity types are built one after the other, so the ETA is the sum of backlog / rate per type.
+
+        Args:
+            backlogs: Entity type -> rows waiting for building
+
+        Returns:
+            tuple[float, int | None]: Rate in docs/s (weighted by backlog), seconds until all waiting rows
+                are searchable (None if a type with backlog has no measured rate yet)
+        """
+        rates = {stat.entity: stat.rate for stat in session.query(VectorBuildStat).all()}
+        total_backlog = sum(backlogs.values())
+        if total_backlog == 0:
+            return (max(rates.values()) if rates else 0.0), 0
+        eta = 0.0
+        for entity, backlog in backlogs.items():
+            if backlog == 0:
+                continue
+            rate = rates.get(entity, 0)
+            if rate <= 0:
+                return 0.0, None
+            eta += backlog / rate
+        return total_backlog / eta, int(eta)
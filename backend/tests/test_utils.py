@@ -0,0 +1,15 @@
+from utils.utils import vector_content_hash
+
+def test_vector_content_hash_changes_with_embedding_model():
+    metadata = {"project_id": 1, "table": "orders"}
+
+    assert vector_content_hash("Table: orders", metadata, "all-MiniLM-L6-v2") == \
+        vector_content_hash("Table: orders", dict(metadata), "all-MiniLM-L6-v2")
+    assert vector_content_hash("Table: orders", metadata, "all-MiniLM-L6-v2") != \
+        vector_content_hash("Table: orders", metadata, "hashing-384")
+
+def test_vector_content_hash_ignores_stored_hash():
+    metadata = {"project_id": 1, "table": "orders"}
+
+    assert vector_content_hash("Table: orders", {**metadata, "content_hash": "old"}, "hashing-384") == \
+        vector_content_hash("Table: orders", metadata, "hashing-384")
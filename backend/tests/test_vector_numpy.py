@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vectors.embedding import HashingEmbeddingProvider
+from vectors.vector_numpy import NumpyVectorStore
+
+def create_store(data_dir, name='column_def'):
+    return NumpyVectorStore(name, str(data_dir), HashingEmbeddingProvider(dimension=16))
+
+def test_add_documents_to_empty_collection(tmp_path):
+    store = create_store(tmp_path)
+    store.add_documents(['orders.id', 'orders.total'],
+                        [{'project_id': 1, 'column': 'id'}, {'project_id': 1, 'column': 'total'}],
+                        ['1', '2'])
+
+    results = store.query_documents('orders.total', n_results=1, where={'project_id': 1})
+
+    assert results['ids'][0] == ['2']
+    assert store.embeddings.shape == (2, 16)
+
+def test_add_documents_is_visible_to_other_stores(tmp_path):
+    create_store(tmp_path).add_documents(['orders.id'], [{'project_id': 1}], ['1'])
+    create_store(tmp_path).add_documents(['orders.total'], [{'project_id': 1}], ['2'])
+
+    store = create_store(tmp_path)
+
+    assert sorted(store.get_metadatas({'project_id': 1})) == ['1', '2']
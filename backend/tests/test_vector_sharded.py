@@ -0,0 +1,73 @@
+from vectors.vector_sharded import ShardedVectorStore
+from vectors.vector_store import VectorStore
+
+class MemoryVectorStore(VectorStore):
+    """Collection of a MemoryBackend, only keeps metadatas"""
+    def __init__(self, backend: 'MemoryBackend', collection_name: str):
+        self.backend = backend
+        self.collection_name = collection_name
+
+    @property
+    def metadatas(self) -> dict:
+        return self.backend.collections.setdefault(self.collection_name, {})
+
+    def add_document(self, document, metadata, doc_id):
+        self.add_documents([document], [metadata], [doc_id])
+
+    def add_documents(self, documents, metadatas, doc_ids):
+        self.metadatas.update(zip(doc_ids, metadatas))
+
+    def query_documents(self, query_text, n_results=1, where=None):
+        raise NotImplementedError
+
+    def embed_texts(self, texts):
+        raise NotImplementedError
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        raise NotImplementedError
+
+    def delete_documents(self, where):
+        raise NotImplementedError
+
+    def get_metadatas(self, where):
+        return dict(self.metadatas)
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        for doc_id in doc_ids:
+            self.metadatas.pop(doc_id, None)
+
+    def clear_collection(self):
+        self.metadatas.clear()
+
+    def drop_collection(self):
+        self.backend.collections.pop(self.collection_name, None)
+
+class MemoryBackend:
+    def __init__(self):
+        self.collections: dict[str, dict] = {}
+
+    def create_store(self, by_version: bool) -> ShardedVectorStore:
+        return ShardedVectorStore('column_def', by_version,
+                                  create_shard=lambda shard_name: MemoryVectorStore(self, shard_name),
+                                  list_collections=lambda: list(self.collections))
+
+def test_delete_project_drops_its_shards():
+    backend = MemoryBackend()
+    store = backend.create_store(by_version=False)
+    store.add_documents(['a', 'b'], [{'project_id': 1}, {'project_id': 2}], ['1', '2'])
+
+    store.delete_documents({'project_id': 1})
+
+    assert set(backend.collections) == {'column_def_p2'}
+
+def test_delete_project_drops_the_shards_of_every_version():
+    backend = MemoryBackend()
+    store = backend.create_store(by_version=True)
+    store.add_documents(['a', 'b', 'c'],
+                        [{'project_id': 1, 'version': 1}, {'project_id': 1, 'version': 2}, {'project_id': 2, 'version': 1}],
+                        ['1:1', '1:2', '2:1'])
+
+    store.delete_documents({'project_id': 1})
+
+    assert set(backend.collections) == {'column_def_p2_v1'}
+    assert store.get_metadatas({'project_id': 1}) == {}
@@ -0,0 +1,37 @@
+from typing import Any, AsyncIterator, Coroutine, Iterator
+import asyncio
+import threading
+
+_thread_local = threading.local()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the long-lived event loop of the current thread, created on first use
+
+    Unlike asyncio.run, the loop is kept between calls, so async clients bound to it
+    (OpenAI, HTTP pools) keep their connections across jobs and requests.
+    """
+    loop = getattr(_thread_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_local.loop = loop
+    return loop
+
+def run_async(coro: Coroutine) -> Any:
+    """Run a coroutine to completion on the event loop of the current thread"""
+    loop = get_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coro)
+
+def iterate_async(iterator: AsyncIterator) -> Iterator:
+    """Consume an async iterator from synchronous code (e.g. a streamed response) on the event loop of the current thread"""
+    loop = get_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(iterator.aclose())
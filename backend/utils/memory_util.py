@@ -0,0 +1,18 @@
+import os
+import resource
+import sys
+
+def get_rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        # Linux: second field of statm is the resident page count
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_bytes()
+
+def get_peak_rss_bytes() -> int:
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -40,6 +40,13 @@ def get_doc_content(session, task_id: int) -> str:
         content = task_doc.def_doc
         contents.append(content)
         
+    return format_doc_content(contents)
+
+def format_doc_content(contents: list[str]) -> str:
+    """
+    Join document contents
+    Separated by ---
+    """
     return "\n\n---\n\n".join(contents)
 
 def get_sql_log_structure_markdown(session, task_id: int) -> str:
@@ -53,23 +60,31 @@ def get_sql_log_structure_markdown(session, task_id: int) -> str:
         .filter(TaskSQL.task_id == task_id)\
         .all()
 
+    return format_sql_log_structure_markdown([(s.question, s.sql) for s in task_sqls])
+
+def format_sql_log_structure_markdown(sql_logs: list[tuple[str, str]]) -> str:
+    """
+    Format (question, sql) pairs as markdown
+    Separated by ---
+    """
     markdowns = []
-    for s in task_sqls:
+    for question, sql in sql_logs:
         markdown = []
-        markdown.append(f"## {fix_question(s.question)}\n")
+        markdown.append(f"## {fix_question(question)}\n")
         markdown.append("```sql")
-        markdown.append(f"{s.sql}")
+        markdown.append(f"{sql}")
         markdown.append("```")
         markdowns.append("\n".join(markdown))
         
     return "\n\n---\n\n".join(markdowns)
 
-def get_table_structure_markdown(session, task_id: int) -> str:
+def get_table_structure_markdown(session, task_id: int, selected_columns: dict[str, set[str]] = None) -> str:
     """
     Generate table structure description based on selected columns (markdown format)
     
     Args:
         task_id: Task ID
+        selected_columns: Selected columns (table name -> column names), read from the task if not given
         
     Returns:
         str: Table structure description in markdown format
@@ -83,14 +98,16 @@ def get_table_structure_markdown(session, task_id: int) -> str:
         } for c in session.query(DefinitionColumn).all()
     }
     
-    selected_columns = session.query(TaskColumn).filter(TaskColumn.task_id == task_id).all()
-    
     # Group selected columns by table
     table_columns = {}
-    for col in selected_columns:
-        if col.table_name not in table_columns:
-            table_columns[col.table_name] = []
-        table_columns[col.table_name].append(col.column_name)
+    if selected_columns is not None:
+        for table_name, columns in selected_columns.items():
+            table_columns[table_name] = sorted(columns)
+    else:
+        for col in session.query(TaskColumn).filter(TaskColumn.task_id == task_id).all():
+            if col.table_name not in table_columns:
+                table_columns[col.table_name] = []
+            table_columns[col.table_name].append(col.column_name)
     
     # Generate markdown
     markdowns = []
@@ -117,19 +134,23 @@ def get_table_structure_markdown(session, task_id: int) -> str:
     
     return "\n\n".join(markdowns)
     
-def get_relation_structure_markdown(session, task_id: int) -> str:
+def get_relation_structure_markdown(session, task_id: int, selected_columns: dict[str, set[str]] = None) -> str:
     """
     Generate table relationship description based on selected tables (markdown format)
     
     Args:
         task_id: Task ID
+        selected_columns: Selected columns (table name -> column names), read from the task if not given
         
     Returns:
         str: Table relationship description in markdown format
     """
     # Get task-related tables
-    selected_tables = session.query(TaskTable).filter(TaskTable.task_id == task_id).all()
-    table_names = [t.table_name for t in selected_tables]
+    if selected_columns is not None:
+        table_names = list(selected_columns.keys())
+    else:
+        selected_tables = session.query(TaskTable).filter(TaskTable.task_id == task_id).all()
+        table_names = [t.table_name for t in selected_tables]
     
     # Get related table relationship definitions
     relations = session.query(DefinitionRelation).filter(
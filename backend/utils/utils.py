@@ -1,4 +1,6 @@
+import hashlib
 import json
+import re
 
 def extract_json(text: str) -> dict:
     """
@@ -16,4 +18,55 @@ def reverse_relation_type(relation_type: str) -> str:
         '1-n': 'n-1',
         'n-1': '1-n',
         'n-n': 'n-n'
-    }[relation_type]
\ No newline at end of file
+    }[relation_type]
+
+# Escape sequences of JSON strings
+JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', '\\': '\\', '/': '/'}
+
+def extract_partial_json_string(text: str, key: str) -> str | None:
+    """
+    Extract the value of a string field from a possibly incomplete JSON object
+    
+    Used to show a value while the JSON is still being streamed.
+    Returns None if the field has not started yet.
+    """
+    match = re.search(r'"' + re.escape(key) + r'"\s*:\s*"', text)
+    if not match:
+        return None
+    chars = []
+    i = match.end()
+    while i < len(text):
+        c = text[i]
+        if c == '"':
+            break
+        if c == '\\':
+            # Incomplete escape sequences are left for the next chunk
+            if i + 1 >= len(text):
+                break
+            escape = text[i + 1]
+            if escape == 'u':
+                if i + 6 > len(text):
+                    break
+                try:
+                    chars.append(chr(int(text[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+                continue
+            chars.append(JSON_ESCAPES.get(escape, escape))
+            i += 2
+            continue
+        chars.append(c)
+        i += 1
+    return ''.join(chars)
+
+def vector_content_hash(document: str, metadata: dict, embedding_model: str) -> str:
+    """
+    Hash of a vector document and its metadata, changes whenever the document must be re-embedded or updated
+
+    Args:
+        embedding_model: Name of the embedding provider, documents are re-embedded when it changes
+    """
+    content = json.dumps([document, {key: value for key, value in metadata.items() if key != 'content_hash'}, embedding_model],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
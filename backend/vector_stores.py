@@ -1,39 +1,162 @@
 import os
-from vectors.vector_chroma import ChromaDBHandler
-from vectors.translate_wrapper import TranslateWrapper
-
-table_def_store = TranslateWrapper(
-    vector_store=ChromaDBHandler(
-        host=os.getenv("CHROMA_HOST", "localhost"),
-        port=int(os.getenv("CHROMA_PORT", "8000")),
-        collection_name="table_def"
-    ),
-    target_language='en'
-)
+import threading
+import time
+from vectors.embedding import get_embedding_provider
+from vectors.vector_store import AsyncVectorStore, ThreadedAsyncVectorStore, VectorStore
+from vectors.translate_wrapper import AsyncTranslateWrapper, TranslateWrapper
+from vectors.cached_vector_store import AsyncCachedVectorStore, CachedVectorStore, GenerationCache, RetrievalCache
 
-column_def_store = TranslateWrapper(
-    vector_store=ChromaDBHandler(
-    host=os.getenv("CHROMA_HOST", "localhost"),
-    port=int(os.getenv("CHROMA_PORT", "8000")),
-        collection_name="column_def"
-    ),
-    target_language='en'
-)
+# chroma: Chroma HTTP server, numpy: in-process store persisted under VECTOR_DATA_DIR
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# none: one collection shared by the projects, project: one collection per project,
+# project_version: one per project and index version for the definitions (dropped on cutover)
+VECTOR_SHARDING = os.getenv("VECTOR_SHARDING", "none")
+VERSIONED_COLLECTIONS = ("table_def", "column_def")
+
+def create_backend_store(collection_name: str) -> VectorStore:
+    if VECTOR_BACKEND == "numpy":
+        from vectors.vector_numpy import NumpyVectorStore
+        return NumpyVectorStore(
+            collection_name=collection_name,
+            data_dir=os.getenv("VECTOR_DATA_DIR", "vector_data")
+        )
+    if VECTOR_BACKEND == "chroma":
+        from vectors.vector_chroma import ChromaDBHandler
+        return ChromaDBHandler(
+            host=os.getenv("CHROMA_HOST", "localhost"),
+            port=int(os.getenv("CHROMA_PORT", "8000")),
+            collection_name=collection_name
+        )
+    raise ValueError(f"Unknown vector backend: {VECTOR_BACKEND}")
+
+def list_backend_collections() -> list[str]:
+    if VECTOR_BACKEND == "numpy":
+        from vectors.vector_numpy import list_numpy_collections
+        return list_numpy_collections(os.getenv("VECTOR_DATA_DIR", "vector_data"))
+    from vectors.vector_chroma import list_chroma_collections
+    return list_chroma_collections(os.getenv("CHROMA_HOST", "localhost"), int(os.getenv("CHROMA_PORT", "8000")))
+
+def create_vector_store(collection_name: str) -> VectorStore:
+    if VECTOR_SHARDING == "none":
+        return create_backend_store(collection_name)
+    if VECTOR_SHARDING in ("project", "project_version"):
+        from vectors.vector_sharded import ShardedVectorStore
+        return ShardedVectorStore(
+            collection_name=collection_name,
+            by_version=VECTOR_SHARDING == "project_version" and collection_name in VERSIONED_COLLECTIONS,
+            create_shard=create_backend_store,
+            list_collections=list_backend_collections
+        )
+    raise ValueError(f"Unknown vector sharding: {VECTOR_SHARDING}")
 
-doc_def_store = TranslateWrapper(
-    vector_store=ChromaDBHandler(
-        host=os.getenv("CHROMA_HOST", "localhost"),
-        port=int(os.getenv("CHROMA_PORT", "8000")),
-        collection_name="doc_def"
-    ),
-    target_language='en'
+def create_async_vector_store(collection_name: str, vector_store: VectorStore) -> AsyncVectorStore:
+    if VECTOR_BACKEND == "chroma" and VECTOR_SHARDING == "none":
+        from vectors.vector_chroma import AsyncChromaDBHandler
+        return AsyncChromaDBHandler(
+            host=os.getenv("CHROMA_HOST", "localhost"),
+            port=int(os.getenv("CHROMA_PORT", "8000")),
+            collection_name=collection_name
+        )
+    # In-process and sharded backends: run the calls off the event loop on the shared store
+    return ThreadedAsyncVectorStore(vector_store)
+
+# Shared by the stores, results are invalidated when the index generation of their project changes
+retrieval_cache = RetrievalCache(
+    max_size=int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
 )
 
-sql_log_store = TranslateWrapper(
-    vector_store=ChromaDBHandler(
-        host=os.getenv("CHROMA_HOST", "localhost"),
-        port=int(os.getenv("CHROMA_PORT", "8000")),
-        collection_name="sql_log"
-    ),
-    target_language='en'
-)
\ No newline at end of file
+def get_index_generation(project_id):
+    from database import db
+    from services.project_service import ProjectService
+    return ProjectService.get_index_generation(db.session, project_id)
+
+# Generations are looked up at most once per RETRIEVAL_GENERATION_TTL seconds and project
+index_generations = GenerationCache(get_index_generation, ttl=float(os.getenv("RETRIEVAL_GENERATION_TTL", "2")))
+
+def create_stores(collection_name: str) -> tuple[VectorStore, VectorStore, AsyncVectorStore]:
+    """Backend, synchronous and async store of a collection"""
+    vector_store = create_vector_store(collection_name)
+    store = CachedVectorStore(
+        vector_store=TranslateWrapper(
+            vector_store=vector_store,
+            target_language='en'
+        ),
+        collection_name=collection_name,
+        cache=retrieval_cache,
+        get_generation=index_generations.get
+    )
+    async_store = AsyncCachedVectorStore(
+        vector_store=AsyncTranslateWrapper(
+            vector_store=create_async_vector_store(collection_name, vector_store),
+            target_language='en'
+        ),
+        collection_name=collection_name,
+        cache=retrieval_cache,
+        get_generation=index_generations.get
+    )
+    return vector_store, store, async_store
+
+COLLECTIONS = ("table_def", "column_def", "doc_def", "sql_log")
+
+class VectorStoreRegistry:
+    """
+    Stores of the collections, created on first use
+
+    Creating a store does not connect, the backend connects on the first query (or on warmup).
+    Forked processes start with an empty registry so they never share connections with their parent.
+    """
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._stores: dict[str, tuple[VectorStore, VectorStore, AsyncVectorStore]] = {}
+
+    def _get_stores(self, collection_name: str) -> tuple[VectorStore, VectorStore, AsyncVectorStore]:
+        stores = self._stores.get(collection_name)
+        if stores is None:
+            if collection_name not in COLLECTIONS:
+                raise ValueError(f"Unknown collection: {collection_name}")
+            with self._lock:
+                stores = self._stores.get(collection_name)
+                if stores is None:
+                    stores = create_stores(collection_name)
+                    self._stores[collection_name] = stores
+        return stores
+
+    def get(self, collection_name: str) -> VectorStore:
+        return self._get_stores(collection_name)[1]
+
+    def get_async(self, collection_name: str) -> AsyncVectorStore:
+        return self._get_stores(collection_name)[2]
+
+    def warmup(self):
+        """Connect the collections and load the embedding model, failures are left to the first query"""
+        start_time = time.time()
+        for collection_name in COLLECTIONS:
+            try:
+                self._get_stores(collection_name)[0].warmup()
+            except Exception as e:
+                print(f"Failed to warm up vector store {collection_name}: {str(e)}")
+        try:
+            get_embedding_provider().warmup()
+        except Exception as e:
+            print(f"Failed to warm up embedding provider: {str(e)}")
+        print(f"Vector stores of process {os.getpid()} warmed up in {int((time.time() - start_time) * 1000)}ms")
+
+    def start_warmup(self):
+        """Warm up in the background, the process serves requests meanwhile"""
+        threading.Thread(target=self.warmup, name="vector-store-warmup", daemon=True).start()
+
+registry = VectorStoreRegistry()
+
+def __getattr__(name: str):
+    """table_def_store, async_table_def_store, ... resolve to the stores of the registry"""
+    if name.endswith("_store"):
+        if name.startswith("async_") and name[len("async_"):-len("_store")] in COLLECTIONS:
+            return registry.get_async(name[len("async_"):-len("_store")])
+        if name[:-len("_store")] in COLLECTIONS:
+            return registry.get(name[:-len("_store")])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
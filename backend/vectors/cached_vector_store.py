@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+import copy
+import hashlib
+import json
+import threading
+import time
+from array import array
+from vectors.vector_store import AsyncVectorStore, VectorStore
+
+class RetrievalCache:
+    """
+    Bounded LRU cache of vector query results with a TTL
+
+    Keys include the index generation of the project, so results are invalidated when the project
+    index changes. Writes in this process also invalidate the project right away, before the new
+    generation is committed.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires at, result)
+        self._results: OrderedDict[Hashable, tuple[float, dict]] = OrderedDict()
+        # project ID -> number of local writes, part of the key
+        self._local_generations: dict[Any, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def local_generation(self, project_id) -> int:
+        with self._lock:
+            return self._local_generations.get(project_id, 0)
+
+    def invalidate(self, project_ids=None):
+        """Invalidate the results of projects, None invalidates every project"""
+        with self._lock:
+            if project_ids is None:
+                self._results.clear()
+                return
+            for project_id in project_ids:
+                self._local_generations[project_id] = self._local_generations.get(project_id, 0) + 1
+
+    def get(self, key: Hashable) -> dict | None:
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._results[key]
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def set(self, key: Hashable, result: dict):
+        with self._lock:
+            self._results[key] = (time.time() + self.ttl, copy.deepcopy(result))
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._results),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+class GenerationCache:
+    """
+    Index generations of the projects, kept for ttl seconds
+
+    Looking the generation up for every query would run a database query per retrieval, on the
+    event loop for the async stores. Changes made in other processes are seen within ttl seconds,
+    writes in this process invalidate the retrieval cache right away anyway.
+    """
+    def __init__(self, get_generation: Callable[[Any], Hashable], ttl: float):
+        self.get_generation = get_generation
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # project ID -> (expires at, generation)
+        self._generations: dict[Any, tuple[float, Hashable]] = {}
+
+    def get(self, project_id) -> Hashable:
+        with self._lock:
+            entry = self._generations.get(project_id)
+        if entry is not None and entry[0] >= time.time():
+            return entry[1]
+        generation = self.get_generation(project_id)
+        with self._lock:
+            self._generations[project_id] = (time.time() + self.ttl, generation)
+        return generation
+
+def where_project_id(where):
+    """Project ID a Chroma where filter is restricted to, None if it is not restricted to one"""
+    if not isinstance(where, dict):
+        return None
+    condition = where.get('project_id')
+    if isinstance(condition, dict):
+        condition = condition.get('$eq')
+    if condition is not None:
+        return condition
+    for sub_where in where.get('$and', []):
+        project_id = where_project_id(sub_where)
+        if project_id is not None:
+            return project_id
+    return None
+
+class CachedStoreBase:
+    """
+    Cache keys and invalidation of the cached stores
+
+    Only queries restricted to one project are cached, keyed by collection, query, n_results,
+    where filter and the index generation of the project returned by get_generation(project_id).
+    """
+    def __init__(self, vector_store, collection_name: str, cache: RetrievalCache,
+                 get_generation: Callable[[Any], Hashable]):
+        self.vector_store = vector_store
+        self.collection_name = collection_name
+        self.cache = cache
+        self.get_generation = get_generation
+
+    def _cache_key(self, kind: str, query, n_results, where):
+        project_id = where_project_id(where)
+        if project_id is None:
+            return None
+        try:
+            generation = self.get_generation(project_id)
+        except Exception as e:
+            print(f"Failed to get index generation of project {project_id}, query not cached: {e}")
+            return None
+        return (self.collection_name, kind, query, n_results, json.dumps(where, sort_keys=True, default=str),
+                project_id, generation, self.cache.local_generation(project_id))
+
+    @staticmethod
+    def _embeddings_hash(query_embeddings) -> str:
+        digest = hashlib.sha256()
+        for embedding in query_embeddings:
+            digest.update(array('f', embedding).tobytes())
+        return digest.hexdigest()
+
+    def _invalidate(self, metadatas=None, where=None):
+        project_ids = {metadata.get('project_id') for metadata in metadatas} if metadatas else set()
+        if where is not None:
+            project_ids.add(where_project_id(where))
+        self.cache.invalidate(None if None in project_ids or not project_ids else project_ids)
+
+class CachedVectorStore(CachedStoreBase, VectorStore):
+    """Serve repeated queries of a project from the retrieval cache"""
+    def _cached_query(self, kind: str, query, n_results, where, run_query: Callable[[], dict]) -> dict:
+        key = self._cache_key(kind, query, n_results, where)
+        if key is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        result = run_query()
+        if key is not None:
+            self.cache.set(key, result)
+        return result
+
+    def add_document(self, document, metadata, doc_id):
+        self.vector_store.add_document(document, metadata, doc_id)
+        self._invalidate(metadatas=[metadata])
+
+    def add_documents(self, documents, metadatas, doc_ids):
+        self.vector_store.add_documents(documents, metadatas, doc_ids)
+        self._invalidate(metadatas=metadatas)
+
+    def query_documents(self, query_text, n_results=1, where=None):
+        return self._cached_query('text', query_text, n_results, where,
+                                  lambda: self.vector_store.query_documents(query_text, n_results, where))
+
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return self._cached_query('texts', tuple(query_texts), n_results, where,
+                                  lambda: self.vector_store.query_documents_batch(query_texts, n_results, where))
+
+    def translate_texts(self, texts):
+        return self.vector_store.translate_texts(texts)
+
+    def embed_texts(self, texts):
+        return self.vector_store.embed_texts(texts)
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        return self._cached_query('embeddings', self._embeddings_hash(query_embeddings), n_results, where,
+                                  lambda: self.vector_store.query_embeddings(query_embeddings, n_results, where))
+
+    def delete_documents(self, where):
+        self.vector_store.delete_documents(where)
+        self._invalidate(where=where)
+
+    def get_metadatas(self, where):
+        return self.vector_store.get_metadatas(where)
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        self.vector_store.delete_documents_by_ids(doc_ids, where)
+        self._invalidate(where=where)
+
+    def drop_collection(self):
+        self.vector_store.drop_collection()
+        self.cache.invalidate()
+
+    def clear_collection(self):
+        self.vector_store.clear_collection()
+        self.cache.invalidate()
+
+class AsyncCachedVectorStore(CachedStoreBase, AsyncVectorStore):
+    """Async variant of CachedVectorStore, sharing the same cache"""
+    async def _cached_query(self, kind: str, query, n_results, where, run_query: Callable[[], Awaitable[dict]]) -> dict:
+        key = self._cache_key(kind, query, n_results, where)
+        if key is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        result = await run_query()
+        if key is not None:
+            self.cache.set(key, result)
+        return result
+
+    async def add_documents(self, documents, metadatas, doc_ids):
+        await self.vector_store.add_documents(documents, metadatas, doc_ids)
+        self._invalidate(metadatas=metadatas)
+
+    async def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return await self._cached_query('texts', tuple(query_texts), n_results, where,
+                                        lambda: self.vector_store.query_documents_batch(query_texts, n_results, where))
+
+    async def translate_texts(self, texts):
+        return await self.vector_store.translate_texts(texts)
+
+    async def embed_texts(self, texts):
+        return await self.vector_store.embed_texts(texts)
+
+    async def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        return await self._cached_query('embeddings', self._embeddings_hash(query_embeddings), n_results, where,
+                                        lambda: self.vector_store.query_embeddings(query_embeddings, n_results, where))
+
+    async def delete_documents(self, where):
+        await self.vector_store.delete_documents(where)
+        self._invalidate(where=where)
@@ -0,0 +1,213 @@
+from abc import ABC, abstractmethod
+from array import array
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+class EmbeddingProvider(ABC):
+    """Embeds texts for the vector stores"""
+
+    # Identifies the model in the embedding cache, providers with different vectors need different names
+    name: str
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts, returns one vector per text"""
+        pass
+
+    def warmup(self):
+        """Load the model ahead of the first call"""
+        self.embed(["warmup"])
+
+class DefaultEmbeddingProvider(EmbeddingProvider):
+    """The Chroma default model (all-MiniLM-L6-v2, ONNX, runs locally)"""
+    name = 'all-MiniLM-L6-v2'
+
+    def __init__(self):
+        from chromadb.utils import embedding_functions
+        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+
+    def embed(self, texts):
+        return [[float(value) for value in embedding] for embedding in self.embedding_function(list(texts))]
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic feature hashing of words and word bigrams, for tests and offline use
+
+    No model is needed and the same text always gives the same vector, texts sharing words are close.
+    """
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    def embed(self, texts):
+        return [self._embed_text(text) for text in texts]
+
+    def _embed_text(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimension
+        words = re.findall(r'\w+', text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+class EmbeddingStats:
+    """Embedding work of this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.embed_time = 0.0
+
+    def record(self, texts: int, cache_hits: int, batches: int, embed_time: float):
+        with self._lock:
+            self.texts += texts
+            self.cache_hits += cache_hits
+            self.batches += batches
+            self.embed_time += embed_time
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'texts': self.texts,
+                'cache_hits': self.cache_hits,
+                'batches': self.batches,
+                'embed_time': round(self.embed_time, 3)
+            }
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """
+    Embed in batches and cache the vectors by hash of the embedded text
+
+    The cache is a SQLite file shared by the processes of the host, so re-indexing text that did not
+    change (refresh index, new definition versions) reuses the vectors instead of running the model.
+    """
+    def __init__(self, provider: EmbeddingProvider, batch_size: int, cache_path: str | None):
+        self.provider = provider
+        self.name = provider.name
+        self.batch_size = batch_size
+        self.cache_path = cache_path
+        self.stats = EmbeddingStats()
+        self._local = threading.local()
+        # SQLite connections must not be used across fork
+        os.register_at_fork(after_in_child=self._reset_connections)
+
+    def _reset_connections(self):
+        self._local = threading.local()
+
+    def warmup(self):
+        self.provider.warmup()
+        if self.cache_path:
+            self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.cache_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _get_cached(self, hashes: list[str]) -> dict[str, list[float]]:
+        if not self.cache_path or not hashes:
+            return {}
+        cached = {}
+        connection = self._connection()
+        # Stay below the SQLite limit of variables per statement
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            rows = connection.execute(
+                f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                [self.name, *chunk]).fetchall()
+            for text_hash, blob in rows:
+                cached[text_hash] = array('f', blob).tolist()
+        return cached
+
+    def _set_cached(self, embeddings: dict[str, list[float]]):
+        if not self.cache_path or not embeddings:
+            return
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)",
+                [(self.name, text_hash, array('f', embedding).tobytes()) for text_hash, embedding in embeddings.items()])
+
+    def embed(self, texts):
+        texts = list(texts)
+        hashes = [self.text_hash(text) for text in texts]
+        try:
+            embeddings = self._get_cached(list(set(hashes)))
+        except sqlite3.Error as e:
+            print(f"Failed to read embedding cache: {e}")
+            embeddings = {}
+        cache_hits = sum(1 for text_hash in hashes if text_hash in embeddings)
+
+        # Embed every distinct missing text once
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in embeddings:
+                missing.setdefault(text_hash, text)
+        missing_hashes = list(missing)
+        start_time = time.time()
+        batches = 0
+        for start in range(0, len(missing_hashes), self.batch_size):
+            batch_hashes = missing_hashes[start:start + self.batch_size]
+            batch_embeddings = self.provider.embed([missing[text_hash] for text_hash in batch_hashes])
+            embeddings.update(zip(batch_hashes, batch_embeddings))
+            batches += 1
+        embed_time = time.time() - start_time
+        if missing_hashes:
+            try:
+                self._set_cached({text_hash: embeddings[text_hash] for text_hash in missing_hashes})
+            except sqlite3.Error as e:
+                print(f"Failed to write embedding cache: {e}")
+        self.stats.record(len(texts), cache_hits, batches, embed_time)
+        return [embeddings[text_hash] for text_hash in hashes]
+
+def create_embedding_provider() -> EmbeddingProvider:
+    provider_name = os.getenv('EMBEDDING_PROVIDER', 'default')
+    if provider_name == 'default':
+        provider = DefaultEmbeddingProvider()
+    elif provider_name == 'hashing':
+        provider = HashingEmbeddingProvider(int(os.getenv('EMBEDDING_DIMENSION', '384')))
+    else:
+        raise ValueError(f"Unknown embedding provider: {provider_name}")
+    return CachedEmbeddingProvider(
+        provider,
+        batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', '64')),
+        cache_path=os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.db') or None
+    )
+
+_embedding_provider = None
+_embedding_provider_lock = threading.Lock()
+
+def _reset_embedding_provider_lock():
+    # The lock may be held by a warmup thread of the parent at fork
+    global _embedding_provider_lock
+    _embedding_provider_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_embedding_provider_lock)
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """The embedding provider shared by the vector stores, created on first use"""
+    global _embedding_provider
+    if _embedding_provider is None:
+        with _embedding_provider_lock:
+            if _embedding_provider is None:
+                _embedding_provider = create_embedding_provider()
+    return _embedding_provider
@@ -1,10 +1,20 @@
-from vectors.vector_store import VectorStore
+from vectors.vector_store import AsyncVectorStore, VectorStore
 
 class TranslateWrapper(VectorStore):
     def __init__(self, vector_store: VectorStore, target_language: str='en'):
         self.vector_store = vector_store
         self.target_language = target_language
     
+    def translate_texts(self, texts):
+        """Translate texts to the target language of the store, texts that fail to translate are kept as is"""
+        from services.translate_service import translate_service
+        if not translate_service.is_active():
+            return list(texts)
+        translated_texts, failed_count = translate_service.translate_batch_or_keep(list(texts), self.target_language)
+        if failed_count > 0:
+            print(f"{failed_count} of {len(translated_texts)} texts kept untranslated")
+        return translated_texts
+    
     def add_document(self, document, metadata, doc_id):
         from services.translate_service import translate_service
         try:
@@ -16,6 +26,9 @@ class TranslateWrapper(VectorStore):
             translated_document = document
         self.vector_store.add_document(translated_document, metadata, doc_id)
 
+    def add_documents(self, documents, metadatas, doc_ids):
+        self.vector_store.add_documents(self.translate_texts(documents), metadatas, doc_ids)
+
     def query_documents(self, query_text, n_results=1, where=None):
         from services.translate_service import translate_service
         try:
@@ -27,8 +40,58 @@ class TranslateWrapper(VectorStore):
             translated_query_text = query_text
         return self.vector_store.query_documents(translated_query_text, n_results, where)
 
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return self.vector_store.query_documents_batch(self.translate_texts(query_texts), n_results, where)
+
+    def embed_texts(self, texts):
+        """Embed texts, they are expected to be translated already (see translate_texts)"""
+        return self.vector_store.embed_texts(texts)
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        return self.vector_store.query_embeddings(query_embeddings, n_results, where)
+
     def delete_documents(self, where):
         self.vector_store.delete_documents(where)
 
+    def get_metadatas(self, where):
+        return self.vector_store.get_metadatas(where)
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        self.vector_store.delete_documents_by_ids(doc_ids, where)
+
+    def drop_collection(self):
+        self.vector_store.drop_collection()
+
     def clear_collection(self):
-        self.vector_store.clear_collection()
\ No newline at end of file
+        self.vector_store.clear_collection()
+
+class AsyncTranslateWrapper(AsyncVectorStore):
+    def __init__(self, vector_store: AsyncVectorStore, target_language: str='en'):
+        self.vector_store = vector_store
+        self.target_language = target_language
+
+    async def translate_texts(self, texts):
+        """Translate texts to the target language of the store, texts that fail to translate are kept as is"""
+        from services.translate_service import translate_service
+        if not translate_service.is_active():
+            return list(texts)
+        translated_texts, failed_count = await translate_service.translate_batch_or_keep_async(list(texts), self.target_language)
+        if failed_count > 0:
+            print(f"{failed_count} of {len(translated_texts)} texts kept untranslated")
+        return translated_texts
+
+    async def add_documents(self, documents, metadatas, doc_ids):
+        await self.vector_store.add_documents(await self.translate_texts(documents), metadatas, doc_ids)
+
+    async def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return await self.vector_store.query_documents_batch(await self.translate_texts(query_texts), n_results, where)
+
+    async def embed_texts(self, texts):
+        """Embed texts, they are expected to be translated already (see translate_texts)"""
+        return await self.vector_store.embed_texts(texts)
+
+    async def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        return await self.vector_store.query_embeddings(query_embeddings, n_results, where)
+
+    async def delete_documents(self, where):
+        await self.vector_store.delete_documents(where)
@@ -1,22 +1,113 @@
+import asyncio
+import os
+import threading
+import weakref
 import chromadb
-from vectors.vector_store import VectorStore
+from vectors.embedding import EmbeddingProvider, get_embedding_provider
+from vectors.vector_store import AsyncVectorStore, VectorStore
+
+# One HTTP client (and connection pool) per server, shared by the collections of this process
+_clients: dict[tuple[str, int], chromadb.ClientAPI] = {}
+_clients_lock = threading.Lock()
+
+def get_chroma_client(host, port) -> chromadb.ClientAPI:
+    """Get the shared client of a Chroma server, connected on first use"""
+    with _clients_lock:
+        client = _clients.get((host, port))
+        if client is None:
+            client = chromadb.HttpClient(host=host, port=port)
+            _clients[(host, port)] = client
+        return client
+
+def list_chroma_collections(host, port) -> list[str]:
+    """Names of the collections of a Chroma server"""
+    return [collection if isinstance(collection, str) else collection.name
+            for collection in get_chroma_client(host, port).list_collections()]
+
+def _reset_clients():
+    # Connections are not shared with forked processes
+    global _clients, _clients_lock
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_clients)
+
+# Async clients are bound to their event loop: event loop -> (host, port) -> client
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+async def get_async_chroma_client(host, port):
+    """Get the async client of a Chroma server for the running event loop"""
+    loop = asyncio.get_running_loop()
+    loop_clients = _async_clients.setdefault(loop, {})
+    client = loop_clients.get((host, port))
+    if client is None:
+        client = await chromadb.AsyncHttpClient(host=host, port=port)
+        client = loop_clients.setdefault((host, port), client)
+    return client
 
 class ChromaDBHandler(VectorStore):
-    def __init__(self, host, port, collection_name):
-        self.client = chromadb.HttpClient(host=host, port=port)
-        self.collection = self.client.get_or_create_collection(name=collection_name)
-        print(f"Initialized ChromaDBHandler for collection: {collection_name}")
+    """
+    Chroma collection over the shared HTTP client
+
+    Nothing is requested before the first use, so importing the stores does not need the server.
+    """
+    def __init__(self, host, port, collection_name, embedding_provider: EmbeddingProvider = None):
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        # Documents are embedded by the provider (batched and cached) and sent with their embeddings
+        self._embedding_provider = embedding_provider
+        self._collection = None
+        self._collection_lock = threading.Lock()
+
+    @property
+    def client(self) -> chromadb.ClientAPI:
+        return get_chroma_client(self.host, self.port)
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._collection_lock:
+                if self._collection is None:
+                    self._collection = self.client.get_or_create_collection(name=self.collection_name, embedding_function=None)
+                    print(f"Initialized ChromaDBHandler for collection: {self.collection_name}")
+        return self._collection
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embedding_provider or get_embedding_provider()
+
+    def warmup(self):
+        self.collection
     
     def add_document(self, document, metadata, doc_id):
-        self.collection.upsert(
-            documents=[document],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
+        self.add_documents([document], [metadata], [doc_id])
+    
+    def add_documents(self, documents, metadatas, doc_ids):
+        embeddings = self.embed_texts(documents)
+        # Upsert in as few requests as the server accepts
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(doc_ids), batch_size):
+            self.collection.upsert(
+                documents=documents[start:start + batch_size],
+                embeddings=embeddings[start:start + batch_size],
+                metadatas=metadatas[start:start + batch_size],
+                ids=doc_ids[start:start + batch_size]
+            )
     
     def query_documents(self, query_text, n_results=1, where=None):
+        return self.query_embeddings(self.embed_texts([query_text]), n_results, where)
+
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        # Searched in a single request
+        return self.query_embeddings(self.embed_texts(query_texts), n_results, where)
+
+    def embed_texts(self, texts):
+        return self.embedding_provider.embed(list(texts))
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
         return self.collection.query(
-            query_texts=[query_text],
+            query_embeddings=list(query_embeddings),
             n_results=n_results,
             where=where
         )
@@ -24,5 +115,84 @@ class ChromaDBHandler(VectorStore):
     def delete_documents(self, where):
         self.collection.delete(where=where)
 
+    def get_metadatas(self, where, page_size=5000):
+        metadatas = {}
+        offset = 0
+        while True:
+            page = self.collection.get(where=where, include=["metadatas"], limit=page_size, offset=offset)
+            metadatas.update(zip(page["ids"], page["metadatas"]))
+            if len(page["ids"]) < page_size:
+                return metadatas
+            offset += page_size
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(doc_ids), batch_size):
+            self.collection.delete(ids=doc_ids[start:start + batch_size], where=where)
+
+    def drop_collection(self):
+        with self._collection_lock:
+            self.client.delete_collection(self.collection_name)
+            self._collection = None
+
     def clear_collection(self):
-        self.collection.delete(ids=self.collection.get()["ids"])
\ No newline at end of file
+        self.collection.delete(ids=self.collection.get()["ids"])
+
+class AsyncChromaDBHandler(AsyncVectorStore):
+    """
+    Chroma store over the async HTTP client
+
+    The client's connection pool is bound to the event loop it was created on, so there is one
+    client per loop shared by the collections; loops are long-lived (see utils.event_loop).
+    """
+    def __init__(self, host, port, collection_name, embedding_provider: EmbeddingProvider = None):
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        self._embedding_provider = embedding_provider
+        self._collections: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embedding_provider or get_embedding_provider()
+
+    async def _get_collection(self):
+        """Shared client and collection of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client_collection = self._collections.get(loop)
+        if client_collection is None:
+            client = await get_async_chroma_client(self.host, self.port)
+            collection = await client.get_or_create_collection(name=self.collection_name, embedding_function=None)
+            client_collection = self._collections.setdefault(loop, (client, collection))
+        return client_collection
+
+    async def add_documents(self, documents, metadatas, doc_ids):
+        embeddings = await self.embed_texts(documents)
+        client, collection = await self._get_collection()
+        batch_size = await client.get_max_batch_size()
+        for start in range(0, len(doc_ids), batch_size):
+            await collection.upsert(
+                documents=documents[start:start + batch_size],
+                embeddings=embeddings[start:start + batch_size],
+                metadatas=metadatas[start:start + batch_size],
+                ids=doc_ids[start:start + batch_size]
+            )
+
+    async def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return await self.query_embeddings(await self.embed_texts(query_texts), n_results, where)
+
+    async def embed_texts(self, texts):
+        # Mostly served by the embedding cache, the model runs in the thread pool on a miss
+        return await asyncio.to_thread(self.embedding_provider.embed, list(texts))
+
+    async def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        _, collection = await self._get_collection()
+        return await collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=n_results,
+            where=where
+        )
+
+    async def delete_documents(self, where):
+        _, collection = await self._get_collection()
+        await collection.delete(where=where)
@@ -0,0 +1,427 @@
+import base64
+import fcntl
+import json
+import os
+import threading
+import numpy as np
+from vectors.embedding import EmbeddingProvider, get_embedding_provider
+from vectors.vector_store import VectorStore
+
+def list_numpy_collections(data_dir) -> list[str]:
+    """Names of the collections persisted in a data directory"""
+    if not os.path.isdir(data_dir):
+        return []
+    return [name[:-len('.json')] for name in os.listdir(data_dir) if name.endswith('.json') and not name.endswith('.tmp.json')]
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store
+
+    Embeddings of a collection are kept in a NumPy matrix and searched with exact squared L2
+    distance (the Chroma default), metadata filters are evaluated on per-field arrays.
+    The collection is persisted to local files as a snapshot plus an append-only log of the
+    writes, so a write costs the size of the batch, not of the collection. The log is compacted
+    into a new snapshot once it holds more rows than the collection. Processes sharing the
+    directory serialize their writes with a file lock and replay what other processes appended.
+    """
+    # The log is compacted when it holds more rows than this and than the collection
+    COMPACT_MIN_ROWS = 10000
+
+    def __init__(self, collection_name, data_dir, embedding_provider: EmbeddingProvider = None):
+        self._embedding_provider = embedding_provider
+        self.collection_name = collection_name
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.embeddings_path = os.path.join(data_dir, f"{collection_name}.npy")
+        self.records_path = os.path.join(data_dir, f"{collection_name}.json")
+        self.lock_path = os.path.join(data_dir, f"{collection_name}.lock")
+        self._lock = threading.RLock()
+        # Loaded on first use
+        self._reset()
+        self._unload()
+
+    def _reset(self):
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.metadatas: list[dict] = []
+        # Rows are appended into buffers with spare capacity, embeddings and squared norms are views of the used rows
+        self._embedding_buffer = np.zeros((0, 0), dtype=np.float32)
+        self._norm_buffer = np.zeros(0, dtype=np.float32)
+        self.embeddings = self._embedding_buffer
+        self._squared_norms = self._norm_buffer
+        self._row_by_id: dict[str, int] = {}
+        # field -> values of the field for every row, built on demand for filtering
+        self._fields: dict[str, np.ndarray] = {}
+
+    def _unload(self):
+        """Forget which files are loaded, the next read reloads the collection"""
+        # (inode, mtime) of the loaded snapshot, None if there was none
+        self._snapshot_key = None
+        self._generation = 0
+        # (inode, bytes replayed) of the log of the snapshot
+        self._log_state = (None, 0)
+        # Rows written to the log since the snapshot
+        self._log_rows = 0
+        self._loaded = False
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embedding_provider or get_embedding_provider()
+
+    def warmup(self):
+        with self._lock:
+            self._reload_if_changed()
+        print(f"Loaded NumpyVectorStore for collection: {self.collection_name} ({len(self.ids)} documents)")
+
+    # Persistence
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.data_dir, f"{self.collection_name}.{generation}.log")
+
+    def _snapshot_stat(self):
+        try:
+            stat = os.stat(self.records_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _log_stat(self):
+        try:
+            stat = os.stat(self._log_path(self._generation))
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def _is_changed(self) -> bool:
+        return not self._loaded or self._snapshot_stat() != self._snapshot_key or self._log_stat() != self._log_state
+
+    def _reload_if_changed(self, locked: bool = False):
+        """Load what was written since the last load (by any process)"""
+        if not self._is_changed():
+            return
+        if locked:
+            self._reload()
+            return
+        # Compactions replace two files, read them under a shared lock
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                self._reload()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        snapshot_key = self._snapshot_stat()
+        if not self._loaded or snapshot_key != self._snapshot_key:
+            self._load_snapshot(snapshot_key)
+        log_inode, log_size = self._log_stat()
+        replayed_inode, replayed_size = self._log_state
+        if (replayed_inode is not None and log_inode != replayed_inode) or log_size < replayed_size:
+            # The log was replaced (collection dropped and written again), start over
+            self._load_snapshot(snapshot_key)
+            replayed_size = 0
+        if log_size > replayed_size:
+            with open(self._log_path(self._generation), 'rb') as f:
+                f.seek(replayed_size)
+                data = f.read(log_size - replayed_size)
+            # An incomplete last line is being written (or was left by a crashed writer), it is replayed later
+            complete_size = data.rfind(b'\n') + 1
+            for line in data[:complete_size].splitlines():
+                self._log_rows += self._apply(json.loads(line))
+            replayed_size += complete_size
+        self._log_state = (log_inode, replayed_size)
+        self._loaded = True
+
+    def _load_snapshot(self, snapshot_key):
+        self._reset()
+        self._unload()
+        if snapshot_key is not None:
+            with open(self.records_path, encoding='utf-8') as f:
+                records = json.load(f)
+            embeddings = np.load(self.embeddings_path)
+            self.ids = records['ids']
+            self.documents = records['documents']
+            self.metadatas = records['metadatas']
+            self._generation = records.get('log_generation', 0)
+            self._set_rows(embeddings)
+            self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._snapshot_key = snapshot_key
+        self._loaded = True
+
+    def _set_rows(self, embeddings: np.ndarray):
+        """Replace the embedding rows"""
+        self._embedding_buffer = embeddings
+        self._norm_buffer = np.einsum('ij,ij->i', embeddings, embeddings) if len(embeddings) else np.zeros(0, dtype=np.float32)
+        self.embeddings = self._embedding_buffer
+        self._squared_norms = self._norm_buffer
+
+    def _append_rows(self, embeddings: np.ndarray):
+        """Append embedding rows, growing the buffers geometrically so appends are amortized"""
+        row_count = len(self.embeddings)
+        needed = row_count + len(embeddings)
+        if self.embeddings.shape[1] != embeddings.shape[1] and row_count == 0:
+            # First rows of an empty collection, the dimension comes from the embeddings
+            self._embedding_buffer = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self._norm_buffer = np.zeros(0, dtype=np.float32)
+            self.embeddings = self._embedding_buffer
+            self._squared_norms = self._norm_buffer
+        if needed > len(self._embedding_buffer):
+            capacity = max(needed, 2 * len(self._embedding_buffer))
+            embedding_buffer = np.zeros((capacity, embeddings.shape[1]), dtype=np.float32)
+            embedding_buffer[:row_count] = self.embeddings
+            norm_buffer = np.zeros(capacity, dtype=np.float32)
+            norm_buffer[:row_count] = self._squared_norms
+            self._embedding_buffer = embedding_buffer
+            self._norm_buffer = norm_buffer
+        self._embedding_buffer[row_count:needed] = embeddings
+        self._norm_buffer[row_count:needed] = np.einsum('ij,ij->i', embeddings, embeddings)
+        self.embeddings = self._embedding_buffer[:needed]
+        self._squared_norms = self._norm_buffer[:needed]
+
+    def _apply(self, entry: dict) -> int:
+        """
+        Apply a log entry to the loaded collection
+
+        Returns:
+            int: Number of rows of the entry
+        """
+        self._fields = {}
+        if entry['op'] == 'upsert':
+            doc_ids = entry['ids']
+            embeddings = np.frombuffer(base64.b64decode(entry['embeddings']), dtype=np.float32).reshape(len(doc_ids), -1)
+            # The last occurrence of an ID wins
+            last_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            appended = []
+            for doc_id, i in last_index.items():
+                row = self._row_by_id.get(doc_id)
+                if row is None:
+                    self._row_by_id[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+                    self.documents.append(entry['documents'][i])
+                    self.metadatas.append(entry['metadatas'][i])
+                    appended.append(i)
+                else:
+                    self.documents[row] = entry['documents'][i]
+                    self.metadatas[row] = entry['metadatas'][i]
+                    self.embeddings[row] = embeddings[i]
+                    self._squared_norms[row] = embeddings[i] @ embeddings[i]
+            if appended:
+                self._append_rows(embeddings[appended])
+            return len(doc_ids)
+        if entry['op'] == 'delete':
+            deleted_ids = set(entry['ids'])
+            kept_rows = np.array([row for row, doc_id in enumerate(self.ids) if doc_id not in deleted_ids], dtype=np.int64)
+            row_count = len(self.ids)
+            self.ids = [self.ids[row] for row in kept_rows]
+            self.documents = [self.documents[row] for row in kept_rows]
+            self.metadatas = [self.metadatas[row] for row in kept_rows]
+            self._set_rows(self.embeddings[kept_rows] if row_count else self.embeddings)
+            self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            return len(deleted_ids)
+        if entry['op'] == 'clear':
+            row_count = len(self.ids)
+            self._reset()
+            return row_count
+        raise ValueError(f"Unknown log entry: {entry['op']}")
+
+    def _compact(self):
+        """Write the loaded collection as a new snapshot and start a new log, the records file is written last"""
+        generation = self._generation + 1
+        embeddings_tmp = f"{self.embeddings_path}.tmp.npy"
+        records_tmp = f"{self.records_path}.tmp"
+        np.save(embeddings_tmp, self.embeddings)
+        with open(records_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'ids': self.ids, 'documents': self.documents, 'metadatas': self.metadatas,
+                       'log_generation': generation}, f, ensure_ascii=False)
+        os.replace(embeddings_tmp, self.embeddings_path)
+        os.replace(records_tmp, self.records_path)
+        previous_log_path = self._log_path(self._generation)
+        if os.path.exists(previous_log_path):
+            os.remove(previous_log_path)
+        self._generation = generation
+        self._snapshot_key = self._snapshot_stat()
+        self._log_state = self._log_stat()
+        self._log_rows = 0
+
+    def _write(self, make_entry):
+        """
+        Log the entry returned by make_entry() (built on the latest version of the collection) and apply it
+
+        make_entry returns (entry, number of rows), or None if there is nothing to write.
+        """
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed(locked=True)
+                if self._log_stat()[1] > self._log_state[1]:
+                    # Incomplete line of a crashed writer
+                    with open(self._log_path(self._generation), 'r+b') as f:
+                        f.truncate(self._log_state[1])
+                made = make_entry()
+                if made is None:
+                    return
+                entry, row_count = made
+                compact = self._snapshot_key is None or self._log_rows + row_count > max(len(self.ids), self.COMPACT_MIN_ROWS)
+                if not compact:
+                    line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+                    with open(self._log_path(self._generation), 'ab') as f:
+                        f.write(line)
+                self._log_rows += self._apply(entry)
+                if compact:
+                    self._compact()
+                else:
+                    self._log_state = (self._log_stat()[0], self._log_state[1] + len(line))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Filtering
+
+    def _field(self, name: str) -> np.ndarray:
+        values = self._fields.get(name)
+        if values is None:
+            values = np.empty(len(self.metadatas), dtype=object)
+            values[:] = [metadata.get(name) for metadata in self.metadatas]
+            self._fields[name] = values
+        return values
+
+    def _match(self, where) -> np.ndarray:
+        """Boolean mask of the rows matching a Chroma where filter"""
+        if not where:
+            return np.ones(len(self.ids), dtype=bool)
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == '$and':
+                for sub_where in condition:
+                    mask &= self._match(sub_where)
+            elif key == '$or':
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for sub_where in condition:
+                    any_mask |= self._match(sub_where)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    mask &= self._compare(self._field(key), operator, value)
+            else:
+                mask &= self._compare(self._field(key), '$eq', condition)
+        return mask
+
+    @staticmethod
+    def _compare(values: np.ndarray, operator: str, value) -> np.ndarray:
+        if operator == '$eq':
+            return values == value
+        if operator == '$ne':
+            return values != value
+        if operator == '$in':
+            return np.isin(values, list(value))
+        if operator == '$nin':
+            return ~np.isin(values, list(value))
+        present = values != None
+        compared = np.zeros(len(values), dtype=bool)
+        if operator == '$gt':
+            compared[present] = values[present] > value
+        elif operator == '$gte':
+            compared[present] = values[present] >= value
+        elif operator == '$lt':
+            compared[present] = values[present] < value
+        elif operator == '$lte':
+            compared[present] = values[present] <= value
+        else:
+            raise ValueError(f"Unsupported where operator: {operator}")
+        return compared
+
+    # VectorStore
+
+    def embed_texts(self, texts):
+        return self.embedding_provider.embed(list(texts))
+
+    def add_document(self, document, metadata, doc_id):
+        self.add_documents([document], [metadata], [doc_id])
+
+    def add_documents(self, documents, metadatas, doc_ids):
+        if not doc_ids:
+            return
+        self.add_embeddings(self.embed_texts(documents), documents, metadatas, doc_ids)
+
+    def add_embeddings(self, embeddings, documents, metadatas, doc_ids):
+        """Upsert documents with precomputed embeddings"""
+        new_embeddings = np.asarray(embeddings, dtype=np.float32)
+        entry = {
+            'op': 'upsert',
+            'ids': list(doc_ids),
+            'documents': list(documents),
+            'metadatas': list(metadatas),
+            'embeddings': base64.b64encode(new_embeddings.tobytes()).decode('ascii')
+        }
+        self._write(lambda: (entry, len(entry['ids'])))
+
+    def query_documents(self, query_text, n_results=1, where=None):
+        return self.query_documents_batch([query_text], n_results, where)
+
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return self.query_embeddings(self.embed_texts(query_texts), n_results, where)
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        with self._lock:
+            self._reload_if_changed()
+            rows = np.flatnonzero(self._match(where))
+            n = min(n_results, len(rows))
+            if n > 0:
+                # Squared L2 distance: |e|^2 - 2 e.q + |q|^2
+                distances = self._squared_norms[rows][None, :] - 2 * (queries @ self.embeddings[rows].T) \
+                    + np.einsum('ij,ij->i', queries, queries)[:, None]
+            for i in range(len(queries)):
+                if n == 0:
+                    top_rows, top_distances = [], []
+                else:
+                    top = np.argpartition(distances[i], n - 1)[:n]
+                    top = top[np.argsort(distances[i][top])]
+                    top_rows = rows[top]
+                    top_distances = distances[i][top]
+                results['ids'].append([self.ids[row] for row in top_rows])
+                results['documents'].append([self.documents[row] for row in top_rows])
+                results['metadatas'].append([self.metadatas[row] for row in top_rows])
+                results['distances'].append([float(distance) for distance in top_distances])
+        return results
+
+    def delete_documents(self, where):
+        self._delete_rows(lambda: self._match(where))
+
+    def _delete_rows(self, get_mask):
+        """Delete the rows of the boolean mask returned by get_mask() (evaluated on the latest version)"""
+        def make_entry():
+            deleted_ids = [self.ids[row] for row in np.flatnonzero(get_mask())]
+            if not deleted_ids:
+                return None
+            return {'op': 'delete', 'ids': deleted_ids}, len(deleted_ids)
+
+        self._write(make_entry)
+
+    def get_metadatas(self, where):
+        with self._lock:
+            self._reload_if_changed()
+            return {self.ids[row]: self.metadatas[row] for row in np.flatnonzero(self._match(where))}
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        doc_ids = set(doc_ids)
+        self._delete_rows(lambda: np.array([doc_id in doc_ids for doc_id in self.ids], dtype=bool) & self._match(where))
+
+    def drop_collection(self):
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                log_prefix = f"{self.collection_name}."
+                for name in os.listdir(self.data_dir):
+                    if name.startswith(log_prefix) and name.endswith('.log') and name[len(log_prefix):-len('.log')].isdigit():
+                        os.remove(os.path.join(self.data_dir, name))
+                for path in (self.records_path, self.embeddings_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._reset()
+                self._unload()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def clear_collection(self):
+        self._write(lambda: ({'op': 'clear'}, len(self.ids)) if self.ids else None)
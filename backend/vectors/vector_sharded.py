@@ -0,0 +1,220 @@
+from typing import Callable
+import re
+import threading
+import time
+from vectors.embedding import get_embedding_provider
+from vectors.vector_store import VectorStore
+
+class ShardedVectorStore(VectorStore):
+    """
+    A logical collection split into one physical collection per project (or per project and version)
+
+    Operations are routed by the project_id (and version) of the metadata or where filter, so a
+    query only searches the documents of its project. Deleting a whole project or version drops its
+    collections. Operations that cannot be routed (no project in the filter) go to every shard.
+    Queries use a listing of the collections cached for listing_ttl seconds, so projects without
+    documents don't list the collections on every query. Writes and deletes list them afresh.
+    """
+    def __init__(self, collection_name: str, by_version: bool,
+                 create_shard: Callable[[str], VectorStore], list_collections: Callable[[], list[str]],
+                 listing_ttl: float = 10):
+        self.collection_name = collection_name
+        self.by_version = by_version
+        self.create_shard = create_shard
+        self.list_collections = list_collections
+        self.listing_ttl = listing_ttl
+        self._shards: dict[str, VectorStore] = {}
+        self._listing: set[str] = set()
+        self._listing_expires_at = 0.0
+        self._lock = threading.Lock()
+        self._shard_pattern = re.compile(rf"^{re.escape(collection_name)}_p(\d+)(?:_v(\d+))?$")
+
+    def shard_name(self, project_id, version=None) -> str:
+        if self.by_version:
+            return f"{self.collection_name}_p{project_id}_v{version}"
+        return f"{self.collection_name}_p{project_id}"
+
+    def _shard(self, shard_name: str) -> VectorStore:
+        with self._lock:
+            shard = self._shards.get(shard_name)
+            if shard is None:
+                shard = self.create_shard(shard_name)
+                self._shards[shard_name] = shard
+            return shard
+
+    def _collections(self, fresh: bool = False) -> set[str]:
+        """Names of the collections of the backend, cached unless fresh"""
+        with self._lock:
+            if not fresh and time.time() < self._listing_expires_at:
+                return self._listing
+        listing = set(self.list_collections())
+        with self._lock:
+            self._listing = listing
+            self._listing_expires_at = time.time() + self.listing_ttl
+        return listing
+
+    def _forget(self, shard_name: str):
+        """Drop a shard from the known shards and the cached listing"""
+        with self._lock:
+            self._shards.pop(shard_name, None)
+            self._listing = self._listing - {shard_name}
+
+    def _existing_shards(self, project_id=None, versions: Callable[[int], bool] = None, fresh: bool = True) -> list[str]:
+        """Names of the existing shards, optionally of one project and of the versions accepted by versions(version)"""
+        shard_names = []
+        for name in self._collections(fresh):
+            match = self._shard_pattern.match(name)
+            if not match:
+                continue
+            if project_id is not None and int(match.group(1)) != int(project_id):
+                continue
+            if versions is not None and (match.group(2) is None or not versions(int(match.group(2)))):
+                continue
+            shard_names.append(name)
+        return shard_names
+
+    def _route(self, where, fresh: bool = True) -> tuple[list[str], bool]:
+        """
+        Shards a where filter can match, and whether it matches whole shards
+
+        Returns:
+            tuple[list[str], bool]: Shard names, True if the filter only restricts project and version
+        """
+        project_id, version_conditions, other_conditions = parse_shard_where(where)
+        if project_id is None:
+            return self._existing_shards(fresh=fresh), False
+        if not self.by_version:
+            return [self.shard_name(project_id)], not other_conditions and not version_conditions
+        if '$eq' in version_conditions:
+            return [self.shard_name(project_id, version_conditions['$eq'])], not other_conditions
+        def accept(version):
+            return all(compare_version(version, operator, value) for operator, value in version_conditions.items())
+        return self._existing_shards(project_id, accept, fresh), not other_conditions
+
+    def add_document(self, document, metadata, doc_id):
+        self.add_documents([document], [metadata], [doc_id])
+
+    def add_documents(self, documents, metadatas, doc_ids):
+        groups: dict[str, tuple[list, list, list]] = {}
+        for document, metadata, doc_id in zip(documents, metadatas, doc_ids):
+            shard_name = self.shard_name(metadata['project_id'], metadata.get('version'))
+            group = groups.setdefault(shard_name, ([], [], []))
+            group[0].append(document)
+            group[1].append(metadata)
+            group[2].append(doc_id)
+        for shard_name, (shard_documents, shard_metadatas, shard_doc_ids) in groups.items():
+            self._shard(shard_name).add_documents(shard_documents, shard_metadatas, shard_doc_ids)
+
+    def query_documents(self, query_text, n_results=1, where=None):
+        return self.query_documents_batch([query_text], n_results, where)
+
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return self.query_embeddings(self.embed_texts(query_texts), n_results, where)
+
+    def embed_texts(self, texts):
+        return get_embedding_provider().embed(list(texts))
+
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        shard_names, _ = self._route(where, fresh=False)
+        existing = self._existing_or_known(shard_names, fresh=False)
+        results = [self._shard(shard_name).query_embeddings(query_embeddings, n_results, where)
+                   for shard_name in shard_names if shard_name in existing]
+        if len(results) == 1:
+            return results[0]
+        return merge_query_results(results, len(query_embeddings), n_results)
+
+    def _existing_or_known(self, shard_names: list[str], fresh: bool = True) -> set[str]:
+        """Shards that exist, so querying a project without documents does not create its collection"""
+        with self._lock:
+            known = set(self._shards)
+        if all(shard_name in known for shard_name in shard_names):
+            return known
+        return known | self._collections(fresh)
+
+    def delete_documents(self, where):
+        shard_names, whole_shards = self._route(where)
+        for shard_name in shard_names:
+            if whole_shards:
+                self._shard(shard_name).drop_collection()
+                self._forget(shard_name)
+            elif shard_name in self._existing_or_known([shard_name]):
+                self._shard(shard_name).delete_documents(where)
+
+    def get_metadatas(self, where):
+        metadatas = {}
+        shard_names, _ = self._route(where)
+        for shard_name in shard_names:
+            if shard_name in self._existing_or_known([shard_name]):
+                metadatas.update(self._shard(shard_name).get_metadatas(where))
+        return metadatas
+
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        shard_names, _ = self._route(where)
+        for shard_name in shard_names:
+            if shard_name in self._existing_or_known([shard_name]):
+                self._shard(shard_name).delete_documents_by_ids(doc_ids, where)
+
+    def clear_collection(self):
+        for shard_name in self._existing_shards():
+            self._shard(shard_name).drop_collection()
+            self._forget(shard_name)
+        with self._lock:
+            self._shards.clear()
+
+    def drop_collection(self):
+        self.clear_collection()
+
+def parse_shard_where(where) -> tuple:
+    """
+    Split a where filter into its project, its version conditions and whether it has other conditions
+
+    Returns:
+        tuple: (project ID or None, {operator: version}, has other conditions)
+    """
+    project_id = None
+    version_conditions = {}
+    other_conditions = False
+    conditions = []
+    pending = [where or {}]
+    while pending:
+        condition = pending.pop()
+        for key, value in condition.items():
+            if key == '$and':
+                pending.extend(value)
+            else:
+                conditions.append((key, value))
+    for key, value in conditions:
+        if key == 'project_id' and (not isinstance(value, dict) or list(value) == ['$eq']):
+            project_id = value['$eq'] if isinstance(value, dict) else value
+        elif key == 'version' and (not isinstance(value, dict) or set(value) <= {'$eq', '$lt', '$lte', '$gt', '$gte'}):
+            version_conditions.update(value if isinstance(value, dict) else {'$eq': value})
+        else:
+            other_conditions = True
+    return project_id, version_conditions, other_conditions
+
+def compare_version(version: int, operator: str, value: int) -> bool:
+    if operator == '$eq':
+        return version == value
+    if operator == '$lt':
+        return version < value
+    if operator == '$lte':
+        return version <= value
+    if operator == '$gt':
+        return version > value
+    return version >= value
+
+def merge_query_results(results: list[dict], query_count: int, n_results: int) -> dict:
+    """Merge the query results of several shards, keeping the n_results nearest documents per query"""
+    merged = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+    for i in range(query_count):
+        rows = []
+        for result in results:
+            for j, doc_id in enumerate(result['ids'][i]):
+                rows.append((result['distances'][i][j], doc_id, result['documents'][i][j], result['metadatas'][i][j]))
+        rows.sort(key=lambda row: row[0])
+        rows = rows[:n_results]
+        merged['distances'].append([row[0] for row in rows])
+        merged['ids'].append([row[1] for row in rows])
+        merged['documents'].append([row[2] for row in rows])
+        merged['metadatas'].append([row[3] for row in rows])
+    return merged
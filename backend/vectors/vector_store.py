@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 class VectorStore(ABC):
@@ -8,17 +9,111 @@ class VectorStore(ABC):
         """Add document to vector storage"""
         pass
     
+    def add_documents(self, documents, metadatas, doc_ids):
+        """Add several documents to vector storage"""
+        for document, metadata, doc_id in zip(documents, metadatas, doc_ids):
+            self.add_document(document, metadata, doc_id)
+    
     @abstractmethod
     def query_documents(self, query_text, n_results=1):
         """Query documents"""
         pass
     
+    def query_documents_batch(self, query_texts, n_results=1, where=None):
+        """Query documents for several query texts, results are in the same format as query_documents with one row per query"""
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for query_text in query_texts:
+            result = self.query_documents(query_text, n_results, where)
+            for key in results:
+                results[key].append((result.get(key) or [[]])[0])
+        return results
+    
+    @abstractmethod
+    def embed_texts(self, texts):
+        """Embed texts with the embedding function of the store, returns one vector per text"""
+        pass
+    
+    @abstractmethod
+    def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        """Query documents by precomputed embeddings, results have one row per embedding"""
+        pass
+    
     @abstractmethod
     def delete_documents(self, where):
         """Delete documents"""
         pass
     
+    @abstractmethod
+    def get_metadatas(self, where):
+        """Metadata of the documents matching where, by document ID"""
+        pass
+    
+    @abstractmethod
+    def delete_documents_by_ids(self, doc_ids, where=None):
+        """Delete documents by ID, among the documents matching where if given"""
+        pass
+    
+    def drop_collection(self):
+        """Delete the collection itself"""
+        self.clear_collection()
+    
     @abstractmethod
     def clear_collection(self):
         """Clear collection"""
-        pass
\ No newline at end of file
+        pass
+    
+    def warmup(self):
+        """Open the connection or load the collection ahead of the first query"""
+        pass
+
+class AsyncVectorStore(ABC):
+    """Async variant of VectorStore, queries do not block the event loop"""
+    
+    @abstractmethod
+    async def add_documents(self, documents, metadatas, doc_ids):
+        """Add several documents to vector storage"""
+        pass
+    
+    async def query_documents(self, query_text, n_results=1, where=None):
+        """Query documents"""
+        return await self.query_documents_batch([query_text], n_results, where)
+    
+    @abstractmethod
+    async def query_documents_batch(self, query_texts, n_results=1, where=None):
+        """Query documents for several query texts, results have one row per query"""
+        pass
+    
+    @abstractmethod
+    async def embed_texts(self, texts):
+        """Embed texts with the embedding function of the store, returns one vector per text"""
+        pass
+    
+    @abstractmethod
+    async def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        """Query documents by precomputed embeddings, results have one row per embedding"""
+        pass
+    
+    @abstractmethod
+    async def delete_documents(self, where):
+        """Delete documents"""
+        pass
+
+class ThreadedAsyncVectorStore(AsyncVectorStore):
+    """Async interface over a synchronous store, for backends without an async client (calls run in the default thread pool)"""
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+    
+    async def add_documents(self, documents, metadatas, doc_ids):
+        await asyncio.to_thread(self.vector_store.add_documents, documents, metadatas, doc_ids)
+    
+    async def query_documents_batch(self, query_texts, n_results=1, where=None):
+        return await asyncio.to_thread(self.vector_store.query_documents_batch, query_texts, n_results, where)
+    
+    async def embed_texts(self, texts):
+        return await asyncio.to_thread(self.vector_store.embed_texts, texts)
+    
+    async def query_embeddings(self, query_embeddings, n_results=1, where=None):
+        return await asyncio.to_thread(self.vector_store.query_embeddings, query_embeddings, n_results, where)
+    
+    async def delete_documents(self, where):
+        await asyncio.to_thread(self.vector_store.delete_documents, where)
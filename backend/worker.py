@@ -0,0 +1,24 @@
+"""
+Standalone job worker
+
+Runs the job scheduler without serving HTTP. Jobs are claimed atomically from the job table,
+so any number of workers can run on several hosts against the same PostgreSQL database:
+
+    python worker.py
+"""
+import time
+start_time = time.time()
+from app import app
+from jobs import init_scheduler
+from vector_stores import registry
+
+if __name__ == "__main__":
+    with app.app_context():
+        init_scheduler(app, vector_jobs=False)
+    registry.start_warmup()
+    app.logger.info(f'Worker started in {int((time.time() - start_time) * 1000)}ms')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        app.logger.info('Worker stopped')
@@ -1,14 +1,21 @@
+import time
 from app import app
 from jobs import init_scheduler
 
 def on_post_fork(server, worker):
     """This runs in each worker process."""
     from database import db
+    from vector_stores import registry
+    start_time = time.time()
     
     with app.app_context():
         if hasattr(db, 'engine'):
             # 断开继承自主进程的数据库连接
             db.engine.dispose()
+    
+    # Vector stores connect in the background, the worker accepts requests right away
+    registry.start_warmup()
+    app.logger.info(f'Worker {worker.pid} ready in {int((time.time() - start_time) * 1000)}ms after fork')
 
 def on_when_ready(server):
     """This runs in the master process before spawning workers."""
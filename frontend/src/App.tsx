@@ -9,14 +9,17 @@ import { ProjectList } from '@/components/projects/ProjectList'
 import { I18nextProvider } from 'react-i18next';
 import i18n from './i18n/i18n'
 
+// Backend base path
+export const apiBasePath = 'http://localhost:8000'
+
 // Create API instance
 export const mainApi = new MainApi(new Configuration({
-  basePath: 'http://localhost:8000'
+  basePath: apiBasePath
 }))
 
 // Create project API instance
 export const projectApi = new ProjectApi(new Configuration({
-  basePath: 'http://localhost:8000'
+  basePath: apiBasePath
 }));
 
 // Custom theme configuration
@@ -1,4 +1,4 @@
-import { useEffect } from 'react'
+import { useEffect, useState } from 'react'
 import { useAppDispatch, useAppSelector } from '../store/hooks'
 import useTask from './useTask'
 import { useInterval } from 'ahooks'
@@ -6,6 +6,7 @@ import { setActiveTab, setSqlModified, setTaskModified, setQuestionModified, set
 import { useParams } from 'react-router-dom'
 import { setProjectId } from '@/store/slices/appSlice'
 import { getSelectedColumns } from '@/utils/bizUtil'
+import { apiBasePath } from '../App'
 
 const useAppService = () => {
     const dispatch = useAppDispatch()
@@ -112,10 +113,28 @@ const useAppService = () => {
         refreshSchema()
     }, [refreshSchema])
 
-    // Every 1 second, detect: if the job is currently init or running, refresh
+    // While the job is init or running, refresh the task on each job event pushed by the server
+    const jobActive = !!taskId && (currentJob?.job_status === 'init' || currentJob?.job_status === 'running')
+    const [jobEventsReceived, setJobEventsReceived] = useState(false)
+    useEffect(() => {
+        if (!jobActive) return
+        // The server refuses the stream when it cannot deliver events (sync workers, no PostgreSQL), EventSource then stays closed
+        const eventSource = new EventSource(`${apiBasePath}/main/task/${taskId}/job-events`)
+        eventSource.addEventListener('job', () => {
+            setJobEventsReceived(true)
+            refreshTask(taskId!)
+        })
+        eventSource.onerror = () => setJobEventsReceived(false)
+        return () => {
+            eventSource.close()
+            setJobEventsReceived(false)
+        }
+    }, [jobActive, taskId, refreshTask])
+
+    // Every 1 second, detect: if the job is currently init or running and no job event arrived yet, refresh
     useInterval(() => {
-        if (taskId && (currentJob?.job_status === 'init' || currentJob?.job_status === 'running')) {
-            refreshTask(taskId)
+        if (jobActive && !jobEventsReceived) {
+            refreshTask(taskId!)
         }
     }, 1000)
 }